@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_profile_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_upload',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
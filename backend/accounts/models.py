@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 import uuid
+from api.images import ImageStatus
 
 # Create your models here.
 
@@ -61,6 +62,8 @@ class Profile(models.Model):
     phone_number = models.CharField(max_length=30, blank=True)
     bio = models.TextField(blank=True)
     profile_picture = models.URLField(blank=True, null=True)
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY)  # api/images.py
+    image_upload = models.UUIDField(null=True, blank=True, editable=False)  # the upload whose result may land, api/images.py
 
     def __str__(self):
         return self.display_name or self.user.email
\ No newline at end of file
@@ -2,7 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from .models import CustomUser, Profile
 from restaurants.models import Restaurant
-import cloudinary.uploader
+from api.images import upload_later
 
 
 
@@ -18,22 +18,18 @@ class ProfileSerializer(serializers.ModelSerializer):
             "bio",
             "profile_picture",  # This field will display the Cloudinary URL
             "profile_picture_upload",
+            "image_status",  # "pending" until an upload finishes (api/images.py)
         ]
         
-        read_only_fields = ["id", "user", "profile_picture"]
+        read_only_fields = ["id", "user", "profile_picture", "image_status"]
     def create(self, validated_data):
         profile_picture_upload = validated_data.pop("profile_picture_upload", None)
         user = validated_data.pop("user")
         profile = Profile.objects.create(user=user, **validated_data)
         
         if profile_picture_upload:
-            upload = cloudinary.uploader.upload(
-                profile_picture_upload,
-                folder="aptech_python_onlineFood_delivery/profile_picture"
-            )
-            profile.profile_picture = upload.get("secure_url")  # cloudinary secure URL
-            profile.save()
-        return Profile
+            upload_later(profile, "profile_picture", profile_picture_upload, "aptech_python_onlineFood_delivery/profile_picture")
+        return profile
     
     def update(self, instance, validated_data):
         profile_picture_upload = validated_data.pop("profile_picture_upload", None)
@@ -41,14 +37,9 @@ class ProfileSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        if profile_picture_upload:
-            upload = cloudinary.uploader.upload(
-                profile_picture_upload,
-                folder="aptech_python_onlineFood_delivery/profile_picture"
-            )
-            instance.profile_picture  = upload.get("secure_url")
-
         instance.save()
+        if profile_picture_upload:
+            upload_later(instance, "profile_picture", profile_picture_upload, "aptech_python_onlineFood_delivery/profile_picture")
         return instance
 
 class UserSerializer(serializers.ModelSerializer):
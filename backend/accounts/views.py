@@ -3,10 +3,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from dj_rest_auth.utils import jwt_encode
 from dj_rest_auth.views import LoginView
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from restaurants.models import Restaurant
 from rest_framework.authtoken.models import Token
 from accounts.models import CustomUser, Profile
+from orders.cart_store import CartBusy, merge_anonymous_cart
 from restaurants.serializers import RestaurantSerializer
 from .serializers import ProfileSerializer
 
@@ -94,6 +96,16 @@ class LoginView(LoginView):
                 samesite="Lax",
                 max_age=86400
             )
+
+        # fold the guest cart built before logging in into the user's cart
+        cart_token = self.request.headers.get("X-Cart-Token") or self.request.COOKIES.get(settings.CART_TOKEN_COOKIE)
+        if cart_token:
+            try:
+                merge_anonymous_cart(self.user, cart_token)
+            except CartBusy:
+                pass  # the guest cart stays put and is merged on the next login
+            else:
+                response.delete_cookie(settings.CART_TOKEN_COOKIE)
         return response;
     
 
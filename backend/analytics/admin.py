@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import RestaurantDailySales, DishDailySales
+
+
+@admin.register(RestaurantDailySales)
+class RestaurantDailySalesAdmin(admin.ModelAdmin):
+    list_display = ("restaurant", "date", "order_count", "revenue")
+    list_filter = ("restaurant",)
+    date_hierarchy = "date"
+
+
+@admin.register(DishDailySales)
+class DishDailySalesAdmin(admin.ModelAdmin):
+    list_display = ("dish", "restaurant", "date", "units", "revenue")
+    list_filter = ("restaurant",)
+    date_hierarchy = "date"
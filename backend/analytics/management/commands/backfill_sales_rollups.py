@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+from orders.models import ArchivedOrder, Order
+from analytics.services import rebuild_range
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from order history, a few days per transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat, help="first day (default: first order, archived ones included)")
+        parser.add_argument("--end", type=date.fromisoformat, help="last day, inclusive (default: today)")
+        parser.add_argument("--chunk-days", type=int, default=7)
+
+    def handle(self, *args, **options):
+        start = options["start"]
+        if start is None:
+            firsts = [model.objects.aggregate(first=Min("created_at"))["first"] for model in (Order, ArchivedOrder)]
+            first = min(filter(None, firsts), default=None)
+            if first is None:
+                self.stdout.write("No orders yet.")
+                return
+            start = timezone.localdate(first)
+        end = (options["end"] or timezone.localdate()) + timedelta(days=1)
+
+        chunk = timedelta(days=max(1, options["chunk_days"]))
+        day = start
+        while day < end:
+            until = min(day + chunk, end)
+            rebuild_range(day, until)
+            self.stdout.write(f"Rebuilt {day} .. {until - timedelta(days=1)}")
+            day = until
+        self.stdout.write(self.style.SUCCESS("Sales rollups backfilled."))
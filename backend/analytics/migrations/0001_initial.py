@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 10:26
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('restaurants', '0002_alter_dish_dish_image_alter_menu_menu_image_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishDailySales',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='restaurants.dish')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dish_daily_sales', to='restaurants.restaurant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['restaurant', 'date'], name='dish_sales_restaurant_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dish', 'date'), name='uniq_dish_daily_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantDailySales',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='restaurants.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'date'), name='uniq_restaurant_daily_sales')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import models
+from restaurants.models import Restaurant, Dish
+import uuid
+
+# Create your models here.
+# Rollups of orders in a revenue status (see analytics.services.REVENUE_STATUSES),
+# bucketed by the day the order was placed. Owner reports read only these tables.
+
+
+class RestaurantDailySales(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="daily_sales")
+    date = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # also the index behind "revenue for restaurant X between two dates"
+            models.UniqueConstraint(fields=["restaurant", "date"], name="uniq_restaurant_daily_sales"),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.date}: {self.revenue}"
+
+
+class DishDailySales(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="dish_daily_sales")
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name="daily_sales")
+    date = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dish", "date"], name="uniq_dish_daily_sales"),
+        ]
+        indexes = [
+            # top dishes: WHERE restaurant = ? AND date BETWEEN ? AND ?
+            models.Index(fields=["restaurant", "date"], name="dish_sales_restaurant_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.dish_id} {self.date}: {self.units}"
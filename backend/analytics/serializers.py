@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework import serializers
+
+
+class ReportRangeSerializer(serializers.Serializer):
+    """Query params shared by the owner reports; defaults to the last 30 days."""
+    MAX_DAYS = 366 * 2
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    interval = serializers.ChoiceField(choices=["day", "week", "month"], default="day")
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate(self, data):
+        data.setdefault("end", timezone.localdate())
+        data.setdefault("start", data["end"] - timedelta(days=29))
+        if data["start"] > data["end"]:
+            raise serializers.ValidationError("start must be on or before end.")
+        if (data["end"] - data["start"]).days > self.MAX_DAYS:
+            raise serializers.ValidationError(f"Ranges are limited to {self.MAX_DAYS} days.")
+        return data
@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from orders.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from restaurants.models import Dish
+from .models import RestaurantDailySales, DishDailySales
+
+# An order counts as a sale while it is in one of these statuses: it is added
+# to the rollups when it first reaches one of them and taken back out if it is
+# cancelled afterwards.
+REVENUE_STATUSES = {Order.Status.PAID, Order.Status.PREPARING, Order.Status.DELIVERED}
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+INTERVALS = {"week": TruncWeek, "month": TruncMonth}
+ROLLUP_LOCK = 7_420_011  # advisory lock key shared by rebuild_range() and apply_status_changes()
+
+
+def _lock_rollups(shared):
+    """
+    Hold the rollup lock until the transaction ends: shared while folding status
+    changes in, exclusive while rebuild_range() reads and rewrites a range.
+    PostgreSQL only; SQLite lets one transaction write at a time, and
+    rebuild_range() writes before it reads.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT pg_advisory_xact_lock{'_shared' if shared else ''}(%s)", [ROLLUP_LOCK])
+
+
+def _bump(model, deltas):
+    """Add `deltas` ({key fields: {counter: amount}}) onto rollup rows, creating missing rows first."""
+    model.objects.bulk_create([model(**dict(key)) for key in deltas], ignore_conflicts=True)
+    for key, values in deltas.items():
+        model.objects.filter(**dict(key)).update(**{field: F(field) + amount for field, amount in values.items()})
+
+
+def apply_status_changes(changes):
+    """
+    Fold order status changes into the rollups. `changes` is a list of
+    (order_id, old_status, new_status); runs inside the caller's transaction.
+    """
+    signs = defaultdict(int)
+    for pk, old_status, new_status in changes:
+        signs[pk] += (new_status in REVENUE_STATUSES) - (old_status in REVENUE_STATUSES)
+    signs = {pk: sign for pk, sign in signs.items() if sign}
+    if not signs:
+        return
+
+    daily = defaultdict(lambda: defaultdict(Decimal))
+    for pk, restaurant_id, day, total in (
+        Order.objects.filter(id__in=signs).annotate(day=TruncDate("created_at"))
+        .values_list("id", "restaurant_id", "day", "total_amount")
+    ):
+        key = (("restaurant_id", restaurant_id), ("date", day))
+        daily[key]["order_count"] += signs[pk]
+        daily[key]["revenue"] += signs[pk] * total
+
+    per_dish = defaultdict(lambda: defaultdict(Decimal))
+    for pk, restaurant_id, dish_id, day, quantity, price in (
+        OrderItem.objects.filter(order_id__in=signs).annotate(day=TruncDate("order__created_at"))
+        .values_list("order_id", "order__restaurant_id", "dish_id", "day", "quantity", "price")
+    ):
+        key = (("restaurant_id", restaurant_id), ("dish_id", dish_id), ("date", day))
+        per_dish[key]["units"] += signs[pk] * quantity
+        per_dish[key]["revenue"] += signs[pk] * quantity * price
+
+    with transaction.atomic():
+        _lock_rollups(shared=True)
+        _bump(RestaurantDailySales, daily)
+        _bump(DishDailySales, per_dish)
+
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return datetime.combine(start, time.min, tzinfo=tz), datetime.combine(end, time.min, tzinfo=tz)
+
+
+def rebuild_range(start, end):
+    """
+    Recompute the rollups for days in [start, end) from the order tables and
+    the archive tables (archive_orders moves old delivered orders there), with
+    two GROUP BYs per source. Reads and writes share one transaction under the
+    rollup lock, so a status change committing meanwhile is either read here or
+    bumped onto the rebuilt rows afterwards, never lost.
+    """
+    since, until = _day_bounds(start, end)
+    with transaction.atomic():
+        _lock_rollups(shared=False)
+        RestaurantDailySales.objects.filter(date__gte=start, date__lt=end).delete()
+        DishDailySales.objects.filter(date__gte=start, date__lt=end).delete()
+        daily, per_dish = _sales(since, until)
+        RestaurantDailySales.objects.bulk_create(
+            [RestaurantDailySales(**dict(key), **values) for key, values in daily.items()], batch_size=1000
+        )
+        DishDailySales.objects.bulk_create(
+            [DishDailySales(**dict(key), **values) for key, values in per_dish.items()], batch_size=1000
+        )
+
+
+def _sales(since, until):
+    """Rollup values ({key fields: {counter: amount}}) for orders created in [since, until), live and archived."""
+    live = Order.objects.filter(status__in=REVENUE_STATUSES, created_at__gte=since, created_at__lt=until)
+    archived = ArchivedOrder.objects.filter(status__in=REVENUE_STATUSES, created_at__gte=since, created_at__lt=until)
+
+    daily = defaultdict(lambda: defaultdict(Decimal))
+    for orders in (live, archived):
+        for row in (
+            orders.annotate(day=TruncDate("created_at")).order_by()
+            .values("restaurant_id", "day").annotate(order_count=Count("id"), revenue=Sum("total_amount"))
+        ):
+            key = (("restaurant_id", row["restaurant_id"]), ("date", row["day"]))
+            daily[key]["order_count"] += row["order_count"]
+            daily[key]["revenue"] += row["revenue"]
+
+    per_dish = defaultdict(lambda: defaultdict(Decimal))
+    for items in (
+        OrderItem.objects.filter(order__in=live),
+        # archived items keep the ids of dishes that may be gone since; their rollups went with them
+        ArchivedOrderItem.objects.filter(order__in=archived, dish_id__in=Dish.objects.values("id")),
+    ):
+        for row in (
+            items.annotate(day=TruncDate("order__created_at")).order_by()
+            .values("order__restaurant_id", "dish_id", "day")
+            .annotate(units=Sum("quantity"), revenue=Sum(F("price") * F("quantity"), output_field=MONEY))
+        ):
+            key = (("restaurant_id", row["order__restaurant_id"]), ("dish_id", row["dish_id"]), ("date", row["day"]))
+            per_dish[key]["units"] += row["units"]
+            per_dish[key]["revenue"] += row["revenue"]
+    return daily, per_dish
+
+
+def revenue_series(restaurant_id, start, end, interval="day"):
+    """
+    Revenue and order counts per day/week/month for [start, end] (inclusive),
+    read from RestaurantDailySales only. Longer intervals are summed by the
+    database in the same query instead of row by row in Python.
+    """
+    rows = RestaurantDailySales.objects.filter(restaurant_id=restaurant_id, date__gte=start, date__lte=end)
+    if interval in INTERVALS:
+        series = list(
+            rows.annotate(period=INTERVALS[interval]("date")).order_by().values("period")
+            .annotate(order_count=Sum("order_count"), revenue=Sum("revenue")).order_by("period")
+        )
+        return [{"period": row["period"], "order_count": row["order_count"], "revenue": row["revenue"]} for row in series]
+
+    by_day = {day: (count, revenue) for day, count, revenue in rows.values_list("date", "order_count", "revenue")}
+    series, day = [], start
+    while day <= end:  # days without sales still show up, as zeros
+        count, revenue = by_day.get(day, (0, Decimal("0.00")))
+        series.append({"period": day, "order_count": count, "revenue": revenue})
+        day += timedelta(days=1)
+    return series
+
+
+def top_dishes(restaurant_id, start, end, limit=10):
+    return list(
+        DishDailySales.objects.filter(restaurant_id=restaurant_id, date__gte=start, date__lte=end)
+        .order_by().values("dish_id", "dish__name")
+        .annotate(units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-revenue", "-units")[:limit]
+    )
@@ -0,0 +1,8 @@
+from django.dispatch import receiver
+from orders.signals import order_status_changed
+from .services import apply_status_changes
+
+
+@receiver(order_status_changed)
+def update_sales_rollups(sender, changes, **kwargs):
+    apply_status_changes(changes)
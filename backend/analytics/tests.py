@@ -0,0 +1,91 @@
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import CustomUser
+from orders.archive import archive_orders
+from orders.models import Order
+from orders.services import create_order, transition_orders
+from restaurants.models import Restaurant, Dish, FoodType
+from .models import RestaurantDailySales, DishDailySales
+from .services import rebuild_range, revenue_series
+
+# Create your tests here.
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user(email="owner@example.com", role=CustomUser.Role.RESTAURANT_OWNER)
+        self.customer = CustomUser.objects.create_user(email="customer@example.com")
+        self.restaurant = Restaurant.objects.create(owner=owner, name="Bukka")
+        food_type = FoodType.objects.create(name="Non-Vegetarian")
+        self.rice = Dish.objects.create(restaurant=self.restaurant, name="Rice", price=Decimal("4.00"), food_type=food_type)
+        self.soup = Dish.objects.create(restaurant=self.restaurant, name="Soup", price=Decimal("6.50"), food_type=food_type)
+
+    def snapshot(self):
+        return (
+            sorted(RestaurantDailySales.objects.values_list("date", "order_count", "revenue")),
+            sorted(DishDailySales.objects.values_list("dish__name", "units", "revenue")),
+        )
+
+    def test_incremental_rollups_match_backfill(self):
+        paid, _ = create_order(self.customer, self.restaurant.id, [(self.rice, 2), (self.soup, 1)])
+        cancelled, _ = create_order(self.customer, self.restaurant.id, [(self.soup, 3)])
+        create_order(self.customer, self.restaurant.id, [(self.rice, 1)])  # stays pending
+        transition_orders(self.restaurant.id, [
+            {"order_id": paid.id, "status": "paid"},
+            {"order_id": cancelled.id, "status": "paid"},
+        ])
+        transition_orders(self.restaurant.id, [
+            {"order_id": paid.id, "status": "preparing"},
+            {"order_id": cancelled.id, "status": "cancelled"},
+        ])
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0][0][1:], (1, Decimal("14.50")))
+
+        today = timezone.localdate()
+        rebuild_range(today, today + timezone.timedelta(days=1))
+        self.assertEqual(self.snapshot(), incremental)
+
+        series = revenue_series(self.restaurant.id, today - timezone.timedelta(days=2), today)
+        self.assertEqual([row["revenue"] for row in series], [0, 0, Decimal("14.50")])
+
+    def test_backfill_keeps_the_revenue_of_archived_orders(self):
+        old, _ = create_order(self.customer, self.restaurant.id, [(self.rice, 2), (self.soup, 1)])
+        recent, _ = create_order(self.customer, self.restaurant.id, [(self.rice, 1)])
+        for status in ("paid", "preparing", "delivered"):
+            transition_orders(self.restaurant.id, [
+                {"order_id": old.id, "status": status},
+                {"order_id": recent.id, "status": status},
+            ])
+        long_ago = timezone.now() - timezone.timedelta(days=200)
+        Order.objects.filter(pk=old.pk).update(created_at=long_ago)
+        create_order(self.customer, self.restaurant.id, [(self.rice, 1)])  # stays pending
+        self.assertEqual(archive_orders(older_than_days=90), 1)
+
+        call_command("backfill_sales_rollups", stdout=StringIO())
+
+        by_day = dict(RestaurantDailySales.objects.values_list("date", "revenue"))
+        self.assertEqual(by_day, {
+            timezone.localdate(long_ago): Decimal("14.50"),
+            timezone.localdate(): Decimal("4.00"),
+        })
+        self.assertEqual(
+            sorted(DishDailySales.objects.filter(date=timezone.localdate(long_ago)).values_list("dish__name", "units")),
+            [("Rice", 2), ("Soup", 1)],
+        )
+
+    def test_a_rebuild_takes_the_write_lock_before_reading_orders(self):
+        # a status change committing between the read and the rewrite would lose its bump
+        today = timezone.localdate()
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_range(today, today + timezone.timedelta(days=1))
+        statements = [q["sql"] for q in queries if not q["sql"].startswith(("SAVEPOINT", "RELEASE", "BEGIN"))]
+        if connection.vendor == "postgresql":
+            self.assertIn("pg_advisory_xact_lock(", statements.pop(0))
+        self.assertTrue(statements[0].startswith("DELETE"), statements[0])
+        self.assertNotIn('"orders_order"', statements[0])
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import RevenueReportView, TopDishesView
+
+urlpatterns = [
+    path("revenue/", RevenueReportView.as_view(), name="analytics-revenue"),
+    path("top-dishes/", TopDishesView.as_view(), name="analytics-top-dishes"),
+]
@@ -0,0 +1,51 @@
+from rest_framework import generics, permissions
+from rest_framework.response import Response
+from accounts.permissions import IsRestaurantOwner
+from .serializers import ReportRangeSerializer
+from .services import revenue_series, top_dishes
+
+
+class RevenueReportView(generics.GenericAPIView):
+    """
+    GET /analytics/revenue/?start=2025-01-01&end=2025-03-31&interval=week
+    Revenue over time for the owner's restaurant, served from the daily rollups.
+    """
+    serializer_class = ReportRangeSerializer
+    permission_classes = [permissions.IsAuthenticated, IsRestaurantOwner]
+
+    def get(self, request):
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        q = params.validated_data
+        series = revenue_series(request.user.restaurant.id, q["start"], q["end"], q["interval"])
+        return Response({
+            "start": q["start"],
+            "end": q["end"],
+            "interval": q["interval"],
+            "order_count": sum(row["order_count"] for row in series),
+            "revenue": sum(row["revenue"] for row in series),
+            "results": series,
+        })
+
+
+class TopDishesView(generics.GenericAPIView):
+    """
+    GET /analytics/top-dishes/?start=...&end=...&limit=10
+    Best-selling dishes by revenue for the owner's restaurant.
+    """
+    serializer_class = ReportRangeSerializer
+    permission_classes = [permissions.IsAuthenticated, IsRestaurantOwner]
+
+    def get(self, request):
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        q = params.validated_data
+        rows = top_dishes(request.user.restaurant.id, q["start"], q["end"], q["limit"])
+        return Response({
+            "start": q["start"],
+            "end": q["end"],
+            "results": [
+                {"dish_id": row["dish_id"], "dish_name": row["dish__name"], "units": row["units"], "revenue": row["revenue"]}
+                for row in rows
+            ],
+        })
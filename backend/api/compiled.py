@@ -0,0 +1,293 @@
+"""
+Compiled read-only serializers for hot list endpoints.
+
+compile_serializer(SomeModelSerializer) inspects the serializer's readable
+fields once and turns them into a flat plan: which `.values()` columns to
+select and how to convert each one. A page is then rendered from plain rows:
+one query for the page, plus one per nested serializer, m2m field or nested
+many serializer (the prefetch queries, minus the model instances). No serializer, field or
+model instance is created per row, and the output is the same as
+`SomeModelSerializer(page, many=True).data` once rendered to JSON.
+
+Supported fields: model columns, FK primary keys, nested serializers over
+FKs, m2m primary-key lists, nested many serializers over reverse FKs, dotted
+sources across FKs ("dish.name") and model properties that only read the
+model's own non-FK columns (e.g. OrderItem.subtotal). Anything else raises
+ImproperlyConfigured when the serializer is compiled.
+
+Output that depends on the request goes in a serializer classmethod
+finish_representation(data, context), called from its to_representation();
+render() calls it on each row too (see api/images.py, ImageVariantsMixin).
+"""
+import uuid
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from django.db.models.functions import Cast
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+_compiled = {}
+
+# model column values that are already what the serializer field would return
+_IDENTITY_FIELDS = (
+    serializers.CharField, serializers.BooleanField, serializers.IntegerField, serializers.ChoiceField,
+)
+
+
+def _uuid(value):
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def _dashed(value):
+    """A UUID read as text: 32 hex digits (SQLite, MySQL) or already dashed (Postgres)."""
+    if value is None or len(value) != 32:
+        return value
+    return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}"
+
+
+def _key(value):
+    """One spelling for a pk, whether it was read as a UUID or as text."""
+    if isinstance(value, str):
+        return _dashed(value)
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def _as_text(column, model_field):
+    """
+    (expression, converter) for reading a column. UUIDs are read as text:
+    building uuid.UUID objects only to turn them back into strings is most
+    of what .values() costs on pages full of foreign keys.
+    """
+    if isinstance(model_field, models.UUIDField):
+        return Cast(column, models.CharField()), _dashed
+    return column, None
+
+
+def _decimal(field):
+    """DecimalField.to_representation, minus the quantize() for values that already have the right places."""
+    coerce = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce or field.localize or field.normalize_output or field.decimal_places is None:
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def convert(value):
+        return "{:f}".format(value) if value.as_tuple().exponent == exponent else field.to_representation(value)
+    return convert
+
+
+def _datetime(field):
+    """
+    DateTimeField.to_representation for aware ISO 8601 output, resolving the
+    timezone once per render instead of once per value. None when the field
+    is configured any other way (it then falls back to the field itself).
+    """
+    if getattr(field, "format", api_settings.DATETIME_FORMAT).lower() != ISO_8601 or not settings.USE_TZ:
+        return None
+
+    def bind(tz):
+        def convert(value):
+            if not timezone.is_aware(value):
+                return field.to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+        return convert
+    return bind
+
+
+class CompiledSerializer:
+    """
+    `page` is True for the serializer a view pages through: its pk is read as
+    a real UUID, since cursors and callers use it. Nested serializers read
+    every UUID as text.
+    """
+
+    def __init__(self, serializer_class, page=True):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.page = page
+        self.select = {}  # row key -> column name or expression, for .values()
+        self.text = set()  # row keys holding UUIDs read as text
+        self.plan = []  # (key, kind, detail)
+        self.parents = []  # (key, CompiledSerializer, fk row key), for nested serializers over FKs
+        self.children = []  # (key, CompiledSerializer, fk column, fk row key), for nested many serializers
+        self.m2m = []  # (key, through model, owner column, owner expression, target expression, target converter)
+        self.properties = False
+        self.finish = getattr(serializer_class, "finish_representation", None)
+        self._bound = {}  # timezone -> plan, see _bind()
+        self._compile()
+
+    def _select(self, column, model_field):
+        """Select a column (once) and return its row key."""
+        pk = self.model._meta.pk
+        if self.page and column == pk.attname:
+            expression, convert = column, None
+        else:
+            expression, convert = _as_text(column, model_field)
+        if convert is None:
+            self.select.setdefault(column, column)
+            return column
+        key = column.replace("__", "_") + "_text"
+        self.select.setdefault(key, expression)
+        self.text.add(key)
+        return key
+
+    def _compile(self):
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            source = field.source_attrs
+            if isinstance(field, serializers.ManyRelatedField):
+                model_field = self.model._meta.get_field(source[0])
+                if not isinstance(model_field, models.ManyToManyField):
+                    raise ImproperlyConfigured(f"{name}: only forward m2m id lists can be compiled")
+                through = model_field.remote_field.through
+                owner = through._meta.get_field(model_field.m2m_field_name())
+                target = through._meta.get_field(model_field.m2m_reverse_field_name())
+                self.m2m.append((
+                    name, through, owner.attname, _as_text(owner.attname, owner.target_field)[0],
+                    *_as_text(target.attname, target.target_field),
+                ))
+                self.plan.append((name, "m2m", None))
+            elif isinstance(field, serializers.ListSerializer):
+                relation = self.model._meta.get_field(source[0])
+                if not isinstance(relation, models.ManyToOneRel):
+                    raise ImproperlyConfigured(f"{name}: nested many serializers must follow a reverse FK")
+                child = CompiledSerializer(type(field.child), page=False)
+                fk_key = child._select(relation.field.attname, relation.field.target_field)
+                self.children.append((name, child, relation.field.attname, fk_key))
+                self.plan.append((name, "children", None))
+            elif isinstance(field, serializers.Serializer):
+                # rendered from its own query, once per distinct FK value on the page
+                relation = self.model._meta.get_field(source[0])
+                if len(source) > 1 or not relation.many_to_one:
+                    raise ImproperlyConfigured(f"{name}: nested serializers must follow a forward FK")
+                fk_key = self._select(relation.attname, relation.target_field)
+                self.parents.append((name, CompiledSerializer(type(field), page=False), fk_key))
+                self.plan.append((name, "related", fk_key))
+            else:
+                self.plan.append((name, *self._scalar(name, field, source)))
+        if self.properties:
+            for model_field in self.model._meta.concrete_fields:
+                if not model_field.is_relation:
+                    self._select(model_field.attname, model_field)
+        self.pk_key = self._select(self.model._meta.pk.attname, self.model._meta.pk)
+
+    def _scalar(self, name, field, source):
+        model, path = self.model, []
+        for i, attr in enumerate(source):
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                prop = getattr(model, attr, None)
+                if i == 0 and len(source) == 1 and isinstance(prop, property):
+                    self.properties = True
+                    return "property", (prop.fget, field.to_representation)
+                raise ImproperlyConfigured(f"{name}: can't compile source {field.source!r}")
+            path.append(attr)
+            if model_field.is_relation and i < len(source) - 1:
+                model = model_field.related_model
+        target = model_field.target_field if model_field.is_relation else model_field
+        column = self._select("__".join(path), target)
+        if column in self.text and isinstance(
+            field, (serializers.PrimaryKeyRelatedField, serializers.ReadOnlyField, serializers.UUIDField)
+        ):
+            convert = _dashed  # renders the same as the UUID the field would hand the renderer
+        elif isinstance(field, serializers.PrimaryKeyRelatedField) or isinstance(field, serializers.ReadOnlyField):
+            convert = None  # the raw pk / value, exactly what the field would hand the renderer
+        elif isinstance(field, serializers.UUIDField):
+            convert = _uuid
+        elif isinstance(field, _IDENTITY_FIELDS):
+            convert = None
+        elif isinstance(field, serializers.DecimalField):
+            convert = _decimal(field)
+        elif isinstance(field, serializers.DateTimeField) and _datetime(field):
+            return "datetime", (column, field.timezone if hasattr(field, "timezone") else None, _datetime(field))
+        else:
+            convert = field.to_representation
+        return "column", (column, convert)
+
+    def _values(self, queryset, *extra):
+        columns = [key for key, expression in self.select.items() if isinstance(expression, str)]
+        expressions = {key: expression for key, expression in self.select.items() if not isinstance(expression, str)}
+        return queryset.values(*columns, *extra, **expressions)
+
+    def values(self, queryset):
+        """The rows a page needs, as a .values() queryset (filters, annotations and ordering kept)."""
+        queryset = queryset.prefetch_related(None)
+        extra = [name for name in queryset.query.annotations if name not in self.select]
+        extra += [
+            field.lstrip("-") for field in queryset.query.order_by
+            if isinstance(field, str) and field.lstrip("-") not in [*self.select, *extra] and field.lstrip("-") != "pk"
+        ]
+        if any(f.name == "created_at" for f in self.model._meta.concrete_fields) and "created_at" not in self.select:
+            extra.append("created_at")  # DefaultPagination's fallback ordering
+        return self._values(queryset, *extra)
+
+    def render(self, rows, context=None):
+        """Serialize .values() rows (a list of dicts) into the serializer's output; `context` is the serializer context."""
+        context = context or {}
+        rows = list(rows)
+        ids = [row[self.pk_key] for row in rows]
+        related = {}
+        for name, through, owner, owner_expression, target, convert in self.m2m:
+            grouped = {}
+            links = through.objects.filter(**{f"{owner}__in": ids}).values_list(owner_expression, target)
+            for owner_id, target_id in links:
+                grouped.setdefault(_key(owner_id), []).append(target_id if convert is None else convert(target_id))
+            related[name] = grouped
+        for name, parent, fk in self.parents:
+            parent_ids = {row[fk] for row in rows} - {None}
+            parent_rows = list(parent._values(parent.model.objects.filter(pk__in=parent_ids)))
+            by_pk = {_key(row[parent.pk_key]): data for row, data in zip(parent_rows, parent.render(parent_rows, context))}
+            related[name] = by_pk
+        for name, child, fk, fk_key in self.children:
+            grouped = {}
+            child_rows = list(child._values(child.model.objects.filter(**{f"{fk}__in": ids})))
+            for row, data in zip(child_rows, child.render(child_rows, context)):
+                grouped.setdefault(_key(row[fk_key]), []).append(data)
+            related[name] = grouped
+        plan = self._bind(timezone.get_current_timezone())
+        if self.finish is None:
+            return [self._row(row, related, plan) for row in rows]
+        return [self.finish(self._row(row, related, plan), context) for row in rows]
+
+    def _bind(self, current_tz):
+        """The plan with datetime converters bound to a timezone (cached, there are only a few)."""
+        if current_tz not in self._bound:
+            plan = []
+            for key, kind, detail in self.plan:
+                if kind == "datetime":
+                    column, field_tz, bind = detail
+                    kind, detail = "column", (column, bind(field_tz or current_tz))
+                plan.append((key, kind, detail))
+            self._bound[current_tz] = plan
+        return self._bound[current_tz]
+
+    def _row(self, row, related, plan):
+        pk = _key(row[self.pk_key]) if self.m2m or self.children else None
+        data = {}
+        for key, kind, detail in plan:
+            if kind == "column":
+                column, convert = detail
+                value = row[column]
+                data[key] = value if convert is None or value is None else convert(value)
+            elif kind == "property":
+                getter, convert = detail
+                value = getter(SimpleNamespace(**row))
+                data[key] = None if value is None else convert(value)
+            elif kind == "related":  # nested serializers over FKs
+                value = row[detail]
+                data[key] = None if value is None else related[key].get(_key(value))
+            else:  # m2m id lists and nested many serializers
+                data[key] = related[key].get(pk, [])
+        return data
+
+
+def compile_serializer(serializer_class):
+    """The compiled (and cached) read-only version of a ModelSerializer class."""
+    if serializer_class not in _compiled:
+        _compiled[serializer_class] = CompiledSerializer(serializer_class)
+    return _compiled[serializer_class]
@@ -0,0 +1,44 @@
+import hashlib
+from functools import wraps
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """A strong ETag over whatever identifies one exact representation."""
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def respond_conditionally(request, etag, last_modified, respond):
+    """
+    Answer If-None-Match / If-Modified-Since with a 304 (or 412) from the
+    validators alone, otherwise call `respond()` for the full response.
+    `last_modified` is a unix timestamp, or None.
+    """
+    last_modified = int(last_modified) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def conditional(validators):
+    """
+    Conditional GETs for a view handler. `validators(view, request, *args, **kwargs)`
+    returns (etag, last_modified) from something cheaper than the response
+    itself (an updated_at column, a version counter), or None to skip.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            found = validators(self, request, *args, **kwargs)
+            if found is None:
+                return handler(self, request, *args, **kwargs)
+            etag, last_modified = found
+            return respond_conditionally(request, etag, last_modified, lambda: handler(self, request, *args, **kwargs))
+        return wrapper
+    return decorator
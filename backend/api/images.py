@@ -0,0 +1,497 @@
+"""
+Image uploads off the request path.
+
+Serializers hand an uploaded file to upload_later() instead of uploading it
+themselves. The file is copied to local temporary storage (fast, on the
+request thread), the record is marked image_status="pending" and, once the
+transaction commits, a worker from a shared thread pool pushes the file to
+the image storage and saves the resulting URL with image_status="ready" (or
+"failed"). Responses go out immediately with the pending status. Each
+upload gets a token in the record's image_upload, and only the latest one's
+result is saved, so a slow older upload can't overwrite a newer image.
+
+The storage is picked by settings.IMAGE_STORAGE:
+- CloudinaryStorage: the production image host.
+- LocalStorage: files under MEDIA_ROOT, for local runs and tests.
+
+IMAGE_UPLOAD_WORKERS = 0 uploads inline when the transaction commits instead,
+which keeps tests (and scripts) deterministic.
+
+Clients can also skip Django altogether and upload to the storage directly
+with signed parameters; see api/uploads.py.
+
+Restaurant, dish and menu images also get fixed-size WebP variants
+(settings.IMAGE_VARIANTS: thumb, card, full) when they are stored. Pillow
+does the resizing on a small process pool (IMAGE_VARIANT_PROCESSES; 0 resizes
+in the upload worker itself), and the variants land next to each other in the
+storage as <name>_<size>.webp, so a record keeps a single URL template in
+image_variants ("{size}" in place of the size). ImageVariantsMixin lets API
+clients pick a size with ?image_size=.
+"""
+import http.client
+import ipaddress
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+from urllib import request as urllib_request
+from django.apps import apps
+from django.conf import settings
+from django.core.signing import Signer
+from django.db import close_old_connections, models, transaction
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStatus(models.TextChoices):
+    READY = "ready", "Ready"  # also: no image at all
+    PENDING = "pending", "Pending"
+    FAILED = "failed", "Failed"
+
+
+class CloudinaryStorage:
+    def save(self, source, folder):
+        """Upload a local file path or a remote URL; returns the public URL."""
+        import cloudinary.uploader
+
+        return cloudinary.uploader.upload(source, folder=folder)["secure_url"]
+
+    def signed_upload(self, folder, public_id):
+        """Where and what a client POSTs (multipart, plus `file`) to upload straight to Cloudinary."""
+        import cloudinary
+        import cloudinary.utils
+
+        config = cloudinary.config()
+        fields = {"folder": folder, "public_id": public_id, "timestamp": int(time.time())}
+        fields["signature"] = cloudinary.utils.api_sign_request(fields, config.api_secret)
+        fields["api_key"] = config.api_key
+        return {"url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"), "fields": fields}
+
+    def confirm(self, folder, public_id, result):
+        """The URL of a finished signed upload, from Cloudinary's (signed) upload response. ValueError if it doesn't check out."""
+        import cloudinary
+        import cloudinary.utils
+
+        full_id = f"{folder}/{public_id}"
+        if result.get("public_id") != full_id or not cloudinary.utils.verify_api_response_signature(
+            full_id, result.get("version"), result.get("signature")
+        ):
+            raise ValueError("Upload result doesn't match this upload.")
+        return cloudinary.CloudinaryImage(full_id).build_url(secure=True, version=result["version"])
+
+    def save_variants(self, paths, folder, name):
+        """Upload {size: WebP path} as <folder>/<name>_<size>; returns the URL template."""
+        import cloudinary
+        import cloudinary.uploader
+
+        for size, path in paths.items():
+            cloudinary.uploader.upload(path, public_id=f"{folder}/{name}_{size}", overwrite=True)
+        # unversioned, so one template covers every size; the names are never reused
+        url = cloudinary.CloudinaryImage(f"{folder}/{name}_SIZE").build_url(secure=True, format="webp")
+        return url.replace("_SIZE.webp", "_{size}.webp")
+
+
+class LocalStorage:
+    """
+    Files under MEDIA_ROOT/<folder>/, served from MEDIA_URL. Signed uploads
+    go to a stand-in for the provider's upload endpoint (api/uploads.py,
+    LocalStorageUploadView) that signs its responses the way Cloudinary does.
+    """
+    salt = "api.images.LocalStorage"
+
+    def save(self, source, folder):
+        name = f"{uuid.uuid4().hex}{os.path.splitext(urlparse(source).path)[1].lower()}"
+        directory = os.path.join(settings.MEDIA_ROOT, folder)
+        os.makedirs(directory, exist_ok=True)
+        if urlparse(source).scheme in ("http", "https"):
+            with open(os.path.join(directory, name), "wb") as out:
+                fetch_image(source, out)
+        else:
+            shutil.copyfile(source, os.path.join(directory, name))
+        return urljoin(settings.MEDIA_URL, f"{folder}/{name}")
+
+    def save_variants(self, paths, folder, name):
+        directory = os.path.join(settings.MEDIA_ROOT, folder)
+        os.makedirs(directory, exist_ok=True)
+        for size, path in paths.items():
+            shutil.copyfile(path, os.path.join(directory, f"{name}_{size}.webp"))
+        return urljoin(settings.MEDIA_URL, f"{folder}/{name}_{{size}}.webp")
+
+    def sign(self, *parts):
+        return Signer(salt=self.salt).signature(":".join(str(part) for part in parts))
+
+    def signed_upload(self, folder, public_id):
+        fields = {"folder": folder, "public_id": public_id, "timestamp": int(time.time())}
+        fields["signature"] = self.sign(folder, public_id, fields["timestamp"])
+        return {"url": reverse("local-storage-upload"), "fields": fields}
+
+    def receive(self, fields, upload):
+        """The upload endpoint's side: check the signed fields, store the file and answer like the provider."""
+        try:
+            timestamp = int(fields.get("timestamp"))
+        except (TypeError, ValueError):
+            raise ValueError("Missing timestamp.")
+        folder, public_id = fields.get("folder", ""), fields.get("public_id", "")
+        if not constant_time_compare(fields.get("signature", ""), self.sign(folder, public_id, timestamp)):
+            raise ValueError("Bad signature.")
+        if time.time() - timestamp > settings.IMAGE_UPLOAD_SIGNATURE_TTL:
+            raise ValueError("Upload parameters expired.")
+        extension = os.path.splitext(upload.name)[1].lower()
+        directory = os.path.join(settings.MEDIA_ROOT, folder)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, public_id + extension), "wb") as out:
+            for chunk in upload.chunks():
+                out.write(chunk)
+        full_id, version, fmt = f"{folder}/{public_id}", int(time.time()), extension.lstrip(".")
+        return {"public_id": full_id, "version": version, "format": fmt, "signature": self.sign(full_id, version, fmt)}
+
+    def confirm(self, folder, public_id, result):
+        full_id = f"{folder}/{public_id}"
+        version, extension = result.get("version"), result.get("format", "")
+        if result.get("public_id") != full_id or not constant_time_compare(
+            result.get("signature", ""), self.sign(full_id, version, extension)
+        ):
+            raise ValueError("Upload result doesn't match this upload.")
+        name = f"{public_id}.{extension}" if extension else public_id
+        if not os.path.exists(os.path.join(settings.MEDIA_ROOT, folder, name)):
+            raise ValueError("Nothing was uploaded.")
+        return urljoin(settings.MEDIA_URL, f"{folder}/{name}")
+
+
+_storages = {}
+_pool = None
+_processes = None
+_lock = threading.Lock()
+
+
+def get_storage():
+    with _lock:
+        if settings.IMAGE_STORAGE not in _storages:
+            _storages[settings.IMAGE_STORAGE] = import_string(settings.IMAGE_STORAGE)()
+        return _storages[settings.IMAGE_STORAGE]
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.IMAGE_UPLOAD_WORKERS, thread_name_prefix="image-upload")
+        return _pool
+
+
+def _get_processes():
+    global _processes
+    with _lock:
+        if _processes is None:
+            # spawned, not forked: the parent is a threaded web worker
+            _processes = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _processes
+
+
+def stash(upload):
+    """Copy an uploaded file to local temporary storage; returns the path."""
+    os.makedirs(settings.IMAGE_UPLOAD_TMP_DIR, exist_ok=True)
+    suffix = os.path.splitext(getattr(upload, "name", "") or "")[1].lower()
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=settings.IMAGE_UPLOAD_TMP_DIR)
+    with os.fdopen(fd, "wb") as out:
+        for chunk in upload.chunks():
+            out.write(chunk)
+    return path
+
+
+def _is_public(address):
+    return ipaddress.ip_address(address.split("%")[0]).is_global
+
+
+def _public_connection(address, *args, **kwargs):
+    """
+    socket.create_connection() for fetch_image(): every address the host
+    resolves to must be public, and the connection goes to the address that
+    was checked, so a host that re-resolves to a private one can't slip through.
+    """
+    host, port = address
+    resolved = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not all(_is_public(sockaddr[0]) for *_, sockaddr in resolved):
+        raise ValueError(f"{host} does not resolve to a public address.")
+    return socket.create_connection(resolved[0][4][:2], *args, **kwargs)
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(urllib_request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib_request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+# http(s) only, redirects included: no file:, ftp: or data: handlers
+_opener = urllib_request.OpenerDirector()
+for _handler in (
+    _PublicHTTPHandler, _PublicHTTPSHandler, urllib_request.HTTPRedirectHandler,
+    urllib_request.HTTPDefaultErrorHandler, urllib_request.HTTPErrorProcessor,
+):
+    _opener.add_handler(_handler())
+
+
+def fetch_image(url, out):
+    """
+    Copy the image at a public http(s) `url` into the file object `out`.
+    Raises ValueError for other URLs, for responses that aren't image/* and
+    for anything over settings.IMAGE_FETCH_MAX_BYTES.
+    """
+    if urlparse(url).scheme not in ("http", "https"):
+        raise ValueError(f"Can't fetch {url}.")
+    limit = settings.IMAGE_FETCH_MAX_BYTES
+    with _opener.open(url, timeout=30) as response:
+        if response.headers.get_content_maintype() != "image":
+            raise ValueError(f"{url} is not an image ({response.headers.get_content_type()}).")
+        if int(response.headers.get("Content-Length") or 0) > limit:
+            raise ValueError(f"{url} is larger than {limit} bytes.")
+        copied = 0
+        while chunk := response.read(64 * 1024):
+            copied += len(chunk)
+            if copied > limit:
+                raise ValueError(f"{url} is larger than {limit} bytes.")
+            out.write(chunk)
+
+
+def stash_url(url):
+    """
+    Copy the image at `url` (a public remote URL, see fetch_image(), or a
+    file under MEDIA_URL for LocalStorage) to local temporary storage;
+    returns the path.
+    """
+    os.makedirs(settings.IMAGE_UPLOAD_TMP_DIR, exist_ok=True)
+    remote = urlparse(url).scheme in ("http", "https")
+    if not remote:
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        local = os.path.realpath(os.path.join(media_root, url[len(settings.MEDIA_URL):]))
+        if not url.startswith(settings.MEDIA_URL) or not local.startswith(media_root + os.sep):
+            raise ValueError(f"Can't fetch {url}.")
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(urlparse(url).path)[1].lower(), dir=settings.IMAGE_UPLOAD_TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if remote:
+                fetch_image(url, out)
+            else:
+                with open(local, "rb") as source:
+                    shutil.copyfileobj(source, out)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def make_variants(source, directory, sizes, quality):
+    """
+    Process pool side: write a WebP of the image `source` fitting each of
+    `sizes` ({size: longest side in px}) into `directory`; returns
+    {size: path}. Images are never enlarged.
+    """
+    from PIL import Image, ImageOps
+
+    paths = {}
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        # largest first, each one scaled down from the last
+        for size, side in sorted(sizes.items(), key=lambda item: -item[1]):
+            image.thumbnail((side, side), Image.Resampling.LANCZOS)
+            paths[size] = os.path.join(directory, f"{size}.webp")
+            image.save(paths[size], "WEBP", quality=quality)
+    return paths
+
+
+def store_variants(source, folder):
+    """
+    Worker side: make the size variants of the local image `source` and put
+    them in the storage. Returns the URL template, or "" if the image can't
+    be processed (the record then serves its original at every size).
+    """
+    os.makedirs(settings.IMAGE_UPLOAD_TMP_DIR, exist_ok=True)
+    directory = tempfile.mkdtemp(dir=settings.IMAGE_UPLOAD_TMP_DIR)
+    args = (source, directory, settings.IMAGE_VARIANTS, settings.IMAGE_VARIANT_QUALITY)
+    try:
+        if settings.IMAGE_VARIANT_PROCESSES:
+            paths = _get_processes().submit(make_variants, *args).result()
+        else:
+            paths = make_variants(*args)
+        return get_storage().save_variants(paths, folder, uuid.uuid4().hex)
+    except Exception:
+        logger.exception("Could not make size variants of %s", source)
+        return ""
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def store_image(source, folder, variants=True):
+    """Put the local image `source` in the storage, with its size variants; returns (url, variants URL template)."""
+    url = get_storage().save(source, folder)
+    return url, store_variants(source, folder) if variants else ""
+
+
+class _StashedUpload:
+    """
+    upload_later()'s on_commit callback. Django drops the callbacks of a
+    rolled back transaction, and the stashed file goes with this one unless
+    it ran and handed the file to upload_image().
+    """
+
+    def __init__(self, instance, field, path, folder, token):
+        self.args = (instance._meta.label, instance.pk, field, path, folder, True, token)
+        self._discard = weakref.finalize(self, _remove_quietly, path)
+
+    def __call__(self):
+        self._discard.detach()
+        submit(upload_image, *self.args)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def upload_later(instance, field, upload, folder):
+    """
+    Mark `instance` (already saved) as waiting for an image and upload
+    `upload` into `field` after the current transaction commits.
+    """
+    path = stash(upload)
+    token = uuid.uuid4()
+    instance.image_status = ImageStatus.PENDING
+    instance.image_upload = token
+    instance.save(update_fields=["image_status", "image_upload"])
+    transaction.on_commit(_StashedUpload(instance, field, path, folder, token))
+
+
+def submit(task, *args):
+    """Run `task(*args)` on the upload pool once the transaction commits (inline with IMAGE_UPLOAD_WORKERS = 0)."""
+    if settings.IMAGE_UPLOAD_WORKERS:
+        transaction.on_commit(lambda: _get_pool().submit(_in_worker, task, *args))
+    else:
+        transaction.on_commit(lambda: task(*args))
+
+
+def _in_worker(task, *args):
+    # pool threads live on between tasks, so treat each task like a request for db connections
+    close_old_connections()
+    try:
+        return task(*args)
+    finally:
+        close_old_connections()
+
+
+def upload_image(model_label, pk, field, source, folder, remove_source=True, token=None):
+    """
+    Worker side: push `source` to the storage and save the URL on the record.
+    With a `token` (upload_later()) nothing is saved unless it is still the
+    record's latest upload. save(update_fields=...) only writes the image
+    columns, and still sends post_save so caches and search documents follow.
+    """
+    model = apps.get_model(model_label)
+    variants = hasattr(model, "image_variants")
+    try:
+        url, template = store_image(source, folder, variants=variants)
+    except Exception:
+        logger.exception("Image upload failed for %s %s", model_label, pk)
+        url = None
+    finally:
+        if remove_source:
+            _remove_quietly(source)
+    with transaction.atomic():
+        latest = model.objects.select_for_update().filter(pk=pk)
+        if token is not None:
+            latest = latest.filter(image_upload=token)
+        instance = latest.first()
+        if instance is None:
+            return None  # deleted, or replaced by a newer image while uploading
+        if url:
+            setattr(instance, field, url)
+            instance.image_status = ImageStatus.READY
+            if variants:
+                instance.image_variants = template
+            instance.save(update_fields=[field, "image_status", *(["image_variants"] if variants else [])])
+        else:
+            instance.image_status = ImageStatus.FAILED
+            instance.save(update_fields=["image_status"])
+    return url
+
+
+def variants_later(instance, field, folder):
+    """After the transaction commits, make the size variants of an image that reached the storage directly (api/uploads.py)."""
+    if hasattr(instance, "image_variants"):
+        submit(attach_variants, instance._meta.label, instance.pk, field, getattr(instance, field), folder)
+
+
+def attach_variants(model_label, pk, field, url, folder):
+    """Worker side of variants_later(). Does nothing if the record's image changed in the meantime."""
+    try:
+        source = stash_url(url)
+    except Exception:
+        logger.exception("Could not fetch %s for its size variants", url)
+        return ""
+    try:
+        template = store_variants(source, folder)
+    finally:
+        os.remove(source)
+    instance = apps.get_model(model_label).objects.filter(pk=pk, **{field: url}).first()
+    if instance is not None and template:
+        instance.image_variants = template
+        instance.save(update_fields=["image_variants"])
+    return template
+
+
+class ImageVariantsMixin:
+    """
+    For serializers of models with image_variants (listed as a read-only
+    field): ?image_size=<one of settings.IMAGE_VARIANTS> swaps the URL in
+    `image_field` for that variant's. Without it, or for a record with no
+    variants, the original URL is served. The template itself isn't output.
+    """
+    image_field = None
+
+    def to_representation(self, instance):
+        return self.finish_representation(super().to_representation(instance), self.context)
+
+    @classmethod
+    def finish_representation(cls, data, context):
+        """Also called on each row by compiled serializers (api/compiled.py)."""
+        size = getattr((context or {}).get("request"), "query_params", {}).get("image_size")
+        return with_image_size(data, cls.image_field, size)
+
+
+def with_image_size(data, field, size):
+    """Serializer output `data` with `field` pointing at the `size` variant, if it has one; the image_variants template is dropped."""
+    template = data.pop("image_variants", "")
+    if template and size in settings.IMAGE_VARIANTS and field in data:
+        data[field] = template.replace("{size}", size)
+    return data
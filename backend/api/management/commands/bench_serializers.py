@@ -0,0 +1,82 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import CustomUser
+from api.compiled import compile_serializer
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+from restaurants.models import Category, Dish, FoodType, Menu, Restaurant
+from restaurants.serializers import DishSerializer, MenuSerializer
+
+
+class Command(BaseCommand):
+    help = "Time one page of dishes, orders and menus through the DRF serializers vs their compiled form (api/compiled.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="page size")
+        parser.add_argument("--rounds", type=int, default=10)
+        parser.add_argument("--target", type=float, default=5.0, help="speed-up to aim for")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        # seeded inside a transaction that is rolled back, so the database is left as it was
+        with transaction.atomic():
+            restaurant = self.seed(rows)
+            cases = [
+                ("dishes", DishSerializer, Dish.objects.filter(restaurant=restaurant).order_by("-created_at", "-id"),
+                 ("restaurant", "food_type"), ("categories", "menus")),
+                ("orders", OrderSerializer, Order.objects.filter(restaurant=restaurant).order_by("-created_at", "-id"),
+                 (), ()),
+                ("menus", MenuSerializer, Menu.objects.filter(restaurant=restaurant).order_by("-created_at", "-id"),
+                 ("restaurant",), ()),
+            ]
+            for name, serializer_class, queryset, select, prefetch in cases:
+                if serializer_class is OrderSerializer:
+                    drf_queryset = queryset.with_items()
+                else:
+                    drf_queryset = queryset.select_related(*select).prefetch_related(*prefetch)
+                compiled = compile_serializer(serializer_class)
+                drf = self.time(options["rounds"], lambda: serializer_class(list(drf_queryset[:rows]), many=True).data)
+                fast = self.time(options["rounds"], lambda: compiled.render(list(compiled.values(queryset)[:rows])))
+                speedup = drf / fast
+                line = f"{name}: {rows} rows, DRF {drf:.1f} ms, compiled {fast:.1f} ms, {speedup:.1f}x"
+                style = self.style.SUCCESS if speedup >= options["target"] else self.style.WARNING
+                self.stdout.write(style(line))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def time(rounds, build):
+        build()  # warm up
+        started = time.perf_counter()
+        for _ in range(rounds):
+            build()
+        return (time.perf_counter() - started) * 1000 / rounds
+
+    def seed(self, rows):
+        owner = CustomUser.objects.create_user(email="bench-owner@example.com", password=None)
+        customer = CustomUser.objects.create_user(email="bench-customer@example.com", password=None)
+        restaurant = Restaurant.objects.create(owner=owner, name="Bench Kitchen", description="benchmark data")
+        food_type, _ = FoodType.objects.get_or_create(name="Non-Vegetarian")
+        categories = Category.objects.bulk_create(Category(name=f"Bench {i}", restaurant=restaurant) for i in range(5))
+        menus = Menu.objects.bulk_create(Menu(name=f"Bench {i}", restaurant=restaurant) for i in range(rows))
+        dishes = Dish.objects.bulk_create(
+            Dish(restaurant=restaurant, food_type=food_type, name=f"Bench dish {i}", description="benchmark data",
+                 price=Decimal(500 + i) / 100)
+            for i in range(rows)
+        )
+        Dish.categories.through.objects.bulk_create(
+            Dish.categories.through(dish_id=dish.id, category_id=categories[(i + k) % 5].id)
+            for i, dish in enumerate(dishes) for k in range(2)
+        )
+        Dish.menus.through.objects.bulk_create(
+            Dish.menus.through(dish_id=dish.id, menu_id=menus[i].id) for i, dish in enumerate(dishes)
+        )
+        orders = Order.objects.bulk_create(
+            Order(customer=customer, restaurant=restaurant, total_amount=Decimal("15.00"), item_count=3) for _ in range(rows)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, dish=dishes[(i + k) % rows], quantity=1, price=Decimal("5.00"))
+            for i, order in enumerate(orders) for k in range(3)
+        )
+        return restaurant
@@ -1,6 +1,51 @@
 from rest_framework import permissions
+from aptech_python.db_router import read_from_replica
+from .compiled import compile_serializer
 from .permissions import IsStaffEditorPermission
 
 
 class StaffEditorPermissionMixin():
-    permission_classes = [permissions.IsAdminUser, IsStaffEditorPermission]
\ No newline at end of file
+    permission_classes = [permissions.IsAdminUser, IsStaffEditorPermission]
+
+
+class ReplicaReadMixin:
+    """
+    Serve this view's safe-method requests from a read replica when one is
+    configured and the user isn't pinned to the primary (aptech_python/db_router.py).
+    Set `replica_actions` on viewsets to limit it to some actions.
+    """
+    replica_actions = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # authenticates, so pinning can see the user
+        if request.method in permissions.SAFE_METHODS and (
+            self.replica_actions is None or getattr(self, "action", None) in self.replica_actions
+        ):
+            self._replica_context = read_from_replica(request.user)
+            self._replica_context.__enter__()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # also when the handler raised: the routing must not outlive the request
+            context = getattr(self, "_replica_context", None)
+            if context is not None:
+                self._replica_context = None
+                context.__exit__(None, None, None)
+
+
+class CompiledListMixin:
+    """
+    list() pages rendered by the compiled form of the view's serializer
+    (api/compiled.py): same JSON, built from .values() rows instead of
+    serializer and model instances.
+    """
+
+    def compiled_page(self, queryset):
+        serializer = compile_serializer(self.get_serializer_class())
+        page = self.paginate_queryset(serializer.values(queryset))
+        return self.get_paginated_response(serializer.render(page, self.get_serializer_context()))
+
+    def list(self, request, *args, **kwargs):
+        return self.compiled_page(self.filter_queryset(self.get_queryset()))
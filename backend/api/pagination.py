@@ -0,0 +1,197 @@
+import base64
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination, newest first by default.
+
+    The cursor is the (created_at, id) of the last row on the page, so the next
+    page is a `WHERE (created_at, id) < cursor` range scan on an index: page 500
+    costs the same as page 1 and no COUNT(*) is ever run.
+    """
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    ordering = ("-created_at", "-id")  # the last field must be unique
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset, view):
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        One page across several querysets with the same ordering fields (e.g.
+        hot + archived orders): each is cut at the cursor and limited on its
+        own, then the small results are merged. Merging needs every field to
+        share one direction.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(querysets[0], view)
+        self.fields = [f.lstrip("-") for f in ordering]
+        self.directions = [f.startswith("-") for f in ordering]
+        self.descending = self.directions[0]
+
+        rows = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*ordering)
+            position = self.decode_cursor(request, queryset.model)
+            if position is not None:
+                queryset = queryset.filter(self.after(position))
+            rows += list(queryset[: self.page_size + 1])
+        if len(querysets) > 1:
+            rows.sort(key=lambda row: [self.value(row, f) for f in self.fields], reverse=self.descending)
+
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_position = [self.value(rows[-1], f) for f in self.fields] if self.has_next else None
+        return rows
+
+    def after(self, position):
+        """Rows strictly past `position`, i.e. the tuple comparison spelled out as ORs."""
+        condition = Q()
+        for i, (field, descending) in enumerate(zip(self.fields, self.directions)):
+            equal = {f: v for f, v in zip(self.fields[:i], position[:i])}
+            condition |= Q(**equal, **{f"{field}__{'lt' if descending else 'gt'}": position[i]})
+        return condition
+
+    @staticmethod
+    def value(row, field):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(position) != len(self.fields):
+                raise ValueError(position)
+            return [self.field_value(model, f, v) for f, v in zip(self.fields, position)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def field_value(model, field, value):
+        try:
+            return model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            return value  # an annotation, e.g. search_rank; numbers survive the JSON round trip
+
+    def encode_cursor(self, position):
+        raw = json.dumps([
+            v if isinstance(v, (int, float)) else v.isoformat() if hasattr(v, "isoformat") else str(v)
+            for v in position
+        ])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+def estimate_count(queryset):
+    """
+    Roughly how many rows a queryset has, without counting them: the planner's
+    row estimate on Postgres, or an exact COUNT(*) elsewhere (dev databases).
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+class DefaultPagination(KeysetPagination):
+    """
+    Project-wide pagination (REST_FRAMEWORK["DEFAULT_PAGINATION_CLASS"]): the
+    same cursor pages as KeysetPagination, in whatever order the view's queryset
+    (or ?ordering=) asked for, with the primary key as the tie-breaker.
+    Orderings a cursor can't hold (relations, nullable columns, expressions)
+    fall back to newest first.
+    Pages never hold more than max_page_size rows. No count is run unless the
+    client asks for ?count=estimate, which is answered from planner
+    statistics where the database has them (see estimate_count()).
+    """
+    count_query_param = "count"
+
+    def get_ordering(self, queryset, view):
+        model = queryset.model
+        ordering = list(queryset.query.order_by) or list(model._meta.ordering)
+        if not ordering or not all(self.cursor_field(queryset, field) for field in ordering):
+            # unordered, or ordered by something a cursor can't hold: newest first, or by id
+            has_created_at = any(field.name == "created_at" for field in model._meta.concrete_fields)
+            ordering = ["-created_at"] if has_created_at else []
+        pk = model._meta.pk.name
+        ordering = [pk if field.lstrip("-") == "pk" else field for field in ordering]
+        if not any(field.lstrip("-") == pk for field in ordering):
+            ordering.append(f"-{pk}" if ordering and ordering[-1].startswith("-") else pk)
+        return ordering
+
+    @staticmethod
+    def cursor_field(queryset, field):
+        """
+        Whether `field` can go in a cursor: a non-null column of the model itself
+        (or an annotation). A relation orders by the related model's ordering,
+        not by the value a cursor would hold, and NULLs can't be compared with `<`.
+        """
+        if not isinstance(field, str):
+            return False
+        name = field.lstrip("-")
+        if name == "pk" or name in queryset.query.annotations:
+            return True
+        try:
+            model_field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return model_field.concrete and not model_field.is_relation and not model_field.null
+
+    def paginate_querysets(self, querysets, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "estimate" and len(querysets) == 1:
+            self.count = estimate_count(querysets[0])
+        return super().paginate_querysets(querysets, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {"count": self.count, **response.data}
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count"] = {"type": "integer", "description": "Estimate, with ?count=estimate"}
+        return schema
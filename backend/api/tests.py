@@ -1,3 +1,480 @@
-from django.test import TestCase
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.error import URLError
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.filters import OrderingFilter
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from accounts.models import CustomUser
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+from products.models import Product
+from restaurants.models import Category, Dish, FoodType, Menu, Restaurant
+from restaurants.serializers import DishSerializer, MenuSerializer
+from .compiled import compile_serializer
+from .images import CloudinaryStorage, LocalStorage, stash_url, upload_later
+from .pagination import DefaultPagination, KeysetPagination
 
 # Create your tests here.
+
+PAGE = 2
+PARAM = re.compile(r"<(?:\w+:)?(\w+)>|\(\?P<(\w+)>[^)]*\)")
+
+
+def _get_routes(patterns, prefix=""):
+    """(path, view) for every DRF url, with path/regex parameters left in."""
+    for pattern in patterns:
+        route = str(pattern.pattern).lstrip("^").rstrip("$").replace("\\", "")
+        if isinstance(pattern, URLResolver):
+            yield from _get_routes(pattern.url_patterns, prefix + route)
+        elif isinstance(pattern, URLPattern) and hasattr(pattern.callback, "cls") and "format" not in route:
+            yield prefix + route, pattern.callback
+
+
+class ListEndpointsAreBoundedTests(TestCase):
+    """Every GET endpoint returns at most max_page_size rows, however many exist."""
+    # analytics reports are bounded by their date range and ?limit= instead
+    skipped_prefixes = ("analytics/", "auth/", "swagger", "redoc", "admin/")
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_superuser(email="admin@example.com", password="pass")
+        CustomUser.objects.filter(pk=self.user.pk).update(role=CustomUser.Role.RESTAURANT_OWNER)
+        self.user.refresh_from_db()
+        self.restaurant = Restaurant.objects.create(owner=self.user, name="Mama Put")
+        food_types = [FoodType.objects.create(name=name) for name in ("Vegetarian", "Non-Vegetarian", "Vegan")]
+        self.customer = CustomUser.objects.create_user(email="customer@example.com", password="pass")
+        for i in range(PAGE + 1):
+            Restaurant.objects.create(name=f"Spot {i}")
+            Category.objects.create(name=f"Category {i}", restaurant=self.restaurant)
+            Menu.objects.create(name=f"Menu {i}", restaurant=self.restaurant)
+            dish = Dish.objects.create(restaurant=self.restaurant, name=f"Dish {i}", price=Decimal("3.00"), food_type=food_types[i])
+            Product.objects.create(title=f"Product {i}")
+            Order.objects.create(customer=self.customer, restaurant=self.restaurant, total_amount=dish.price)
+        self.client = APIClient()
+
+    def rows(self, data):
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return data.get("results", [])
+        return []
+
+    def test_no_list_endpoint_is_unbounded(self):
+        checked = set()
+        with mock.patch.object(KeysetPagination, "page_size", PAGE), \
+                mock.patch.object(KeysetPagination, "max_page_size", PAGE):
+            for route, view in _get_routes(get_resolver().url_patterns):
+                actions = getattr(view, "actions", None)  # viewsets
+                gets = "get" in actions if actions else "GET" in view.cls().allowed_methods
+                if route.startswith(self.skipped_prefixes) or not gets:
+                    continue
+                names = [a or b for a, b in PARAM.findall(route)]
+                if any(name != "restaurant_id" for name in names):
+                    continue  # detail routes
+                url = "/" + PARAM.sub(str(self.restaurant.pk), route)
+                for user in (self.user, self.customer):
+                    self.client.force_authenticate(user)
+                    response = self.client.get(url, {"page_size": 1000})
+                    if getattr(response, "streaming", False) or response.status_code != 200:
+                        continue
+                    self.assertLessEqual(len(self.rows(response.data)), PAGE, url)
+                    checked.add(url)
+        # the endpoints that used to return whole tables are among those checked
+        for url in ["/restaurants/dishes/", "/restaurants/categories/", "/restaurants/foodtypes/",
+                    "/restaurants/menus/public/", "/restaurants/all-restaurants/", "/orders/my-orders/",
+                    "/api/products/list_products/", "/api/products/alt_view/",
+                    f"/restaurants/menus/by-restaurant/{self.restaurant.pk}/"]:
+            self.assertIn(url, checked)
+
+    def test_pages_follow_the_requested_ordering_and_estimate_counts(self):
+        names, url = [], "/restaurants/dishes/?ordering=-name&page_size=2&count=estimate"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.data["count"], PAGE + 1)
+            names += [dish["name"] for dish in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(names, ["Dish 2", "Dish 1", "Dish 0"])
+        self.assertNotIn("count", self.client.get("/restaurants/dishes/").data)
+        self.assertEqual(DefaultPagination.max_page_size, 100)
+
+    def orderings(self, view, url, user):
+        """Every ?ordering= value the view's OrderingFilter takes, or [] if it doesn't page with DefaultPagination."""
+        request = Request(APIRequestFactory().get(url))
+        request.user = user
+        instance = view.cls(request=request, format_kwarg=None, args=(), kwargs={}, action="list")
+        if not hasattr(instance, "list") or OrderingFilter not in getattr(instance, "filter_backends", []) or \
+                not issubclass(instance.pagination_class or type(None), DefaultPagination):
+            return []
+        fields = OrderingFilter().get_valid_fields(instance.get_queryset(), instance, {"request": request})
+        return [f"{direction}{field}" for field, _ in fields for direction in ("", "-")]
+
+    def test_every_allowed_ordering_pages_to_the_end(self):
+        Category.objects.create(name="Loose")  # a null FK to order by
+        checked = set()
+        for route, view in _get_routes(get_resolver().url_patterns):
+            actions = getattr(view, "actions", None)
+            gets = "get" in actions if actions else "GET" in view.cls().allowed_methods
+            if PARAM.search(route) or route.startswith(self.skipped_prefixes) or not gets:
+                continue
+            for user in (self.user, self.customer):
+                self.client.force_authenticate(user)
+                for ordering in self.orderings(view, "/" + route, user):
+                    everything = self.client.get("/" + route, {"ordering": ordering, "page_size": 100})
+                    if everything.status_code != 200:
+                        continue  # not this user's endpoint
+                    seen, url = [], f"/{route}?ordering={ordering}&page_size={PAGE}"
+                    while url:
+                        response = self.client.get(url)
+                        self.assertEqual(response.status_code, 200, (url, response.data))
+                        seen += [JSONRenderer().render(row) for row in response.data["results"]]
+                        url = response.data["next"]
+                    everything = [JSONRenderer().render(row) for row in everything.data["results"]]
+                    self.assertEqual(sorted(seen), sorted(everything), (route, ordering))
+                    checked.add((route, ordering.lstrip("-")))
+        self.assertIn(("restaurants/categories/", "restaurant"), checked)
+        self.assertIn(("restaurants/dishes/", "price"), checked)
+
+
+class CompiledSerializerTests(TestCase):
+    """The compiled serializers render byte-for-byte what DRF renders."""
+
+    def setUp(self):
+        owner = CustomUser.objects.create_user(email="owner@example.com", password="pass")
+        customer = CustomUser.objects.create_user(email="customer@example.com", password="pass")
+        restaurant = Restaurant.objects.create(owner=owner, name="Mama Put", description="Jollof")
+        ownerless = Restaurant.objects.create(name="Spot")
+        food_type = FoodType.objects.create(name="Vegan")
+        categories = [Category.objects.create(name=f"Category {i}", restaurant=restaurant) for i in range(2)]
+        menu = Menu.objects.create(name="Lunch", restaurant=restaurant, description="Noon to 3")
+        Menu.objects.create(name="Dinner", restaurant=ownerless)
+        prices = [Decimal("3"), Decimal("4.5"), Decimal("1250.00")]
+        for i, price in enumerate(prices):
+            dish = Dish.objects.create(
+                restaurant=restaurant if i else ownerless, name=f"Dish {i}", price=price, food_type=food_type,
+                is_available=bool(i),
+            )
+            dish.categories.set(categories[:i])
+            if i:
+                dish.menus.add(menu)
+        dishes = list(Dish.objects.all())
+        for i in range(2):
+            order = Order.objects.create(customer=customer, restaurant=restaurant, total_amount=Decimal("9.50"))
+            for dish in dishes[:i + 1]:
+                OrderItem.objects.create(order=order, dish=dish, quantity=i + 2, price=dish.price)
+        Order.objects.create(customer=customer, restaurant=restaurant, total_amount=Decimal("0"))
+
+    def assertRendersLikeDRF(self, serializer_class, queryset, context=None):
+        compiled = compile_serializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+        self.assertEqual(JSONRenderer().render(compiled.render(compiled.values(queryset), context)), expected)
+
+    def test_dishes(self):
+        self.assertRendersLikeDRF(DishSerializer, Dish.objects.order_by("name"))
+
+    def test_orders_with_items(self):
+        self.assertRendersLikeDRF(OrderSerializer, Order.objects.order_by("created_at"))
+
+    def test_menus(self):
+        self.assertRendersLikeDRF(MenuSerializer, Menu.objects.order_by("name"))
+
+    def test_image_sizes(self):
+        Dish.objects.filter(name="Dish 1").update(dish_image="/media/d.png", image_variants="/media/d_{size}.webp")
+        Restaurant.objects.filter(name="Mama Put").update(image_variants="/media/r_{size}.webp")
+        context = {"request": Request(APIRequestFactory().get("/", {"image_size": "thumb"}))}
+        self.assertRendersLikeDRF(DishSerializer, Dish.objects.order_by("name"), context)
+        data = DishSerializer(Dish.objects.order_by("name"), many=True, context=context).data
+        self.assertEqual([dish["dish_image"] for dish in data], ["", "/media/d_thumb.webp", ""])
+        self.assertEqual(data[1]["restaurant"]["restaurant_image"], "/media/r_thumb.webp")
+        self.assertNotIn("image_variants", data[1])
+
+
+def _png(name="photo.png", size=(4, 4)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "orange").save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ImageUploadTests(TestCase):
+    """Uploads leave the request with image_status "pending" and land in the storage after commit."""
+
+    def setUp(self):
+        cache.clear()
+        self.media, self.tmp = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(shutil.rmtree, self.tmp)
+        settings = override_settings(
+            IMAGE_STORAGE="api.images.LocalStorage", IMAGE_UPLOAD_WORKERS=0, IMAGE_VARIANT_PROCESSES=0,
+            MEDIA_ROOT=self.media, IMAGE_UPLOAD_TMP_DIR=self.tmp,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.owner = CustomUser.objects.create_user(email="owner@example.com", password="pass")
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name="Mama Put")
+        self.food_type = FoodType.objects.create(name="Vegetarian")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def post(self, url, data, method="post", status=201):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = getattr(self.client, method)(url, data, format="multipart")
+        self.assertEqual(response.status_code, status, response.data)
+        self.assertEqual(response.data["image_status"], "pending")
+        self.assertEqual(len(os.listdir(self.tmp)), 1)  # stashed, not uploaded yet
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(os.listdir(self.tmp), [])
+        return response
+
+    def uploads(self, instance, field, *files):
+        """upload_later() each file in turn; returns their pending upload_image() calls, in order."""
+        uploads = []
+        for upload in files:
+            with self.captureOnCommitCallbacks() as callbacks:
+                upload_later(instance, field, upload, "menus")
+            with self.captureOnCommitCallbacks() as pending:
+                callbacks[-1]()
+            uploads.append(pending[-1])
+        return uploads
+
+    def test_failed_uploads_are_marked_failed(self):
+        with mock.patch.object(LocalStorage, "save", side_effect=OSError("disk full")):
+            response = self.post("/restaurants/menus/", {"name": "Lunch", "menu_image_upload": _png()})
+        menu = Menu.objects.get(pk=response.data["id"])
+        self.assertEqual((menu.image_status, menu.menu_image), ("failed", ""))
+
+    def test_only_the_latest_upload_lands(self):
+        menu = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+        older, newer = self.uploads(menu, "menu_image", _png("older.png"), _png("newer.gif"))
+        newer()
+        older()  # finishes last, but was replaced
+        menu.refresh_from_db()
+        self.assertEqual(menu.image_status, "ready")
+        self.assertTrue(menu.menu_image.endswith(".gif"))
+
+        older, newer = self.uploads(menu, "menu_image", _png("older.png"), _png("newer.jpg"))
+        newer()
+        with mock.patch.object(LocalStorage, "save", side_effect=OSError("disk full")):
+            older()
+        menu.refresh_from_db()
+        self.assertEqual(menu.image_status, "ready")
+        self.assertTrue(menu.menu_image.endswith(".jpg"))
+
+    def test_rolled_back_uploads_leave_no_temporary_file(self):
+        menu = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                upload_later(menu, "menu_image", _png(), "menus")
+                raise RuntimeError
+        self.assertEqual((callbacks, os.listdir(self.tmp)), ([], []))
+        menu.refresh_from_db()
+        self.assertEqual((menu.image_status, menu.menu_image), ("ready", ""))
+
+    def test_size_variants(self):
+        response = self.post("/restaurants/dishes/", {
+            "name": "Jollof", "price": "5.00", "food_type": str(self.food_type.pk),
+            "is_available": "true", "dish_image_upload": _png(size=(2000, 1000)),
+        })
+        dish = Dish.objects.get(pk=response.data["id"])
+        self.assertRegex(dish.image_variants, r"^/media/aptech_python_onlineFood_delivery/dishes/\w+_\{size\}\.webp$")
+        for size, width in (("thumb", 160), ("card", 480), ("full", 1280)):
+            with Image.open(os.path.join(self.media, dish.image_variants.format(size=size)[len("/media/"):])) as image:
+                self.assertEqual((image.format, image.size), ("WEBP", (width, width // 2)))
+
+        listed = self.client.get("/restaurants/dishes/", {"image_size": "thumb"}).data["results"][0]
+        self.assertEqual(listed["dish_image"], dish.image_variants.format(size="thumb"))
+        self.assertNotIn("image_variants", listed)
+        for params in ({}, {"image_size": "huge"}):
+            self.assertEqual(self.client.get("/restaurants/dishes/", params).data["results"][0]["dish_image"], dish.dish_image)
+
+    def test_images_that_cannot_be_processed_keep_the_original(self):
+        upload = SimpleUploadedFile("photo.png", b"not an image", content_type="image/png")
+        menu = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+        with self.captureOnCommitCallbacks(execute=True):
+            upload_later(menu, "menu_image", upload, "menus")
+        menu.refresh_from_db()
+        self.assertEqual((menu.image_status, menu.image_variants), ("ready", ""))
+        self.assertTrue(menu.menu_image.endswith(".png"))
+
+
+class _ImageHost(BaseHTTPRequestHandler):
+    pages = {
+        "/photo.png": ("image/png", _png().read()),
+        "/page.html": ("text/html", b"<html></html>"),
+        "/huge.png": ("image/png", b"\0" * 4096),
+    }
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "file:///etc/passwd")
+            self.end_headers()
+            return
+        content_type, body = self.pages[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.end_headers()  # no Content-Length: the size cap has to hold while reading
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageFetchTests(TestCase):
+    """stash_url() fetches public http(s) images only, and only up to IMAGE_FETCH_MAX_BYTES."""
+
+    def setUp(self):
+        self.media, self.tmp = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(shutil.rmtree, self.tmp)
+        settings = override_settings(MEDIA_ROOT=self.media, IMAGE_UPLOAD_TMP_DIR=self.tmp, IMAGE_FETCH_MAX_BYTES=1024)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def serve(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHost)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    def test_private_hosts_and_other_schemes_are_refused(self):
+        host = self.serve()
+        for url in [
+            f"{host}/photo.png", "http://localhost/photo.png", "http://169.254.169.254/latest/meta-data/",
+            "http://[::1]/photo.png", "http://10.0.0.8/photo.png", "file:///etc/passwd", "/media/../../etc/passwd",
+        ]:
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                stash_url(url)
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_public_images_are_fetched_within_the_size_cap(self):
+        host = self.serve()
+        with mock.patch("api.images._is_public", return_value=True):  # 127.0.0.1 standing in for a public host
+            path = stash_url(f"{host}/photo.png")
+            with Image.open(path) as image:
+                self.assertEqual(image.format, "PNG")
+            os.remove(path)
+            for page in ["/page.html", "/huge.png"]:
+                with self.subTest(page=page), self.assertRaises(ValueError):
+                    stash_url(host + page)
+            with self.assertRaises(URLError):  # redirects only go to http(s)
+                stash_url(f"{host}/redirect")
+        self.assertEqual(os.listdir(self.tmp), [])
+
+
+class ImageUploadPoolTests(TransactionTestCase):
+    def test_uploads_run_on_the_pool_after_commit(self):
+        media, tmp = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.addCleanup(shutil.rmtree, tmp)
+        restaurant = Restaurant.objects.create(name="Mama Put")
+        with override_settings(IMAGE_STORAGE="api.images.LocalStorage", IMAGE_UPLOAD_WORKERS=2, MEDIA_ROOT=media, IMAGE_UPLOAD_TMP_DIR=tmp):
+            with transaction.atomic():
+                upload_later(restaurant, "restaurant_image", _png(), "restaurants")
+                self.assertEqual(Restaurant.objects.get().image_status, "pending")
+            deadline = time.monotonic() + 10
+            while Restaurant.objects.get().image_status == "pending" and time.monotonic() < deadline:
+                time.sleep(0.05)
+        restaurant.refresh_from_db()
+        self.assertEqual(restaurant.image_status, "ready")
+        self.assertTrue(restaurant.restaurant_image.startswith("/media/restaurants/"))
+        self.assertTrue(restaurant.image_variants.endswith("_{size}.webp"))  # resized on the process pool
+
+
+class DirectUploadTests(TestCase):
+    """Signed uploads go straight to the storage (LocalStorage's stand-in endpoint here) and are confirmed after."""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(
+            IMAGE_STORAGE="api.images.LocalStorage", IMAGE_UPLOAD_WORKERS=0, IMAGE_VARIANT_PROCESSES=0, MEDIA_ROOT=self.media
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.owner = CustomUser.objects.create_user(email="owner@example.com", password="pass")
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name="Mama Put")
+        self.dish = Dish.objects.create(
+            restaurant=self.restaurant, name="Jollof", price=Decimal("5.00"), food_type=FoodType.objects.create(name="Vegetarian")
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def sign(self, target, pk):
+        response = self.client.post("/api/uploads/sign/", {"target": target, "id": str(pk)}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def upload(self, signed, **fields):
+        storage = APIClient()  # the client talks to the storage without our credentials
+        response = storage.post(signed["upload_url"], {**signed["fields"], **fields, "file": _png()}, format="multipart")
+        return response
+
+    def confirm(self, signed, result):
+        return self.client.post("/api/uploads/confirm/", {"token": signed["token"], "result": result}, format="json")
+
+    def test_sign_upload_and_confirm(self):
+        signed = self.sign("dish", self.dish.pk)
+        self.assertTrue(signed["upload_url"].endswith("/api/uploads/local/"))
+        result = self.upload(signed)
+        self.assertEqual(result.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.confirm(signed, result.data)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.dish.refresh_from_db()
+        self.assertEqual((self.dish.dish_image, self.dish.image_status), (response.data["url"], "ready"))
+        self.assertTrue(os.path.exists(os.path.join(self.media, self.dish.dish_image[len("/media/"):])))
+        thumb = self.dish.image_variants.format(size="thumb")  # made from the stored file after the response
+        self.assertTrue(os.path.exists(os.path.join(self.media, thumb[len("/media/"):])))
+
+        profile = self.sign("profile", self.owner.profile.pk)
+        self.assertEqual(self.confirm(profile, self.upload(profile).data).status_code, 200)
+        self.owner.profile.refresh_from_db()
+        self.assertTrue(self.owner.profile.profile_picture.endswith(".png"))
+
+    def test_only_owners_sign_and_confirm(self):
+        signed = self.sign("restaurant", self.restaurant.pk)
+        result = self.upload(signed).data
+        self.client.force_authenticate(CustomUser.objects.create_user(email="other@example.com", password="pass"))
+        self.assertEqual(self.client.post("/api/uploads/sign/", {"target": "dish", "id": str(self.dish.pk)}).status_code, 403)
+        self.assertEqual(self.confirm(signed, result).status_code, 403)
+
+    def test_tampered_uploads_are_rejected(self):
+        signed = self.sign("menu", Menu.objects.create(name="Lunch", restaurant=self.restaurant).pk)
+        self.assertEqual(self.upload(signed, public_id="somewhere-else").status_code, 401)
+        result = self.upload(signed).data
+        self.assertEqual(self.confirm(signed, {**result, "version": result["version"] + 1}).status_code, 400)
+        self.assertEqual(self.confirm({**signed, "token": signed["token"] + "x"}, result).status_code, 400)
+        other = self.sign("menu", Menu.objects.get().pk)
+        self.assertEqual(self.confirm(other, result).status_code, 400)  # someone else's upload
+        with override_settings(IMAGE_UPLOAD_SIGNATURE_TTL=-1):
+            self.assertEqual(self.confirm(signed, result).status_code, 400)
+
+    def test_cloudinary_results_are_checked_against_its_response_signature(self):
+        import cloudinary.utils
+
+        storage = CloudinaryStorage()
+        signed = storage.signed_upload("dishes", "abc")
+        self.assertEqual(signed["fields"]["public_id"], "abc")
+        result = {"public_id": "dishes/abc", "version": 1700000000}
+        result["signature"] = cloudinary.utils.api_sign_request(dict(result), cloudinary.config().api_secret)
+        self.assertIn("dishes/abc", storage.confirm("dishes", "abc", result))
+        with self.assertRaises(ValueError):
+            storage.confirm("dishes", "abc", {**result, "version": 1})
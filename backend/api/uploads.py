@@ -0,0 +1,145 @@
+"""
+Direct-to-storage image uploads: the bytes go from the client to the image
+storage (api/images.py), never through a Django worker.
+
+1. POST /api/uploads/sign/ {"target": "dish", "id": "<uuid>"}
+   -> {"upload_url", "fields", "token", "expires_in"}
+2. The client POSTs the file to upload_url as multipart: `fields` plus `file`.
+3. POST /api/uploads/confirm/ {"token": "...", "result": <the storage's JSON response>}
+   -> the record's image URL is set and its image_status is "ready"; its
+   size variants are made from the stored file after the response.
+
+The token is ours (signed, short-lived) and names the user, record and
+storage path, so confirm only attaches the upload that was signed for that
+record. The storage's own signature on `result` proves the upload happened.
+"""
+import uuid
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, serializers, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .images import ImageStatus, LocalStorage, get_storage, variants_later
+
+# target -> (model, image field, storage folder)
+TARGETS = {
+    "dish": ("restaurants.Dish", "dish_image", "aptech_python_onlineFood_delivery/dishes"),
+    "menu": ("restaurants.Menu", "menu_image", "aptech_python_onlineFood_delivery/menus"),
+    "restaurant": ("restaurants.Restaurant", "restaurant_image", "aptech_python_onlineFood_delivery/restaurant_image"),
+    "profile": ("accounts.Profile", "profile_picture", "aptech_python_onlineFood_delivery/profile_picture"),
+}
+TOKEN_SALT = "api.uploads"
+
+
+def _get_target(user, target, pk):
+    """The record whose image `user` wants to change, if they may."""
+    instance = get_object_or_404(apps.get_model(TARGETS[target][0]), pk=pk)
+    if hasattr(instance, "user_id"):  # profiles
+        owner_id = instance.user_id
+    elif hasattr(instance, "owner_id"):  # restaurants
+        owner_id = instance.owner_id
+    else:  # dishes and menus
+        owner_id = instance.restaurant.owner_id
+    if owner_id != user.pk and not user.is_superuser:
+        raise PermissionDenied("You can't change this image.")
+    return instance
+
+
+class UploadSignSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=list(TARGETS))
+    id = serializers.UUIDField()
+
+
+class UploadConfirmSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    result = serializers.DictField()
+
+    def validate_token(self, token):
+        try:
+            return signing.loads(token, salt=TOKEN_SALT, max_age=settings.IMAGE_UPLOAD_SIGNATURE_TTL)
+        except signing.SignatureExpired:
+            raise serializers.ValidationError("This upload has expired; sign a new one.")
+        except signing.BadSignature:
+            raise serializers.ValidationError("Invalid upload token.")
+
+
+class SignedUploadView(generics.GenericAPIView):
+    """Upload parameters for one record's image (valid for IMAGE_UPLOAD_SIGNATURE_TTL seconds)."""
+    serializer_class = UploadSignSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data["target"]
+        instance = _get_target(request.user, target, serializer.validated_data["id"])
+        public_id = uuid.uuid4().hex
+        signed = get_storage().signed_upload(TARGETS[target][2], public_id)
+        token = signing.dumps(
+            {"user": str(request.user.pk), "target": target, "id": str(instance.pk), "public_id": public_id}, salt=TOKEN_SALT
+        )
+        return Response({
+            "upload_url": request.build_absolute_uri(signed["url"]),
+            "fields": signed["fields"],
+            "token": token,
+            "expires_in": settings.IMAGE_UPLOAD_SIGNATURE_TTL,
+        }, status=status.HTTP_200_OK)
+
+
+class ConfirmUploadView(generics.GenericAPIView):
+    """Attach a finished direct upload to the record it was signed for."""
+    serializer_class = UploadConfirmSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        signed = serializer.validated_data["token"]
+        if signed["user"] != str(request.user.pk):
+            raise PermissionDenied("This upload was signed for someone else.")
+        instance = _get_target(request.user, signed["target"], signed["id"])
+        _, field, folder = TARGETS[signed["target"]]
+        try:
+            url = get_storage().confirm(folder, signed["public_id"], serializer.validated_data["result"])
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        setattr(instance, field, url)
+        instance.image_status = ImageStatus.READY
+        instance.image_upload = None  # an upload still in flight through the API must not replace this one
+        update_fields = [field, "image_status", "image_upload"]
+        if hasattr(instance, "image_variants"):
+            instance.image_variants = ""  # the old image's; the new ones follow from variants_later()
+            update_fields.append("image_variants")
+        instance.save(update_fields=update_fields)  # post_save keeps caches in step
+        variants_later(instance, field, folder)
+        return Response(
+            {"target": signed["target"], "id": instance.pk, "url": url, "image_status": instance.image_status},
+            status=status.HTTP_200_OK,
+        )
+
+
+class LocalStorageUploadView(APIView):
+    """
+    LocalStorage's stand-in for the provider's upload endpoint, for local runs
+    and tests. Only answers when IMAGE_STORAGE is LocalStorage.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        storage = get_storage()
+        if not isinstance(storage, LocalStorage):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": {"message": "Missing file."}}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = storage.receive(request.data, upload)
+        except ValueError as exc:
+            return Response({"error": {"message": str(exc)}}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(result, status=status.HTTP_200_OK)
@@ -1,9 +1,13 @@
 from django.urls import path;
 from . import views;
+from . import uploads
 from rest_framework.authtoken.views import obtain_auth_token;
 
 urlpatterns = [
     path('auth/', obtain_auth_token),
     path('', views.api_home),
     path('add_products/', views.add_products),
+    path('uploads/sign/', uploads.SignedUploadView.as_view(), name='upload-sign'),
+    path('uploads/confirm/', uploads.ConfirmUploadView.as_view(), name='upload-confirm'),
+    path('uploads/local/', uploads.LocalStorageUploadView.as_view(), name='local-storage-upload'),
 ]
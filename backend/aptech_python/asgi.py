@@ -2,6 +2,9 @@
 ASGI config for aptech_python project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Long-lived streams such as the restaurant order feed
+(/orders/restaurant-orders/stream/) need this app, e.g.
+``uvicorn aptech_python.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
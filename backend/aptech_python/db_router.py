@@ -0,0 +1,119 @@
+"""
+Read-replica routing.
+
+Writes always go to "default". Reads go to a replica only inside
+read_from_replica(), which views opt into through api.mixins.ReplicaReadMixin,
+so everything else keeps reading the primary. A user who just wrote something
+is pinned to the primary for REPLICA_PIN_SECONDS (read-your-writes), and a
+replica lagging more than REPLICA_MAX_LAG_SECONDS is skipped.
+
+Replicas come from DATABASE_REPLICA_URLS (see settings); any Django backend
+works, so several SQLite files are enough to try this locally.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = ContextVar("read_alias", default=None)
+_lag_checked = {}  # alias -> (checked_at, lag seconds)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary, never from migrate
+        return False if db in settings.REPLICA_DATABASES else None
+
+
+def _pin_key(user):
+    return f"db-pin:{user.pk}"
+
+
+def pin_to_primary(user):
+    cache.set(_pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return bool(user and user.is_authenticated and cache.get(_pin_key(user)))
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind, checked at most every few seconds per process; inf if unreachable."""
+    checked_at, lag = _lag_checked.get(alias, (0, 0.0))
+    if time.monotonic() - checked_at < settings.REPLICA_LAG_CHECK_SECONDS:
+        return lag
+    try:
+        connection = connections[alias]
+        lag = 0.0
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )
+                lag = float(cursor.fetchone()[0])
+    except Exception:
+        lag = float("inf")
+    _lag_checked[alias] = (time.monotonic(), lag)
+    return lag
+
+
+def choose_replica(user=None):
+    """A healthy replica alias for this user's reads, or None to stay on the primary."""
+    if not settings.REPLICA_DATABASES or is_pinned(user):
+        return None
+    healthy = [a for a in settings.REPLICA_DATABASES if replica_lag(a) <= settings.REPLICA_MAX_LAG_SECONDS]
+    return random.choice(healthy) if healthy else None
+
+
+@contextmanager
+def read_from_replica(user=None):
+    token = _read_alias.set(choose_replica(user))
+    try:
+        yield _read_alias.get()
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """Reads go to the primary, even inside read_from_replica(); for results that outlive the request."""
+    token = _read_alias.set(None)
+    try:
+        yield DEFAULT_DB_ALIAS
+    finally:
+        _read_alias.reset(token)
+
+
+class ReadYourWritesMiddleware:
+    """Pins a user to the primary for a moment after any successful write request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # DRF copies the authenticated (JWT) user back onto the Django request
+        user = getattr(request, "user", None)
+        if (
+            settings.REPLICA_DATABASES
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            pin_to_primary(user)
+        return response
@@ -14,6 +14,7 @@ from pathlib import Path
 from datetime import timedelta
 import dj_database_url
 import os
+import tempfile
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -97,6 +98,7 @@ INSTALLED_APPS = [
     'restaurants',
     'accounts',
     'orders',
+    'analytics',
     
 ]
 
@@ -113,6 +115,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'aptech_python.db_router.ReadYourWritesMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -158,6 +161,37 @@ DATABASES = {
     )
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_URLS="postgres://replica-1/db,postgres://replica-2/db"
+# (sqlite:///... URLs work for trying it locally). Routing: aptech_python/db_router.py
+REPLICA_DATABASES = []
+for i, url in enumerate(u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()):
+    alias = f"replica{i + 1}"
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600, ssl_require=not url.startswith("sqlite"))
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["aptech_python.db_router.ReplicaRouter"]
+REPLICA_PIN_SECONDS = 5  # read-your-writes window after a user's write
+REPLICA_MAX_LAG_SECONDS = 2  # replicas further behind than this are skipped
+REPLICA_LAG_CHECK_SECONDS = 5
+
+# Shared cache in production (REDIS_URL); per-process locmem plus an on-disk
+# cart cache locally, so carts (orders/cart_store.py) outlive a restart either way.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL},
+        "carts": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL, "KEY_PREFIX": "carts"},
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "carts": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CART_CACHE_DIR", BASE_DIR / ".cache" / "carts"),
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -197,6 +231,10 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# uploaded images when IMAGE_STORAGE is api.images.LocalStorage
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / "media"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -250,6 +288,8 @@ REST_FRAMEWORK = {
         "django_filters.rest_framework.DjangoFilterBackend",
         "rest_framework.filters.OrderingFilter",
     ],
+    # cursor pages, no COUNT(*); see api/pagination.py
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.DefaultPagination",
 }
 
 
@@ -266,6 +306,54 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=90)
 }
 
+# Idempotency-Key support on order creation / checkout (orders/idempotency.py)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_WAIT_SECONDS = 10  # how long a concurrent duplicate waits on the first request
+IDEMPOTENCY_LEASE = timedelta(seconds=60)  # a request still running after this (it crashed) loses its key to a retry
+
+# Live order feed (orders/events.py). Use "orders.events.PostgresBroker" when
+# more than one ASGI worker serves the feed.
+ORDER_EVENTS_BROKER = os.getenv("ORDER_EVENTS_BROKER", "orders.events.InProcessBroker")
+ORDER_EVENTS_HEARTBEAT_SECONDS = 15
+
+# delivered/cancelled orders older than this move to the archive tables (archive_orders command)
+ORDER_ARCHIVE_AFTER_DAYS = 90
+
+# cached carts, written to Cart/CartItem at checkout and by the flush_carts command; the
+# cache has to be Redis, file-based or (single process) locmem, see orders/checks.py
+CART_CACHE_ALIAS = "carts"
+CART_CACHE_TTL = 60 * 60 * 24 * 30
+CART_LOCK_TIMEOUT = 5  # seconds a cart lock lives if its holder dies
+CART_LOCK_WAIT_SECONDS = 3
+CART_TOKEN_COOKIE = "cart_token"  # guest carts, merged into the user's cart at login
+CART_ANONYMOUS_MAX_AGE = 60 * 60 * 24 * 14  # guest carts untouched this long are purged (purge_anonymous_carts)
+
+# versioned response cache for the public catalogue endpoints (restaurants/catalog_cache.py)
+CATALOG_CACHE_ENABLED = True
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TTL = 60 * 60
+
+# full-menu snapshots (restaurants/menu_snapshot.py) are rebuilt on this many threads after catalogue writes (0: inline on commit)
+MENU_SNAPSHOT_WORKERS = int(os.getenv("MENU_SNAPSHOT_WORKERS", "1"))
+
+# dish search (restaurants/search.py): index hits ranked per query, and most results returned on SQLite
+DISH_SEARCH_CANDIDATES = 500
+DISH_SEARCH_MAX_RESULTS = 200
+
+# image uploads run after the response, on a thread pool (api/images.py);
+# "api.images.LocalStorage" keeps them on local disk instead of Cloudinary
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "api.images.CloudinaryStorage")
+IMAGE_UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "4"))  # 0: upload inline on commit
+IMAGE_UPLOAD_TMP_DIR = os.getenv("IMAGE_UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "image-uploads"))
+IMAGE_UPLOAD_SIGNATURE_TTL = 15 * 60  # seconds a signed direct upload (api/uploads.py) stays usable
+IMAGE_FETCH_MAX_BYTES = 10 * 1024 * 1024  # images fetched by URL (dish imports), public hosts only
+
+# restaurant, dish and menu images also get these WebP size variants (longest side, px),
+# picked by API clients with ?image_size=; resized on a process pool (0: in the upload worker)
+IMAGE_VARIANTS = {"thumb": 160, "card": 480, "full": 1280}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_PROCESSES = int(os.getenv("IMAGE_VARIANT_PROCESSES", "2"))
+
 SWAGGER_SETTINGS = {
     "SECURITY_DEFINITIONS": {
         "Bearer": {"type": "apiKey", "name": "Authorization", "in": "header"}
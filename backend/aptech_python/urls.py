@@ -43,6 +43,7 @@ urlpatterns = [
     path('user/', include('accounts.urls')),
     path('restaurants/', include('restaurants.urls')),
     path("orders/", include("orders.urls")),
+    path("analytics/", include("analytics.urls")),
     
     path('auth/', include('dj_rest_auth.urls')),
     path('auth/registration/', include('dj_rest_auth.registration.urls')),
@@ -1,13 +1,43 @@
+from django import forms
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, IdempotencyKey, ArchivedOrder, ArchivedOrderItem
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
 
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = "__all__"
+        # posted back, so Order.clean() catches status changes made since the page loaded
+        widgets = {"version": forms.HiddenInput}
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ("id", "customer", "restaurant", "status", "total_amount", "created_at")
     list_filter = ("status", "restaurant")
     date_hierarchy = "created_at"
-    inlines = [OrderItemInline]
\ No newline at end of file
+    inlines = [OrderItemInline]
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ("key", "status_code", "expires_at")
+    readonly_fields = ("key", "request_hash", "status_code", "response", "locked_until", "expires_at")
+
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "customer", "restaurant", "status", "total_amount", "created_at", "archived_at")
+    list_filter = ("status",)
+    date_hierarchy = "created_at"
+    inlines = [ArchivedOrderItemInline]
@@ -0,0 +1,65 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import Order, OrderItem, Transaction, ArchivedOrder, ArchivedOrderItem
+
+ARCHIVABLE_STATUSES = [Order.Status.DELIVERED, Order.Status.CANCELLED]
+
+
+def archive_batch(cutoff, batch_size=500):
+    """
+    Move up to `batch_size` finished orders placed before `cutoff` into the
+    archive tables. One short transaction per batch; rows another worker is
+    already archiving are skipped rather than waited on. Returns rows moved.
+    """
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff)
+            .order_by("created_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+
+        orders = Order.objects.filter(id__in=ids).select_related("transaction")
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.id,
+                customer_id=order.customer_id,
+                restaurant_id=order.restaurant_id,
+                status=order.status,
+                total_amount=order.total_amount,
+                item_count=order.item_count,
+                version=order.version,
+                created_at=order.created_at,
+                transaction_reference=getattr(getattr(order, "transaction", None), "reference", ""),
+                transaction_status=getattr(getattr(order, "transaction", None), "status", ""),
+            )
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create(
+            [
+                ArchivedOrderItem(id=pk, order_id=order_id, dish_id=dish_id, dish_name=dish_name, quantity=quantity, price=price)
+                for pk, order_id, dish_id, dish_name, quantity, price in OrderItem.objects.filter(order_id__in=ids)
+                .values_list("id", "order_id", "dish_id", "dish__name", "quantity", "price")
+            ],
+            batch_size=1000,
+        )
+        # children first so every delete is a plain DELETE ... WHERE IN
+        Transaction.objects.filter(order_id__in=ids).delete()
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(older_than_days, batch_size=500, max_batches=None):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+    return moved
@@ -0,0 +1,407 @@
+"""
+Cache-backed carts with write-behind persistence.
+
+Each user's cart lives in the "carts" cache (settings.CART_CACHE_ALIAS) as one
+compact JSON blob, so reading and editing a cart never touches the database.
+Cart/CartItem are only written when the blob is flushed: at checkout, or by
+the periodic `flush_carts` command for carts changed since their last flush.
+A blob that is missing (evicted, or a fresh locmem cache after a restart) is
+rebuilt from the last flushed copy in the database. Production points the
+cache at Redis and local runs use a file cache, so unflushed edits survive
+worker restarts as well.
+
+Carts belong to an "owner": a user id, or "anon:<token>" for a guest cart
+keyed by the device/session token the cart endpoints hand out. Guest carts are
+merged into the user's cart at login (merge_anonymous_cart).
+
+Cart locks and the set of carts waiting for a flush have to be shared by every
+worker, so they depend on the backend: Redis uses SET NX locks and a Redis set,
+a file cache uses O_EXCL lock files and one marker file per dirty cart, and
+locmem (a single process) uses cache.add() and an in-process set. Other
+backends are rejected at startup (orders.checks).
+"""
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from restaurants.models import Dish
+from .models import Cart, CartItem
+from .services import apply_cart_operations, checkout_cart, merge_carts
+
+DIRTY_KEY = "carts:dirty"
+DIRTY_BATCH = 500
+CENT = Decimal("0.01")
+ANON_PREFIX = "anon:"
+TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+class CartBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This cart is being updated by another request, try again."
+    default_code = "cart_busy"
+
+
+class CartState:
+    """One cart as stored in the cache: lines keyed by dish id, in the order they were added."""
+
+    def __init__(self, cart_id, lines=None, dirty=False):
+        self.id = cart_id
+        self.lines = lines or {}  # dish_id -> [item_id, dish_name, quantity, price]
+        self.dirty = dirty
+
+    def dumps(self):
+        return json.dumps({
+            "id": self.id.hex,
+            "d": self.dirty,
+            "i": [[item_id.hex, dish_id.hex, name, qty, str(price)] for dish_id, (item_id, name, qty, price) in self.lines.items()],
+        }, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, blob):
+        data = json.loads(blob)
+        lines = {
+            uuid.UUID(dish_id): [uuid.UUID(item_id), name, qty, Decimal(price)]
+            for item_id, dish_id, name, qty, price in data["i"]
+        }
+        return cls(uuid.UUID(data["id"]), lines, data["d"])
+
+
+def _cache():
+    return caches[settings.CART_CACHE_ALIAS]
+
+
+def _key(owner):
+    return f"cart:{owner}"
+
+
+def anonymous_owner(token):
+    return f"{ANON_PREFIX}{token}"
+
+
+def owner_for(request):
+    """(owner, new_token): the request's user, or its guest token, minting one if it has none."""
+    if request.user.is_authenticated:
+        return str(request.user.pk), None
+    token = request.headers.get("X-Cart-Token") or request.COOKIES.get(settings.CART_TOKEN_COOKIE)
+    if token and TOKEN_RE.match(token):
+        return anonymous_owner(token), None
+    token = secrets.token_urlsafe(24)
+    return anonymous_owner(token), token
+
+
+def _lookup(owner):
+    """Cart filter kwargs for an owner."""
+    if owner.startswith(ANON_PREFIX):
+        return {"token": owner[len(ANON_PREFIX):]}
+    return {"user_id": owner}
+
+
+def _file_dir(*parts):
+    """A directory next to the file cache's own files."""
+    path = os.path.join(os.fspath(settings.CACHES[settings.CART_CACHE_ALIAS]["LOCATION"]), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _try_lock(cache, key):
+    if not isinstance(cache, FileBasedCache):
+        # SET NX on Redis; locmem's add() holds the cache's own lock
+        return cache.add(key, 1, settings.CART_LOCK_TIMEOUT)
+    # FileBasedCache.add() is has_key() then set(); creating the lock file is the atomic step
+    path = os.path.join(_file_dir("locks"), hashlib.md5(key.encode()).hexdigest())
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        pass
+    try:
+        if time.time() - os.path.getmtime(path) > settings.CART_LOCK_TIMEOUT:
+            os.remove(path)  # its holder died; take it on the next try
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def _unlock(cache, key):
+    if not isinstance(cache, FileBasedCache):
+        cache.delete(key)
+        return
+    try:
+        os.remove(os.path.join(_file_dir("locks"), hashlib.md5(key.encode()).hexdigest()))
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def _locked(name):
+    """Short-lived lock shared by every worker; held at most CART_LOCK_TIMEOUT seconds if its holder dies."""
+    cache, key = _cache(), f"lock:{name}"
+    deadline = time.monotonic() + settings.CART_LOCK_WAIT_SECONDS
+    while not _try_lock(cache, key):
+        if time.monotonic() > deadline:
+            raise CartBusy()
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        _unlock(cache, key)
+
+
+_local_dirty = set()  # locmem carts live in this process only, and so does their dirty set
+_local_dirty_lock = threading.Lock()
+
+
+def _redis_client(cache):
+    key = cache.make_and_validate_key(DIRTY_KEY)
+    return key, cache._cache.get_client(key, write=True)
+
+
+def _add_dirty(owners):
+    """Queue owners for the next flush_dirty_carts(); O(1) per owner and no lock."""
+    cache = _cache()
+    if isinstance(cache, RedisCache):
+        key, client = _redis_client(cache)
+        client.sadd(key, *owners)
+    elif isinstance(cache, FileBasedCache):
+        directory = _file_dir("dirty")
+        for owner in owners:
+            with open(os.path.join(directory, hashlib.md5(owner.encode()).hexdigest()), "w") as marker:
+                marker.write(owner)
+    else:
+        with _local_dirty_lock:
+            _local_dirty.update(owners)
+
+
+def _dirty_owners():
+    """
+    Yield every owner queued so far. Owners stay queued until _done_dirty() after
+    their flush, so a failed or interrupted run leaves them for the next one.
+    """
+    cache = _cache()
+    if isinstance(cache, RedisCache):
+        key, client = _redis_client(cache)
+        for owner in client.sscan_iter(key, count=DIRTY_BATCH):
+            yield owner.decode()
+    elif isinstance(cache, FileBasedCache):
+        directory = _file_dir("dirty")
+        for name in os.listdir(directory):
+            try:
+                with open(os.path.join(directory, name)) as marker:
+                    owner = marker.read()
+            except FileNotFoundError:
+                continue  # flushed by a concurrent run
+            if owner:  # empty while its writer is still filling it in
+                yield owner
+    else:
+        with _local_dirty_lock:
+            owners = list(_local_dirty)
+        yield from owners
+
+
+def _done_dirty(owner):
+    """Dequeue a flushed owner. The caller holds the cart lock, so no edit can have queued it again since."""
+    cache = _cache()
+    if isinstance(cache, RedisCache):
+        key, client = _redis_client(cache)
+        client.srem(key, owner)
+    elif isinstance(cache, FileBasedCache):
+        try:
+            os.remove(os.path.join(_file_dir("dirty"), hashlib.md5(owner.encode()).hexdigest()))
+        except FileNotFoundError:
+            pass
+    else:
+        with _local_dirty_lock:
+            _local_dirty.discard(owner)
+
+
+def _load_from_db(owner):
+    cart_id = Cart.objects.filter(**_lookup(owner)).values_list("id", flat=True).first()
+    if cart_id is None:
+        return CartState(uuid.uuid4())  # not written until the first flush
+    rows = CartItem.objects.filter(cart_id=cart_id).values_list("id", "dish_id", "dish__name", "quantity", "price")
+    return CartState(cart_id, {dish_id: [pk, name, qty, price] for pk, dish_id, name, qty, price in rows})
+
+
+def _ttl(owner):
+    return settings.CART_ANONYMOUS_MAX_AGE if owner.startswith(ANON_PREFIX) else settings.CART_CACHE_TTL
+
+
+def _load(owner):
+    cache = _cache()
+    blob = cache.get(_key(owner))
+    if blob is None:
+        state = _load_from_db(owner)
+        # add(), not set(): a writer holding the cart lock may have stored a newer blob meanwhile
+        cache.add(_key(owner), state.dumps(), _ttl(owner))
+        blob = cache.get(_key(owner))
+        if blob is None:
+            return state  # evicted straight away
+    return CartState.loads(blob)
+
+
+def _store(owner, state):
+    _cache().set(_key(owner), state.dumps(), _ttl(owner))
+
+
+def _mark_dirty(owner, state):
+    if not state.dirty:
+        state.dirty = True
+        _add_dirty([owner])
+    _store(owner, state)
+
+
+def cart_payload(owner, state):
+    """Same JSON as CartSerializer(cart).data for the flushed cart."""
+    items = [
+        {
+            "id": str(item_id),
+            "dish": str(dish_id),
+            "dish_name": name,
+            "quantity": qty,
+            "price": str(price.quantize(CENT)),
+            "subtotal": str((price * qty).quantize(CENT)),
+        }
+        for dish_id, (item_id, name, qty, price) in state.lines.items()
+    ]
+    return {
+        "id": str(state.id),
+        "user": None if owner.startswith(ANON_PREFIX) else owner,
+        "items": items,
+        "total_amount": str(sum((line[3] * line[2] for line in state.lines.values()), Decimal("0")).quantize(CENT)),
+        "item_count": sum(line[2] for line in state.lines.values()),
+    }
+
+
+def get_cart(owner):
+    return cart_payload(owner, _load(owner))
+
+
+def add_item(owner, dish, quantity):
+    """Add `quantity` of a dish, keeping the price snapshot of an existing line. Returns the line."""
+    with _locked(_key(owner)):
+        state = _load(owner)
+        line = state.lines.setdefault(dish.pk, [uuid.uuid4(), dish.name, 0, dish.price])
+        line[2] += quantity
+        _mark_dirty(owner, state)
+    return line
+
+
+def decrease_item(owner, dish_id, quantity):
+    """Take `quantity` off a line, dropping it at zero. Returns the updated cart payload."""
+    with _locked(_key(owner)):
+        state = _load(owner)
+        line = state.lines.get(dish_id)
+        if line is None:
+            raise NotFound("This dish is not in your cart.")
+        if line[2] > quantity:
+            line[2] -= quantity
+        else:
+            del state.lines[dish_id]
+        _mark_dirty(owner, state)
+    return cart_payload(owner, state)
+
+
+def apply_operations(owner, operations):
+    """
+    Run a batch of cart operations against the database (services.apply_cart_operations)
+    and return the new cart. Pending cached edits are flushed first, and the blob
+    is rebuilt from the database afterwards.
+    """
+    with _locked(_key(owner)):
+        _flush(owner)
+        apply_cart_operations(_lookup(owner), operations)
+        _cache().delete(_key(owner))
+        return cart_payload(owner, _load(owner))
+
+
+def _flush(owner):
+    """Write a dirty cached cart to Cart/CartItem. The caller holds the cart lock."""
+    blob = _cache().get(_key(owner))
+    state = CartState.loads(blob) if blob is not None else None
+    if state is None or not state.dirty:
+        return False
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(**_lookup(owner), defaults={"id": state.id})
+        # dishes deleted since they were added can't be written; drop them from the cart too
+        live = set(Dish.objects.filter(id__in=list(state.lines)).values_list("id", flat=True))
+        state.lines = {dish_id: line for dish_id, line in state.lines.items() if dish_id in live}
+        CartItem.objects.bulk_create(
+            [
+                CartItem(id=item_id, cart=cart, dish_id=dish_id, quantity=qty, price=price)
+                for dish_id, (item_id, _, qty, price) in state.lines.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["cart", "dish"],
+            update_fields=["quantity", "price"],
+        )
+        CartItem.objects.filter(cart=cart).exclude(dish_id__in=list(state.lines)).delete()
+        Cart.objects.filter(pk=cart.pk).recalculate_totals(updated_at=timezone.now())
+        # rows that already existed keep their ids
+        for dish_id, pk in CartItem.objects.filter(cart=cart).values_list("dish_id", "id"):
+            state.lines[dish_id][0] = pk
+
+    state.id, state.dirty = cart.id, False
+    _store(owner, state)
+    return True
+
+
+def flush_cart(owner):
+    with _locked(_key(owner)):
+        return _flush(owner)
+
+
+def flush_dirty_carts():
+    """Write behind every cart changed since its last flush. Returns how many were written."""
+    flushed = 0
+    for owner in _dirty_owners():
+        try:
+            with _locked(_key(owner)):
+                flushed += _flush(owner)
+                _done_dirty(owner)
+        except Exception:
+            continue  # still queued: the next run tries again
+    return flushed
+
+
+def checkout(user):
+    """Flush the cached cart and check it out, all under the cart lock."""
+    owner = str(user.pk)
+    with _locked(_key(owner)):
+        _flush(owner)
+        try:
+            return checkout_cart(user)
+        finally:
+            # checkout empties or reprices the cart in the db; reload it from there next time
+            _cache().delete(_key(owner))
+
+
+def merge_anonymous_cart(user, token):
+    """Fold a guest cart into the user's cart at login (services.merge_carts). Returns the lines merged."""
+    owner, guest = str(user.pk), anonymous_owner(token)
+    # always user then guest, so two merges can't deadlock
+    with _locked(_key(owner)), _locked(_key(guest)):
+        _flush(guest)
+        _flush(owner)
+        merged = merge_carts(user, token)
+        _cache().delete_many([_key(owner), _key(guest)])
+    return merged
+
+
+def forget(tokens):
+    """Drop cached guest carts, e.g. after purge_anonymous_carts deleted them."""
+    _cache().delete_many([_key(anonymous_owner(token)) for token in tokens])
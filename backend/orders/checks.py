@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Tags, register
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+
+@register(Tags.caches)
+def check_cart_cache(app_configs, **kwargs):
+    """Cart locks and the dirty-cart set (orders/cart_store.py) only know how to be atomic on these backends."""
+    cache = caches[settings.CART_CACHE_ALIAS]
+    if isinstance(cache, (RedisCache, FileBasedCache, LocMemCache)):
+        return []
+    return [
+        Error(
+            f"The {settings.CART_CACHE_ALIAS!r} cache ({type(cache).__name__}) can't hold cart locks.",
+            hint="Point CART_CACHE_ALIAS at a Redis, file-based or (single process only) locmem cache.",
+            id="orders.E001",
+        )
+    ]
@@ -0,0 +1,191 @@
+"""
+Order events for the live restaurant feed (orders/feed.py).
+
+Write paths call publish_order_event(); it fires after the surrounding
+transaction commits. Each restaurant is its own channel and every event carries
+an increasing id, so a reconnecting client can send Last-Event-ID and get only
+what it missed instead of reloading the order list. Ids only order the replay:
+events from different workers can arrive slightly out of order, so a
+subscription skips the ids it has already sent rather than everything below the
+last one.
+
+The broker is picked by settings.ORDER_EVENTS_BROKER:
+- InProcessBroker: fan-out inside one process, enough for local runs and a
+  single ASGI worker.
+- PostgresBroker: publishes with pg_notify and every process LISTENs, so
+  subscribers on any worker see events published by any other. Ids come from
+  one database sequence (orders migration 0012), not from each worker's clock.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+from collections import defaultdict, deque
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+SEEN_IDS = 1000  # ids a subscription remembers, to skip events the backlog already sent
+
+
+class Event:
+    __slots__ = ("id", "type", "data")
+
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def encode(self):
+        """Server-sent events wire format."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Subscription:
+    def __init__(self, broker, channel, backlog):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.seen = set()
+        self.seen_order = deque()
+        for event in backlog:
+            self.queue.put_nowait(event)
+
+    async def next(self, timeout):
+        """Next unseen event, or None if nothing arrived within `timeout` seconds."""
+        deadline = self.loop.time() + timeout
+        while True:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                event = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if event.id not in self.seen:  # backlog and live delivery can overlap
+                self.seen.add(event.id)
+                self.seen_order.append(event.id)
+                if len(self.seen_order) > SEEN_IDS:
+                    self.seen.discard(self.seen_order.popleft())
+                return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, history=500):
+        self._lock = threading.Lock()
+        self._history = defaultdict(lambda: deque(maxlen=history))
+        self._subscribers = defaultdict(set)
+        self._last_id = 0
+
+    def next_id(self):
+        # microseconds since the epoch, bumped on collision, so ids keep growing across restarts
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            return self._last_id
+
+    def publish(self, channel, event_type, data):
+        self.deliver(channel, Event(self.next_id(), event_type, data))
+
+    def deliver(self, channel, event):
+        with self._lock:
+            self._history[channel].append(event)
+            subscribers = list(self._subscribers[channel])
+        for sub in subscribers:
+            sub.loop.call_soon_threadsafe(sub.queue.put_nowait, event)
+
+    def subscribe(self, channel, last_event_id=None):
+        """Must be called from the event loop that will read the subscription."""
+        with self._lock:
+            backlog = []
+            if last_event_id is not None:
+                backlog = [e for e in self._history[channel] if e.id > last_event_id]
+            sub = Subscription(self, channel, backlog)
+            self._subscribers[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers[sub.channel].discard(sub)
+
+
+class PostgresBroker(InProcessBroker):
+    pg_channel = "order_events"
+    id_sequence = "order_event_ids"
+
+    def __init__(self, history=500):
+        super().__init__(history)
+        self._listener = None
+
+    def publish(self, channel, event_type, data):
+        data = json.dumps(data, cls=DjangoJSONEncoder)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, json_build_object("
+                "'channel', %s, 'id', nextval(%s), 'type', %s, 'data', %s::json)::text)",
+                [self.pg_channel, channel, self.id_sequence, event_type, data],
+            )
+
+    def subscribe(self, channel, last_event_id=None):
+        self._ensure_listener()
+        return super().subscribe(channel, last_event_id)
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="order-events-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import psycopg2
+
+        while True:
+            try:
+                params = connection.get_connection_params()
+                conn = psycopg2.connect(**params)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.pg_channel}")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self.deliver(message["channel"], Event(message["id"], message["type"], message["data"]))
+            except Exception:
+                time.sleep(1)  # database went away; reconnect and keep listening
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.ORDER_EVENTS_BROKER)()
+        return _broker
+
+
+def order_payload(order):
+    return {
+        "id": str(order.id),
+        "status": order.status,
+        "total_amount": str(order.total_amount),
+        "item_count": order.item_count,
+        "version": order.version,
+        "created_at": order.created_at,
+    }
+
+
+def publish_order_event(order, event_type):
+    """Queue an event for the order's restaurant; it is only sent if the transaction commits."""
+    channel, data = str(order.restaurant_id), order_payload(order)
+    transaction.on_commit(lambda: get_broker().publish(channel, event_type, data))
@@ -0,0 +1,78 @@
+import csv
+import json
+from itertools import chain, islice
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from .models import OrderItem, ArchivedOrderItem
+
+COLUMNS = [
+    "order_id", "created_at", "status", "order_total", "item_count",
+    "dish_id", "dish_name", "quantity", "price", "subtotal",
+]
+CHUNK_SIZE = 2000
+LINES_PER_HOP = 500  # lines pulled per sync_to_async hop when served over ASGI
+
+
+class Echo:
+    """File-like object whose write() hands the line back (Django's streaming CSV recipe)."""
+
+    def write(self, value):
+        return value
+
+
+class ExportResponse(StreamingHttpResponse):
+    """
+    Streams a sync generator under WSGI and ASGI alike. Django's own
+    __aiter__ runs sync content through sync_to_async(list), which builds the
+    whole export in memory before the first byte; this pulls LINES_PER_HOP
+    lines per hop instead, on the request's thread (where its connection and
+    server-side cursor live).
+    """
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in super().__aiter__():
+                yield part
+            return
+        lines = self.streaming_content
+        take = sync_to_async(lambda: list(islice(lines, LINES_PER_HOP)), thread_sensitive=True)
+        while batch := await take():
+            for part in batch:
+                yield part
+
+
+def export_rows(restaurant_id, start=None, end=None, status=None):
+    """
+    One row per order line for the restaurant: archived orders first, then
+    live ones, each oldest first. Plain tuples off server-side cursors
+    (iterator(chunk_size)), so memory stays flat however many rows there are.
+    """
+    live = OrderItem.objects.filter(order__restaurant_id=restaurant_id)
+    archived = ArchivedOrderItem.objects.filter(order__restaurant_id=restaurant_id)
+    if start:
+        live, archived = live.filter(order__created_at__gte=start), archived.filter(order__created_at__gte=start)
+    if end:
+        live, archived = live.filter(order__created_at__lt=end), archived.filter(order__created_at__lt=end)
+    if status:
+        live, archived = live.filter(order__status=status), archived.filter(order__status=status)
+
+    fields = ["order_id", "order__created_at", "order__status", "order__total_amount", "order__item_count", "dish_id", "quantity", "price"]
+    live = live.order_by("order__created_at", "order_id").values_list(*fields[:6], "dish__name", *fields[6:])
+    archived = archived.order_by("order__created_at", "order_id").values_list(*fields[:6], "dish_name", *fields[6:])
+
+    for row in chain(archived.iterator(chunk_size=CHUNK_SIZE), live.iterator(chunk_size=CHUNK_SIZE)):
+        quantity, price = row[7], row[8]
+        yield (*row, quantity * price)
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(value.isoformat() if hasattr(value, "isoformat") else value for value in row)
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,60 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from accounts.authentication import CookieJWTAuthentication
+from accounts.models import CustomUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from restaurants.models import Restaurant
+from .events import get_broker
+
+
+def _owner_restaurant_id(request):
+    """Same auth as the DRF views (JWT cookie or header); None unless a restaurant owner."""
+    for backend in (CookieJWTAuthentication(), JWTAuthentication()):
+        result = backend.authenticate(request)
+        if result:
+            user = result[0]
+            if user.role != CustomUser.Role.RESTAURANT_OWNER:
+                return None
+            return Restaurant.objects.filter(owner=user).values_list("id", flat=True).first()
+    return None
+
+
+async def restaurant_order_feed(request):
+    """
+    GET /orders/restaurant-orders/stream/  (text/event-stream)
+
+    Pushes order.created / order.status events for the owner's restaurant so
+    dashboards stop polling restaurant-orders/. Reconnects resume from the
+    Last-Event-ID header (or ?last_event_id=). Needs the ASGI app; under
+    WSGI a stream would hold a worker for as long as the client stays connected.
+    """
+    try:
+        restaurant_id = await sync_to_async(_owner_restaurant_id)(request)
+    except AuthenticationFailed as exc:
+        return JsonResponse({"detail": str(exc.detail)}, status=401)
+    if restaurant_id is None:
+        return JsonResponse({"detail": "Only restaurant owners can follow the order feed."}, status=403)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    async def stream():
+        subscription = get_broker().subscribe(str(restaurant_id), last_event_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.next(timeout=settings.ORDER_EVENTS_HEARTBEAT_SECONDS)
+                # comment lines keep proxies from closing an idle stream
+                yield event.encode() if event else ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def _sha256(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _cache_key(key):
+    return f"idempotency:{key}"
+
+
+def _replay(status_code, data):
+    return Response(data, status=status_code, headers={"Idempotent-Replayed": "true"})
+
+
+def _claim(key, request_hash):
+    """
+    Return (lease, None) once this request owns `key`, otherwise (None, the
+    Response to send): the stored one for a replay, or an error if the key is
+    misused / still busy. A key whose request died without an answer (its
+    lease has passed) is taken over.
+    """
+    ttl = settings.IDEMPOTENCY_KEY_TTL
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        hit = cache.get(_cache_key(key))
+        if hit is not None:
+            stored_hash, status_code, data = hit
+            if stored_hash != request_hash:
+                break
+            return None, _replay(status_code, data)
+
+        now = timezone.now()
+        lease = now + settings.IDEMPOTENCY_LEASE
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=key, request_hash=request_hash, locked_until=lease, expires_at=now + ttl)
+            return lease, None
+        except IntegrityError:
+            pass
+
+        row = IdempotencyKey.objects.filter(key=key).first()
+        if row is None:
+            continue  # the first request failed and released the key
+        if row.expires_at <= now:
+            IdempotencyKey.objects.filter(key=key, expires_at__lte=now).delete()
+            continue
+        if row.request_hash != request_hash:
+            break
+        if row.status_code is not None:
+            cache.set(_cache_key(key), (row.request_hash, row.status_code, row.response), ttl.total_seconds())
+            return None, _replay(row.status_code, row.response)
+        if row.locked_until is None or row.locked_until <= now:
+            # its request crashed: take the key over, unless another retry just did
+            if IdempotencyKey.objects.filter(key=key, status_code=None, locked_until=row.locked_until).update(locked_until=lease):
+                return lease, None
+            continue
+        if time.monotonic() >= deadline:
+            return None, Response(
+                {"detail": "A request with this Idempotency-Key is still being processed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        # a concurrent duplicate: wait for the first request instead of running twice
+        time.sleep(0.1)
+
+    return None, Response(
+        {"detail": "This Idempotency-Key was already used with a different request body."},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def idempotent(scope):
+    """
+    Honour an Idempotency-Key header on a DRF view method.
+
+    The first request with a key runs normally and its response is kept (db row
+    + cache); retries with the same key and body get that response back without
+    running the view again. Failed requests (exceptions, 5xx) release the key,
+    and one that dies outright holds it for IDEMPOTENCY_LEASE at most.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            client_key = request.headers.get(HEADER)
+            if not client_key or not request.user.is_authenticated:
+                return view_method(self, request, *args, **kwargs)
+            if len(client_key) > 255:
+                return Response({"detail": f"{HEADER} must be at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+            key = _sha256(f"{request.user.pk}:{scope}:{client_key}")
+            request_hash = _sha256(json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder))
+            lease, stored = _claim(key, request_hash)
+            if stored is not None:
+                return stored
+
+            # only while the key is still ours: a retry may have taken it over after our lease
+            ours = IdempotencyKey.objects.filter(key=key, status_code=None, locked_until=lease)
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                ours.delete()
+                raise
+            if response.status_code >= 500:
+                ours.delete()
+                return response
+
+            data = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+            if ours.update(status_code=response.status_code, response=data, locked_until=None):
+                cache.set(
+                    _cache_key(key), (request_hash, response.status_code, data), settings.IDEMPOTENCY_KEY_TTL.total_seconds()
+                )
+            return response
+        return wrapper
+    return decorator
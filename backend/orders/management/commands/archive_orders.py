@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move delivered/cancelled orders older than N days into the archive tables, in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--max-batches", type=int, default=None, help="stop after this many batches")
+
+    def handle(self, *args, **options):
+        moved = archive_orders(options["days"], options["batch_size"], options["max_batches"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} orders."))
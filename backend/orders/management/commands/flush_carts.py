@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.cart_store import flush_dirty_carts
+
+
+class Command(BaseCommand):
+    help = "Write cached carts changed since their last flush to Cart/CartItem"
+
+    def handle(self, *args, **options):
+        flushed = flush_dirty_carts()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} carts."))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.cart_store import forget
+from orders.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Delete guest carts nobody has touched for a while, in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.CART_ANONYMOUS_MAX_AGE // 86400)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        total = 0
+        while True:
+            batch = list(
+                Cart.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+                .values_list("id", "token")[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            Cart.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+            forget([token for _, token in batch])
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} abandoned guest carts."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            keys = list(
+                IdempotencyKey.objects.filter(expires_at__lte=now).values_list("key", flat=True)[: options["batch_size"]]
+            )
+            if not keys:
+                break
+            total += IdempotencyKey.objects.filter(key__in=keys).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} expired idempotency keys."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from orders.models import Order, Cart
+
+
+class Command(BaseCommand):
+    help = "Recompute stored total_amount/item_count for orders and carts from their items"
+
+    def handle(self, *args, **options):
+        # one UPDATE ... SET = (SELECT SUM(...)) per table, no rows pulled into Python
+        orders = Order.objects.all().recalculate_totals()
+        carts = Cart.objects.all().recalculate_totals()
+        self.stdout.write(self.style.SUCCESS(f"Recalculated totals for {orders} orders and {carts} carts."))
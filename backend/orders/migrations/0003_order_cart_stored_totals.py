@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 10:19
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    money = DecimalField(max_digits=12, decimal_places=2)
+    for parent_name, item_name, fk in (("Order", "OrderItem", "order"), ("Cart", "CartItem", "cart")):
+        parent = apps.get_model("orders", parent_name)
+        items = apps.get_model("orders", item_name)
+        per_parent = items.objects.filter(**{fk: OuterRef("pk")}).order_by().values(fk)
+        parent.objects.update(
+            total_amount=Coalesce(
+                Subquery(per_parent.annotate(s=Sum(F("price") * F("quantity"), output_field=money)).values("s")),
+                Value(0),
+                output_field=money,
+            ),
+            item_count=Coalesce(Subquery(per_parent.annotate(s=Sum("quantity")).values("s")), Value(0)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_cart_transaction_cartitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 10:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_idempotencykey'),
+        ('restaurants', '0002_alter_dish_dish_image_alter_menu_menu_image_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'status', 'created_at'], name='order_restaurant_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'created_at'], name='order_customer_created_idx'),
+        ),
+    ]
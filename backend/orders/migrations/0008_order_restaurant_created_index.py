@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-18 10:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_archived_orders'),
+        ('restaurants', '0002_alter_dish_dish_image_alter_menu_menu_image_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'created_at'], name='order_restaurant_created_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+import time
+
+from django.db import migrations
+
+
+def create_sequence(apps, schema_editor):
+    # only PostgresBroker uses it
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    # start past the clock-based ids handed out so far, so Last-Event-ID keeps working across the switch
+    schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS order_event_ids START WITH {time.time_ns() // 1000}")
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP SEQUENCE IF EXISTS order_event_ids")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_idempotency_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
 from django.conf import settings
 from restaurants.models import Restaurant, Dish
 import uuid
@@ -7,6 +10,94 @@ User = settings.AUTH_USER_MODEL
 # Create your models here.
 
 
+class TotalsQuerySet(models.QuerySet):
+    """For models that store total_amount/item_count over their `items`."""
+
+    def recalculate_totals(self, **extra):
+        """Recompute totals for every row in the queryset with one UPDATE (plus any `extra` fields)."""
+        item_model = self.model.items.rel.related_model
+        fk = self.model.items.field.name
+        per_parent = item_model.objects.filter(**{fk: OuterRef("pk")}).order_by().values(fk)
+        money = DecimalField(max_digits=12, decimal_places=2)
+        return self.update(
+            total_amount=Coalesce(
+                Subquery(per_parent.annotate(s=Sum(F("price") * F("quantity"), output_field=money)).values("s")),
+                Value(0),
+                output_field=money,
+            ),
+            item_count=Coalesce(
+                Subquery(per_parent.annotate(s=Sum("quantity")).values("s")),
+                Value(0),
+            ),
+            **extra,
+        )
+
+
+class TrackedTotalsMixin:
+    """
+    Line-item mixin that keeps the parent's total_amount/item_count in step on
+    every save() and delete() with an atomic F() update, so nobody has to
+    re-read the items to know the total. Bulk paths (bulk_create, queryset
+    delete/update) skip this and must adjust the parent themselves.
+    """
+    totals_parent = None  # name of the FK to the row that holds the totals
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_line = (instance.__dict__.get("quantity"), instance.__dict__.get("price"))
+        return instance
+
+    def _saved_subtotal(self):
+        if self._state.adding:
+            return 0, 0
+        quantity, price = getattr(self, "_saved_line", (None, None))
+        if quantity is None or price is None:
+            quantity, price = type(self).objects.filter(pk=self.pk).values_list("quantity", "price").get()
+        return quantity, quantity * price
+
+    def _bump_parent(self, amount, count):
+        if not amount and not count:
+            return
+        parent_model = self._meta.get_field(self.totals_parent).related_model
+        parent_model.objects.filter(pk=getattr(self, f"{self.totals_parent}_id")).update(
+            total_amount=F("total_amount") + amount,
+            item_count=F("item_count") + count,
+            updated_at=Now(),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old_quantity, old_subtotal = self._saved_subtotal()
+            super().save(*args, **kwargs)
+            self._bump_parent(self.subtotal - old_subtotal, self.quantity - old_quantity)
+        self._saved_line = (self.quantity, self.price)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            old_quantity, old_subtotal = self._saved_subtotal()
+            result = super().delete(*args, **kwargs)
+            self._bump_parent(-old_subtotal, -old_quantity)
+        return result
+
+
+class StaleOrder(Exception):
+    """The order changed status (or version) since this instance was loaded."""
+
+
+class OrderQuerySet(TotalsQuerySet):
+    def with_items(self):
+        """Prefetch items and the dish names OrderSerializer shows, in one extra query."""
+        return self.prefetch_related(
+            models.Prefetch(
+                "items",
+                queryset=OrderItem.objects.select_related("dish").only(
+                    "id", "order", "dish", "quantity", "price", "dish__name"
+                ),
+            )
+        )
+
+
 class Order(models.Model):
     class Status(models.TextChoices):
         PENDING = "pending", "Pending"
@@ -14,22 +105,98 @@ class Order(models.Model):
         PREPARING = "preparing", "Preparing"
         DELIVERED = "delivered", "Delivered"
         CANCELLED = "cancelled", "Cancelled"
+
+    # target status -> statuses an order may move to it from
+    TRANSITIONS = {
+        Status.PAID: {Status.PENDING},
+        Status.PREPARING: {Status.PENDING, Status.PAID},
+        Status.DELIVERED: {Status.PREPARING},
+        Status.CANCELLED: {Status.PENDING, Status.PAID, Status.PREPARING},
+    }
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="orders")
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)  # units across all items
+    version = models.PositiveIntegerField(default=0)  # bumped on every status change, for optimistic locking
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # queryset updates must set it too (conditional GETs rely on it)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # owner dashboards: WHERE restaurant = ? AND status = ? ORDER BY created_at DESC
+            models.Index(fields=["restaurant", "status", "created_at"], name="order_restaurant_status_idx"),
+            # customer history: WHERE customer = ? ORDER BY created_at DESC
+            models.Index(fields=["customer", "created_at"], name="order_customer_created_idx"),
+            # exports: WHERE restaurant = ? AND created_at BETWEEN ... ORDER BY created_at
+            models.Index(fields=["restaurant", "created_at"], name="order_restaurant_created_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")  # lets signals spot status changes
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or "status" in fields:
+            self._loaded_status = self.__dict__.get("status")
+
+    def can_transition_to(self, status):
+        return self.status in self.TRANSITIONS.get(status, ())
+
+    def _status_change(self):
+        """The loaded status if save() would change it, else None."""
+        old_status = getattr(self, "_loaded_status", None)
+        if self._state.adding or old_status is None or old_status == self.status:
+            return None
+        return old_status
+
+    def clean(self):
+        old_status = self._status_change()
+        if old_status is None:
+            return
+        if old_status not in self.TRANSITIONS.get(self.status, ()):
+            raise ValidationError({"status": f"An order can't go from {old_status} to {self.status}."})
+        if not Order.objects.filter(pk=self.pk, version=self.version).exists():
+            raise ValidationError("This order was changed by someone else since you loaded it.")
+
+    def save(self, *args, **kwargs):
+        """
+        A status change is checked against TRANSITIONS and claimed with a
+        conditional UPDATE on the loaded status and version, the way
+        services.transition_orders does in bulk; StaleOrder if it lost.
+        """
+        old_status = self._status_change()
+        if old_status is None:
+            return super().save(*args, **kwargs)
+        if old_status not in self.TRANSITIONS.get(self.status, ()):
+            raise ValidationError({"status": f"An order can't go from {old_status} to {self.status}."})
+        with transaction.atomic():
+            claimed = Order.objects.filter(pk=self.pk, status=old_status, version=self.version).update(
+                status=self.status, version=F("version") + 1, updated_at=Now()
+            )
+            if not claimed:
+                raise StaleOrder(f"Order {self.pk} changed since it was loaded.")
+            self.version += 1
+            super().save(*args, **kwargs)
 
     def recalc_total(self):
-        self.total_amount = sum(item.subtotal for item in self.items.all())
-        self.save()
+        Order.objects.filter(pk=self.pk).recalculate_totals()
+        self.refresh_from_db(fields=["total_amount", "item_count"])
 
     def __str__(self):
         return f"Order #{self.id} by {self.customer} from {self.restaurant}"
     
 
-class OrderItem(models.Model):
+class OrderItem(TrackedTotalsMixin, models.Model):
+    totals_parent = "order"
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     dish = models.ForeignKey(Dish, on_delete=models.PROTECT)
@@ -47,18 +214,39 @@ class OrderItem(models.Model):
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="cart")
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="cart", null=True, blank=True)
+    # guest carts have a device/session token instead of a user (orders/cart_store.py)
+    token = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)  # units across all items
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TotalsQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=Q(user__isnull=False) | Q(token__isnull=False), name="cart_has_owner"),
+        ]
+        indexes = [
+            models.Index(fields=["updated_at"], condition=Q(user__isnull=True), name="cart_guest_updated_idx"),
+        ]
 
     def __str__(self):
-        return f"Cart of {self.user}"
+        return f"Cart of {self.user or 'guest'}"
 
-    @property
-    def total_amount(self):
-        return sum(item.subtotal for item in self.items.all())
+    def clear(self):
+        """Drop every item with one DELETE and zero the stored totals."""
+        with transaction.atomic():
+            # queryset delete skips CartItem.delete(), so reset the totals here
+            self.items.all().delete()
+            Cart.objects.filter(pk=self.pk).update(total_amount=0, item_count=0)
+        self.total_amount, self.item_count = 0, 0
 
 
-class CartItem(models.Model):
+class CartItem(TrackedTotalsMixin, models.Model):
+    totals_parent = "cart"
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
@@ -76,15 +264,24 @@ class CartItem(models.Model):
         return self.price * self.quantity
 
     def increase_quantity(self, qty=1):
-        self.quantity += qty
-        self.save()
+        """Increment in the database, so two quick taps both count."""
+        with transaction.atomic():
+            CartItem.objects.filter(pk=self.pk).update(quantity=F("quantity") + qty)
+            self._bump_parent(self.price * qty, qty)
+        self.refresh_from_db(fields=["quantity"])
+        self._saved_line = (self.quantity, self.price)
 
     def decrease_quantity(self, qty=1):
-        if self.quantity > qty:
-            self.quantity -= qty
-            self.save()
-        else:
-            self.delete()
+        """Decrement in the database; the row goes once it would reach zero."""
+        with transaction.atomic():
+            if CartItem.objects.filter(pk=self.pk, quantity__gt=qty).update(quantity=F("quantity") - qty):
+                self._bump_parent(-self.price * qty, -qty)
+                self.refresh_from_db(fields=["quantity"])
+                self._saved_line = (self.quantity, self.price)
+                return
+            CartItem.objects.filter(pk=self.pk).delete()
+            Cart.objects.filter(pk=self.cart_id).recalculate_totals()
+        self.quantity = 0
 
 
 class Transaction(models.Model):
@@ -102,4 +299,74 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Transaction {self.reference} - {self.status}"
\ No newline at end of file
+        return f"Transaction {self.reference} - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a request sent with an Idempotency-Key header.
+    `key` is a sha256 over (user, endpoint, client key) so every row is the same
+    small size no matter what clients send; rows expire after IDEMPOTENCY_KEY_TTL.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null while the first request is still running
+    response = models.JSONField(null=True, blank=True)
+    # while status_code is null: the running request's lease; a retry takes the key over once it has passed
+    locked_until = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key[:12]}… ({self.status_code or 'in progress'})"
+
+
+class ArchivedOrderQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.prefetch_related("items")
+
+
+class ArchivedOrder(models.Model):
+    """
+    Cold storage for delivered/cancelled orders moved out of Order by the
+    archive_orders command. Same id as the original order; the transaction is
+    folded in and items keep a dish-name snapshot, so reads need no joins and
+    dishes can be deleted later.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_orders")
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="archived_orders")
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    transaction_reference = models.CharField(max_length=100, blank=True)
+    transaction_status = models.CharField(max_length=20, choices=Transaction.Status.choices, blank=True)
+
+    objects = ArchivedOrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["customer", "created_at"], name="archived_customer_created_idx"),
+            models.Index(fields=["restaurant", "created_at"], name="archived_rest_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.id}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="items")
+    dish_id = models.UUIDField()  # no FK: archived history must not block deleting a dish
+    dish_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+    def __str__(self):
+        return f"{self.dish_name} x {self.quantity}"
@@ -1,9 +1,11 @@
 from rest_framework import serializers
-from .models import Order, OrderItem, Cart, CartItem, Transaction
+from .models import Order, OrderItem, Cart, CartItem, Transaction, ArchivedOrder, ArchivedOrderItem
+from .services import create_order
 from restaurants.models import Dish
 
 class OrderItemCreateSerializer(serializers.ModelSerializer):
-    dish_id = serializers.PrimaryKeyRelatedField(source="dish", queryset=Dish.objects.all())
+    # plain id here; OrderCreateSerializer resolves every dish in one query
+    dish_id = serializers.UUIDField()
 
     class Meta:
         model = OrderItem
@@ -21,9 +23,23 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ["id", "restaurant", "status", "total_amount", "created_at", "items"]
-        read_only_fields = ["status", "total_amount", "created_at", "items"]
+        fields = ["id", "restaurant", "status", "total_amount", "item_count", "version", "created_at", "items"]
+        read_only_fields = ["status", "total_amount", "item_count", "version", "created_at", "items"]
         
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ["id", "dish_name", "quantity", "price", "subtotal"]
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Same shape as OrderSerializer so clients can't tell archived orders apart."""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = OrderSerializer.Meta.fields
+        read_only_fields = fields
+
 class SingleOrderCreateSerializer(serializers.Serializer):
     dish_id = serializers.UUIDField()
     quantity = serializers.IntegerField(min_value=1, default=1)
@@ -43,63 +59,85 @@ class SingleOrderCreateSerializer(serializers.Serializer):
     def create(self, validated_data):
         user = self.context["request"].user
         dish = validated_data["dish"]
-        quantity = validated_data["quantity"]
-
-        # Create order tied to the dish's restaurant
-        order = Order.objects.create(
-            customer=user,
-            restaurant=dish.restaurant
-        )
 
-        # Add the dish as an order item
-        OrderItem.objects.create(
-            order=order,
-            dish=dish,
-            quantity=quantity,
-            price=dish.price,  # snapshot price
+        # Order tied to the dish's restaurant, transaction pending until restaurant owner approves
+        return create_order(
+            user,
+            dish.restaurant_id,
+            [(dish, validated_data["quantity"])],
+            with_transaction=True,
         )
 
-        # recalc total
-        order.recalc_total()
-
-        # Create transaction (pending until restaurant owner approves)
-        txn = Transaction.objects.create(
-            order=order,
-            user=user,
-            amount=order.total_amount,
-            reference=f"TXN-{order.id.hex[:8]}",
-        )
-
-        return order, txn
-
 class OrderCreateSerializer(serializers.Serializer):
     restaurant_id = serializers.UUIDField()
     items = OrderItemCreateSerializer(many=True)
 
     def validate(self, data):
-        # ensure all dishes belong to the same restaurant
-        from restaurants.models import Restaurant, Dish
+        # one query loads every dish and proves they all belong to the same restaurant
         rest_id = data["restaurant_id"]
-        dish_ids = [i["dish"].id for i in data["items"]]
-        count = Dish.objects.filter(id__in=dish_ids, restaurant_id=rest_id).count()
-        if count != len(dish_ids):
+        if not data["items"]:
+            raise serializers.ValidationError("An order needs at least one item.")
+        dish_ids = {i["dish_id"] for i in data["items"]}
+        dishes = Dish.objects.filter(restaurant_id=rest_id).only(
+            "id", "name", "price", "is_available", "restaurant_id"
+        ).in_bulk(dish_ids)
+        if len(dishes) != len(dish_ids):
             raise serializers.ValidationError("One or more dishes do not belong to the selected restaurant.")
+        if any(not dish.is_available for dish in dishes.values()):
+            raise serializers.ValidationError("One or more dishes are not available.")
+        for item in data["items"]:
+            item["dish"] = dishes[item["dish_id"]]
         return data
 
     def create(self, validated_data):
         user = self.context["request"].user
-        from restaurants.models import Restaurant
-        restaurant = Restaurant.objects.get(id=validated_data["restaurant_id"])
-        order = Order.objects.create(customer=user, restaurant=restaurant)
-        for item in validated_data["items"]:
-            dish = item["dish"]
-            qty = item.get("quantity", 1)
-            OrderItem.objects.create(order=order, dish=dish, quantity=qty, price=dish.price)
-        order.recalc_total()
+        lines = [(item["dish"], item.get("quantity", 1)) for item in validated_data["items"]]
+        order, _ = create_order(user, validated_data["restaurant_id"], lines)
         return order
     
     
 
+class OrderTransitionSerializer(serializers.Serializer):
+    order_id = serializers.UUIDField()
+    status = serializers.ChoiceField(choices=list(Order.TRANSITIONS))
+    version = serializers.IntegerField(required=False, min_value=0)
+
+
+class BulkOrderTransitionSerializer(serializers.Serializer):
+    """
+    Either a list of per-order transitions, or many orders to one status:
+    {"transitions": [{"order_id": ..., "status": "preparing", "version": 3}, ...]}
+    {"order_ids": [...], "status": "delivered"}
+    """
+    MAX_ORDERS = 500
+
+    transitions = OrderTransitionSerializer(many=True, required=False)
+    order_ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    status = serializers.ChoiceField(choices=list(Order.TRANSITIONS), required=False)
+
+    def validate(self, data):
+        if data.get("order_ids") is not None:
+            if "status" not in data:
+                raise serializers.ValidationError({"status": "status is required with order_ids."})
+            changes = [{"order_id": pk, "status": data["status"]} for pk in data["order_ids"]]
+        else:
+            changes = data.get("transitions") or []
+        if not changes:
+            raise serializers.ValidationError("Send transitions or order_ids.")
+        if len(changes) > self.MAX_ORDERS:
+            raise serializers.ValidationError(f"At most {self.MAX_ORDERS} orders per request.")
+        data["changes"] = changes
+        return data
+
+
+class OrderExportQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    status = serializers.ChoiceField(choices=Order.Status.choices, required=False)
+    # not "format": DRF reserves ?format= for renderer negotiation
+    export_format = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+
+
 class AddToCartSerializer(serializers.Serializer):
     dish_id = serializers.PrimaryKeyRelatedField(
         queryset=Dish.objects.all(), source="dish"
@@ -108,6 +146,29 @@ class AddToCartSerializer(serializers.Serializer):
 
 
 
+class CartOperationSerializer(serializers.Serializer):
+    dish_id = serializers.UUIDField()
+    delta = serializers.IntegerField(required=False)
+    set_quantity = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, data):
+        if ("delta" in data) == ("set_quantity" in data):
+            raise serializers.ValidationError("Send exactly one of delta or set_quantity.")
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """{"operations": [{"dish_id": ..., "delta": 2}, {"dish_id": ..., "set_quantity": 0}, ...]}"""
+    MAX_OPERATIONS = 200
+
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        if len(operations) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(f"At most {self.MAX_OPERATIONS} operations per request.")
+        return operations
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     dish_name = serializers.CharField(source="dish.name", read_only=True)
     subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
@@ -119,11 +180,11 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
-    total_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Cart
-        fields = ["id", "user", "items", "total_amount"]
+        fields = ["id", "user", "items", "total_amount", "item_count"]
+        read_only_fields = ["total_amount", "item_count"]
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -0,0 +1,255 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from restaurants.models import Dish
+from .models import Order, OrderItem, Transaction, Cart, CartItem
+from .events import publish_order_event
+from .signals import order_status_changed
+
+
+class CheckoutConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This cart was checked out by another request."
+    default_code = "checkout_conflict"
+
+
+def create_order(customer, restaurant_id, lines, with_transaction=False):
+    """
+    Write an order and all of its items inside one atomic block.
+
+    `lines` is a list of (dish, quantity) pairs with the dishes already loaded,
+    so pricing happens in memory: one INSERT for the order (totals included),
+    one bulk INSERT for the items and, optionally, one for the transaction.
+    """
+    order = Order(customer=customer, restaurant_id=restaurant_id)
+    items = [
+        OrderItem(order=order, dish=dish, quantity=quantity, price=dish.price)  # snapshot price
+        for dish, quantity in lines
+    ]
+    order.total_amount = sum((item.subtotal for item in items), Decimal("0"))
+    order.item_count = sum(item.quantity for item in items)
+
+    txn = None
+    with transaction.atomic():
+        order.save(force_insert=True)
+        OrderItem.objects.bulk_create(items)
+        if with_transaction:
+            txn = Transaction.objects.create(
+                order=order,
+                user=customer,
+                amount=order.total_amount,
+                reference=f"TXN-{order.id.hex[:8]}",
+            )
+
+    # same shape prefetch_related() leaves behind, so serializers read the
+    # items (and their already-loaded dishes) without going back to the db
+    cached = order.items.all()
+    cached._result_cache = items
+    cached._prefetch_done = True
+    order._prefetched_objects_cache = {"items": cached}
+    return order, txn
+
+
+def checkout_cart(user):
+    """
+    Turn the user's cart into an order + Transaction.
+
+    The cart row is locked for the whole operation, so a double-tapped
+    checkout waits for the first one and then finds an empty cart. Items and
+    their current dish price/availability come back in one query, the order
+    goes through create_order() and the cart is cleared with one DELETE, so the
+    query count does not depend on how many items are in the cart.
+    """
+    repriced = []
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        items = list(
+            CartItem.objects.filter(cart=cart).select_related("dish").only(
+                "id", "quantity", "price",
+                "dish__id", "dish__name", "dish__price", "dish__is_available", "dish__restaurant",
+            )
+        ) if cart else []
+        if not items:
+            raise ValidationError({"detail": "Cart is empty"})
+
+        restaurant_id = items[0].dish.restaurant_id
+        if any(item.dish.restaurant_id != restaurant_id for item in items):
+            raise ValidationError({"detail": "All cart items must come from the same restaurant."})
+        unavailable = [item.dish.name for item in items if not item.dish.is_available]
+        if unavailable:
+            raise ValidationError({"detail": "One or more dishes are not available.", "dishes": unavailable})
+
+        repriced = [item for item in items if item.price != item.dish.price]
+        if not repriced:
+            order, txn = create_order(
+                user, restaurant_id, [(item.dish, item.quantity) for item in items], with_transaction=True
+            )
+            # delete exactly the rows we priced; anything else means another checkout got here first
+            deleted, _ = CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+            if deleted != len(items):
+                raise CheckoutConflict()
+            Cart.objects.filter(pk=cart.pk).update(total_amount=0, item_count=0)
+            return order, txn
+
+        # prices moved since the items were added: refresh the snapshots and let the customer confirm
+        for item in repriced:
+            item.price = item.dish.price
+        CartItem.objects.bulk_update(repriced, ["price"])
+        Cart.objects.filter(pk=cart.pk).recalculate_totals()
+
+    raise ValidationError({
+        "detail": "Some prices changed since these dishes were added to your cart. Please review it and check out again.",
+        "dishes": [item.dish.name for item in repriced],
+    })
+
+
+def apply_cart_operations(cart_lookup, operations):
+    """
+    Apply a batch of {"dish_id", "delta" | "set_quantity"} operations atomically
+    to the cart matching `cart_lookup` ({"user_id": ...} or {"token": ...}).
+
+    Operations on the same dish are folded in order first. Then, whatever the
+    batch size: one bulk upsert on (cart, dish) for set_quantity lines, one
+    insert of missing delta lines at zero, one UPDATE doing the delta
+    arithmetic in the database (so concurrent batches never lose increments),
+    one DELETE for lines that reached zero and one totals recalculation.
+    """
+    folded = {}  # dish_id -> ("set", n) | ("delta", n)
+    for op in operations:
+        kind, amount = folded.get(op["dish_id"], ("delta", 0))
+        if op.get("set_quantity") is not None:
+            folded[op["dish_id"]] = ("set", op["set_quantity"])
+        else:
+            folded[op["dish_id"]] = (kind, amount + op["delta"])
+
+    dishes = Dish.objects.only("id", "name", "price", "is_available").in_bulk(list(folded))
+    missing = [str(pk) for pk in folded if pk not in dishes]
+    if missing:
+        raise ValidationError({"detail": "Some dishes do not exist.", "dishes": missing})
+    unavailable = [dishes[pk].name for pk, (_, amount) in folded.items() if amount > 0 and not dishes[pk].is_available]
+    if unavailable:
+        raise ValidationError({"detail": "One or more dishes are not available.", "dishes": unavailable})
+
+    sets = {pk: amount for pk, (kind, amount) in folded.items() if kind == "set"}
+    deltas = {pk: amount for pk, (kind, amount) in folded.items() if kind == "delta" and amount}
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(**cart_lookup)
+        if sets:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, dish_id=pk, quantity=n, price=dishes[pk].price) for pk, n in sets.items()],
+                update_conflicts=True,
+                unique_fields=["cart", "dish"],
+                update_fields=["quantity"],  # an existing line keeps its price snapshot
+            )
+        if deltas:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, dish_id=pk, quantity=0, price=dishes[pk].price) for pk in deltas],
+                ignore_conflicts=True,
+            )
+            CartItem.objects.filter(cart=cart, dish_id__in=list(deltas)).update(
+                quantity=Greatest(
+                    F("quantity") + Case(
+                        *[When(dish_id=pk, then=Value(d)) for pk, d in deltas.items()],
+                        output_field=IntegerField(),
+                    ),
+                    0,
+                )
+            )
+        CartItem.objects.filter(cart=cart, quantity=0).delete()
+        Cart.objects.filter(pk=cart.pk).recalculate_totals(updated_at=timezone.now())
+    return cart
+
+
+def merge_carts(user, token):
+    """
+    Move the guest cart `token` into the user's cart and delete it. Returns the number of lines merged.
+
+    Dishes in both carts get their quantities summed, keeping the user's price
+    snapshot; all lines are written with one bulk upsert on (cart, dish).
+    """
+    with transaction.atomic():
+        guest = Cart.objects.select_for_update().filter(token=token, user__isnull=True).first()
+        if guest is None:
+            return 0
+        lines = list(guest.items.values_list("dish_id", "quantity", "price"))
+        if lines:
+            cart, _ = Cart.objects.get_or_create(user=user)
+            cart = Cart.objects.select_for_update().get(pk=cart.pk)
+            existing = dict(
+                CartItem.objects.filter(cart=cart, dish_id__in=[dish_id for dish_id, _, _ in lines])
+                .values_list("dish_id", "quantity")
+            )
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, dish_id=dish_id, quantity=quantity + existing.get(dish_id, 0), price=price)
+                    for dish_id, quantity, price in lines
+                ],
+                update_conflicts=True,
+                unique_fields=["cart", "dish"],
+                update_fields=["quantity"],
+            )
+            Cart.objects.filter(pk=cart.pk).recalculate_totals(updated_at=timezone.now())
+        guest.delete()
+    return len(lines)
+
+
+def transition_orders(restaurant_id, changes):
+    """
+    Move many of a restaurant's orders to new statuses at once.
+
+    `changes` is a list of {"order_id", "status", "version" (optional)}. Orders
+    are grouped by target status and each group is applied with one conditional
+    UPDATE (right restaurant, allowed source status, unchanged version), so an
+    order edited concurrently is reported as a conflict instead of being
+    overwritten. Returns one outcome per requested order, in request order.
+    """
+    ids = {change["order_id"] for change in changes}
+    current = {
+        pk: (status, version)
+        for pk, status, version in Order.objects.filter(restaurant_id=restaurant_id, id__in=ids)
+        .values_list("id", "status", "version")
+    }
+
+    outcomes, by_target = {}, {}
+    for change in changes:
+        pk, target = change["order_id"], change["status"]
+        if pk not in current:
+            outcomes[pk] = {"result": "not_found"}
+            continue
+        status, version = current[pk]
+        if status not in Order.TRANSITIONS.get(target, ()):
+            outcomes[pk] = {"result": "invalid_transition", "status": status, "version": version}
+        elif change.get("version") is not None and change["version"] != version:
+            outcomes[pk] = {"result": "conflict", "status": status, "version": version}
+        else:
+            by_target.setdefault(target, {})[pk] = version
+
+    with transaction.atomic():
+        for target, expected in by_target.items():
+            matches = Q()
+            for pk, version in expected.items():
+                matches |= Q(id=pk, version=version)
+            Order.objects.filter(matches, restaurant_id=restaurant_id, status__in=Order.TRANSITIONS[target]).update(
+                status=target, version=F("version") + 1, updated_at=Now()
+            )
+
+        attempted = {pk: (target, version) for target, expected in by_target.items() for pk, version in expected.items()}
+        changed = []
+        for order in Order.objects.filter(id__in=attempted).only(
+            "id", "restaurant_id", "status", "version", "total_amount", "item_count", "created_at"
+        ):
+            target, version = attempted[order.id]
+            won = order.status == target and order.version == version + 1
+            outcomes[order.id] = {"result": "updated" if won else "conflict", "status": order.status, "version": order.version}
+            if won:
+                changed.append((order.id, current[order.id][0], order.status))
+                publish_order_event(order, "order.status")
+        if changed:
+            order_status_changed.send(sender=Order, changes=changed)
+
+    return [{"order_id": change["order_id"], **outcomes[change["order_id"]]} for change in changes]
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save
+from django.dispatch import Signal, receiver
+from .events import publish_order_event
+from .models import Order
+
+# Sent inside the writing transaction whenever orders change status, single
+# saves and bulk transitions alike. `changes` is a list of
+# (order_id, old_status, new_status).
+order_status_changed = Signal()
+
+
+@receiver(post_save, sender=Order)
+def publish_order_change(sender, instance, created, **kwargs):
+    old_status = getattr(instance, "_loaded_status", instance.status)
+    if created:
+        publish_order_event(instance, "order.created")
+    elif instance.status != old_status:
+        publish_order_event(instance, "order.status")
+        order_status_changed.send(sender=Order, changes=[(instance.pk, old_status, instance.status)])
+    instance._loaded_status = instance.status
@@ -1,3 +1,767 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.db import connection, connections, transaction
+from django.core.cache import cache, caches
+from django.core.checks import run_checks
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import CustomUser
+from aptech_python.db_router import ReplicaRouter, choose_replica, is_pinned, read_from_replica
+from restaurants.models import Restaurant, Dish, FoodType
+from . import cart_store, events, services
+from .archive import archive_orders
+from .cart_store import CartBusy, _locked, flush_cart, flush_dirty_carts
+from .models import Order, Cart, CartItem, ArchivedOrder, IdempotencyKey, StaleOrder
+from .serializers import CartSerializer
 
 # Create your tests here.
+
+
+class OrderWriteTestMixin:
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = CustomUser.objects.create_user(email="customer@example.com", password="pass")
+        owner = CustomUser.objects.create_user(
+            email="owner@example.com", password="pass", role=CustomUser.Role.RESTAURANT_OWNER
+        )
+        self.restaurant = Restaurant.objects.create(owner=owner, name="Mama Put")
+        food_type = FoodType.objects.create(name="Vegetarian")
+        self.dishes = [
+            Dish.objects.create(
+                restaurant=self.restaurant, name=f"Dish {i}", price=Decimal("2.50") + i, food_type=food_type
+            )
+            for i in range(15)
+        ]
+        self.client.force_authenticate(self.customer)
+        cache.clear()
+        caches["carts"].clear()
+
+
+class OrderWriteQueryCountTests(OrderWriteTestMixin, TestCase):
+    def place_order(self, line_count):
+        payload = {
+            "restaurant_id": str(self.restaurant.id),
+            "items": [{"dish_id": str(d.id), "quantity": 2} for d in self.dishes[:line_count]],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/orders/create/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(ctx.captured_queries)
+
+    def test_order_create_query_count_is_flat(self):
+        self.assertEqual(self.place_order(1), self.place_order(15))
+
+    def test_order_total_is_computed_in_memory(self):
+        self.place_order(3)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, sum(d.price * 2 for d in self.dishes[:3]))
+        self.assertEqual(order.items.count(), 3)
+
+    def test_checkout_query_count_is_flat(self):
+        cart = Cart.objects.create(user=self.customer)
+
+        def checkout(line_count):
+            CartItem.objects.bulk_create(
+                CartItem(cart=cart, dish=d, quantity=1, price=d.price) for d in self.dishes[:line_count]
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post("/orders/cart/checkout/")
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertFalse(cart.items.exists())
+            return len(ctx.captured_queries)
+
+        self.assertEqual(checkout(1), checkout(15))
+
+
+class StoredTotalsTests(OrderWriteTestMixin, TestCase):
+    def test_cart_totals_follow_item_changes(self):
+        dish = self.dishes[0]
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(dish.id), "quantity": 3}, format="json")
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[1].id)}, format="json")
+        response = self.client.post("/orders/cart/decrease_item/", {"dish_id": str(dish.id), "quantity": 1}, format="json")
+        self.assertEqual(response.data["item_count"], 3)
+        self.assertEqual(Decimal(response.data["total_amount"]), dish.price * 2 + self.dishes[1].price)
+
+        flush_cart(str(self.customer.pk))
+        cart = Cart.objects.get(user=self.customer)
+        Cart.objects.filter(pk=cart.pk).update(total_amount=0, item_count=0)
+        Cart.objects.all().recalculate_totals()
+        cart.refresh_from_db()
+        self.assertEqual((cart.total_amount, cart.item_count), (dish.price * 2 + self.dishes[1].price, 3))
+
+
+class CheckoutTests(OrderWriteTestMixin, TestCase):
+    def test_repriced_cart_is_refreshed_instead_of_checked_out(self):
+        dish = self.dishes[0]
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(dish.id), "quantity": 2}, format="json")
+        Dish.objects.filter(pk=dish.pk).update(price=Decimal("9.99"))
+
+        response = self.client.post("/orders/cart/checkout/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.get(user=self.customer).total_amount, Decimal("19.98"))
+
+        response = self.client.post("/orders/cart/checkout/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data["order"]["total_amount"]), Decimal("19.98"))
+
+    def test_items_taken_by_another_checkout_meanwhile_give_a_conflict(self):
+        # runs everywhere, unlike ConcurrentCheckoutTests: the other checkout is replayed between lock and delete
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id), "quantity": 2}, format="json")
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[1].id)}, format="json")
+        create_order = services.create_order
+
+        def create_order_then_lose_the_items(*args, **kwargs):
+            created = create_order(*args, **kwargs)
+            CartItem.objects.filter(cart__user=self.customer).delete()
+            return created
+
+        with mock.patch.object(services, "create_order", side_effect=create_order_then_lose_the_items):
+            response = self.client.post("/orders/cart/checkout/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(str(response.data["detail"]), services.CheckoutConflict.default_detail)
+        self.assertFalse(Order.objects.exists())
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentCheckoutTests(OrderWriteTestMixin, TransactionTestCase):
+    def test_parallel_checkouts_create_one_order(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        barrier = threading.Barrier(2)
+        codes = []
+
+        def checkout():
+            client = APIClient()
+            client.force_authenticate(self.customer)
+            barrier.wait()
+            try:
+                codes.append(client.post("/orders/cart/checkout/").status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=checkout) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(codes), [201, 400])
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class IdempotencyTests(OrderWriteTestMixin, TestCase):
+    def test_replayed_checkout_returns_stored_response(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        first = self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data["order"]["id"], str(first.data["order"]["id"]))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(any("orders_order" in q["sql"] for q in ctx.captured_queries))
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_a_duplicate_sent_while_the_first_runs_does_not_run_again(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        checkout, duplicates = cart_store.checkout, []
+
+        def checkout_with_a_duplicate(user):
+            duplicates.append(self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1"))
+            return checkout(user)
+
+        with mock.patch.object(cart_store, "checkout", side_effect=checkout_with_a_duplicate):
+            first = self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual((first.status_code, duplicates[0].status_code), (201, 409))
+        retry = self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual((retry.status_code, retry["Idempotent-Replayed"]), (201, "true"))
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_a_key_left_by_a_crashed_request_is_taken_over_after_its_lease(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        with mock.patch.object(cart_store, "checkout", side_effect=SystemExit):  # the worker dies mid-request
+            with self.assertRaises(SystemExit):
+                self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1").status_code, 409)
+
+        IdempotencyKey.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        retry = self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(retry.status_code, 201)
+        replay = self.client.post("/orders/cart/checkout/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(replay.data["order"]["id"], str(retry.data["order"]["id"]))
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OrderListingTests(OrderWriteTestMixin, TestCase):
+    def test_my_orders_cursor_walks_every_order_once(self):
+        for i in range(5):
+            self.client.post(
+                "/orders/create/",
+                {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(self.dishes[i].id)}]},
+                format="json",
+            )
+        seen, url, page_queries = [], "/orders/my-orders/?page_size=2", []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            page_queries.append(len(ctx.captured_queries))
+            seen += [order["id"] for order in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        self.assertEqual(len(set(page_queries)), 1)
+
+
+class OrderTransitionTests(OrderWriteTestMixin, TestCase):
+    def test_bulk_transition_reports_each_order(self):
+        for dish in self.dishes[:3]:
+            self.client.post(
+                "/orders/create/",
+                {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(dish.id)}]},
+                format="json",
+            )
+        pending, stale, delivered = Order.objects.order_by("created_at", "id")
+        Order.objects.filter(pk=stale.pk).update(version=5)
+        Order.objects.filter(pk=delivered.pk).update(status=Order.Status.DELIVERED)
+
+        self.client.force_authenticate(self.restaurant.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                "/orders/restaurant-orders/transition/",
+                {"transitions": [
+                    {"order_id": str(pending.id), "status": "preparing", "version": 0},
+                    {"order_id": str(stale.id), "status": "preparing", "version": 0},
+                    {"order_id": str(delivered.id), "status": "preparing"},
+                ]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["result"] for r in response.data["results"]], ["updated", "conflict", "invalid_transition"])
+        self.assertEqual(sum(q["sql"].startswith('UPDATE "orders_order"') for q in ctx.captured_queries), 1)
+        pending.refresh_from_db()
+        self.assertEqual((pending.status, pending.version), ("preparing", 1))
+
+
+class OrderSaveTests(OrderWriteTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(
+            "/orders/create/",
+            {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(self.dishes[0].id)}]},
+            format="json",
+        )
+        self.order = Order.objects.get()
+
+    def test_status_changes_are_checked_and_bump_the_version(self):
+        self.order.status = Order.Status.PAID
+        self.order.save()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("paid", 1))
+
+        self.order.status = Order.Status.PENDING
+        with self.assertRaises(ValidationError):
+            self.order.save()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("paid", 1))
+
+    def test_a_refreshed_instance_saves_from_its_refreshed_status(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.Status.PAID)
+        self.order.refresh_from_db()
+        self.order.status = Order.Status.PREPARING
+        self.order.save()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("preparing", 1))
+
+    def test_a_stale_instance_loses_to_a_concurrent_transition(self):
+        self.client.force_authenticate(self.restaurant.owner)
+        self.client.post(
+            "/orders/restaurant-orders/transition/",
+            {"transitions": [{"order_id": str(self.order.id), "status": "cancelled"}]},
+            format="json",
+        )
+        self.order.status = Order.Status.PAID
+        with self.assertRaises(ValidationError):
+            self.order.full_clean()
+        with self.assertRaises(StaleOrder):
+            self.order.save()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ("cancelled", 1))
+
+
+class OrderDetailTests(OrderWriteTestMixin, TestCase):
+    def test_unchanged_order_polls_as_304_without_loading_it(self):
+        self.client.post(
+            "/orders/create/",
+            {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(self.dishes[0].id)}]},
+            format="json",
+        )
+        order = Order.objects.get()
+        url = f"/orders/{order.pk}/"
+        first = self.client.get(url)
+        self.assertEqual((first.status_code, first.data["status"]), (200, "pending"))
+        self.assertTrue(first["Last-Modified"])
+
+        with self.assertNumQueries(1):  # just the version/updated_at lookup
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        self.client.force_authenticate(self.restaurant.owner)
+        self.client.post(
+            "/orders/restaurant-orders/transition/", {"order_ids": [str(order.pk)], "status": "preparing"}, format="json"
+        )
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual((changed.status_code, changed.data["status"]), (200, "preparing"))
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+        self.client.force_authenticate(CustomUser.objects.create_user(email="other@example.com", password="pass"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ArchiveTests(OrderWriteTestMixin, TestCase):
+    def test_my_orders_reads_across_hot_and_archived(self):
+        for dish in self.dishes[:4]:
+            self.client.post(
+                "/orders/create/",
+                {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(dish.id), "quantity": 2}]},
+                format="json",
+            )
+        before = self.client.get("/orders/my-orders/").data["results"]
+        old = Order.objects.order_by("created_at", "id")[:2]
+        Order.objects.filter(pk__in=[o.pk for o in old]).update(status=Order.Status.DELIVERED)
+
+        self.assertEqual(archive_orders(older_than_days=-1, batch_size=1), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+        seen, url = [], "/orders/my-orders/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            seen += response.data["results"]
+            url = response.data["next"]
+        self.assertEqual([o["id"] for o in seen], [o["id"] for o in before])
+        self.assertEqual(seen[-1]["items"][0]["dish_name"], before[-1]["items"][0]["dish_name"])
+
+
+class ExportTests(OrderWriteTestMixin, TestCase):
+    def test_export_streams_every_line(self):
+        self.client.post(
+            "/orders/create/",
+            {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(d.id), "quantity": 2} for d in self.dishes[:3]]},
+            format="json",
+        )
+        self.client.force_authenticate(self.restaurant.owner)
+        response = self.client.get("/orders/restaurant-orders/export/")
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith("order_id,created_at"))
+
+        response = self.client.get("/orders/restaurant-orders/export/?export_format=ndjson&status=delivered")
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_export_streams_under_asgi_without_buffering(self):
+        # what an ASGI server does with the response: iterate it asynchronously
+        pulled = []
+
+        def rows(*args):
+            for i in range(5):
+                pulled.append(i)
+                yield (f"order-{i}", "2026-01-01T00:00:00", "delivered", "5.00", 1, "dish", "Egusi", 1, "5.00", "5.00")
+
+        async def first_part_then_rest(response):
+            parts = response.__aiter__()
+            first = await parts.__anext__()
+            pulled_at_first = len(pulled)
+            return first, pulled_at_first, [part async for part in parts]
+
+        self.client.force_authenticate(self.restaurant.owner)
+        with mock.patch("orders.views.export_rows", rows), mock.patch("orders.export.LINES_PER_HOP", 2):
+            response = self.client.get("/orders/restaurant-orders/export/")
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")  # Django warns when it has to buffer a sync iterator
+                first, pulled_at_first, rest = async_to_sync(first_part_then_rest)(response)
+        self.assertTrue(first.startswith(b"order_id,created_at"))
+        self.assertEqual(pulled_at_first, 1)  # the header and one row, not the whole export
+        self.assertEqual(len(rest), 5)
+        self.assertTrue(rest[-1].startswith(b"order-4,"))
+
+
+class OrderEventTests(OrderWriteTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = events.InProcessBroker()
+        patcher = mock.patch.object(events, "_broker", self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.channel = str(self.restaurant.id)
+
+    def published(self):
+        return [(e.type, e.data["status"], e.data["version"]) for e in self.broker._history[self.channel]]
+
+    def test_orders_publish_on_create_and_on_every_status_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/orders/create/",
+                {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(self.dishes[0].id)}]},
+                format="json",
+            )
+        order = Order.objects.get()
+        self.client.force_authenticate(self.restaurant.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/orders/restaurant-orders/transition/",
+                {"transitions": [{"order_id": str(order.id), "status": "paid"}]},
+                format="json",
+            )
+        order.refresh_from_db()
+        order.status = Order.Status.PREPARING
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(self.published(), [
+            ("order.created", "pending", 0), ("order.status", "paid", 1), ("order.status", "preparing", 2),
+        ])
+
+    def test_rolled_back_writes_publish_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.client.post(
+                    "/orders/create/",
+                    {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(self.dishes[0].id)}]},
+                    format="json",
+                )
+                raise RuntimeError
+        self.assertEqual(self.published(), [])
+
+    def test_events_are_framed_as_server_sent_events(self):
+        event = events.Event(7, "order.status", {"id": "a1", "total_amount": Decimal("5.50")})
+        self.assertEqual(event.encode(), 'id: 7\nevent: order.status\ndata: {"id": "a1", "total_amount": "5.50"}\n\n')
+
+    def test_in_process_broker_fans_out_per_channel(self):
+        async def scenario():
+            first, second = self.broker.subscribe("a"), self.broker.subscribe("a")
+            other = self.broker.subscribe("b")
+            self.broker.publish("a", "order.created", {"n": 1})
+            received = [await sub.next(timeout=1) for sub in (first, second)]
+            missed = await other.next(timeout=0.05)
+            for sub in (first, second, other):
+                sub.close()
+            self.broker.publish("a", "order.created", {"n": 2})
+            return received, missed, self.broker._subscribers["a"]
+
+        received, missed, left = async_to_sync(scenario)()
+        self.assertEqual([(e.type, e.data) for e in received], [("order.created", {"n": 1})] * 2)
+        self.assertIs(received[0], received[1])
+        self.assertIsNone(missed)
+        self.assertEqual(left, set())
+
+    def test_events_arriving_out_of_order_are_delivered_once(self):
+        async def scenario():
+            sub = self.broker.subscribe("a")
+            # a worker's event can land after a later one from another worker, and the backlog can repeat one
+            for event_id in (10, 9, 10):
+                self.broker.deliver("a", events.Event(event_id, "order.status", {"n": event_id}))
+            received = [await sub.next(timeout=0.05) for _ in range(3)]
+            sub.close()
+            return received
+
+        received = async_to_sync(scenario)()
+        self.assertEqual([e and e.id for e in received], [10, 9, None])
+
+    @override_settings(ORDER_EVENTS_HEARTBEAT_SECONDS=0.05)
+    async def test_the_feed_resumes_after_last_event_id(self):
+        for status in ("pending", "paid", "preparing"):
+            self.broker.publish(self.channel, "order.status", {"status": status})
+        seen = list(self.broker._history[self.channel])[0].id
+        client, auth = AsyncClient(), f"Bearer {AccessToken.for_user(self.restaurant.owner)}"
+
+        response = await client.get(
+            "/orders/restaurant-orders/stream/", headers={"Authorization": auth, "Last-Event-ID": str(seen)}
+        )
+        self.assertEqual((response.status_code, response["Content-Type"]), (200, "text/event-stream"))
+        stream = aiter(response.streaming_content)
+        chunks = [await anext(stream) for _ in range(4)]
+        await stream.aclose()
+        self.assertEqual(chunks[0], b"retry: 3000\n\n")
+        self.assertEqual(
+            [re.findall(r'"status": "(\w+)"', chunk.decode()) for chunk in chunks[1:3]], [["paid"], ["preparing"]]
+        )
+        self.assertEqual(chunks[3], b": keep-alive\n\n")
+
+        self.assertEqual((await client.get("/orders/restaurant-orders/stream/")).status_code, 403)
+
+
+@override_settings(REPLICA_DATABASES=["default"])  # the mirror alias stands in for a replica
+class ReplicaRoutingTests(OrderWriteTestMixin, TestCase):
+    def test_reads_follow_the_replica_context_and_writes_stay_on_primary(self):
+        router = ReplicaRouter()
+        with read_from_replica(self.customer) as alias:
+            self.assertEqual(alias, "default")
+            self.assertEqual(router.db_for_read(Order), alias)
+            self.assertEqual(router.db_for_write(Order), "default")
+        with override_settings(REPLICA_DATABASES=[]), read_from_replica(self.customer) as alias:
+            self.assertIsNone(alias)
+
+    def test_user_is_pinned_to_primary_after_a_write(self):
+        self.assertEqual(choose_replica(self.customer), "default")
+        payload = {"restaurant_id": str(self.restaurant.id), "items": [{"dish_id": str(self.dishes[0].id)}]}
+        self.assertEqual(self.client.post("/orders/create/", payload, format="json").status_code, 201)
+        self.assertTrue(is_pinned(self.customer))
+        self.assertIsNone(choose_replica(self.customer))
+        # and the read right after still sees the new order
+        self.assertEqual(len(self.client.get("/orders/my-orders/").data["results"]), 1)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with override_settings(REPLICA_MAX_LAG_SECONDS=-1):
+            self.assertIsNone(choose_replica(self.customer))
+
+    def test_routing_ends_with_the_request_even_when_it_fails(self):
+        with mock.patch("aptech_python.db_router.choose_replica", return_value="unreachable"):
+            with self.assertRaises(Exception):
+                self.client.get("/orders/my-orders/")
+        self.assertEqual(ReplicaRouter().db_for_read(Order), "default")
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "carts": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "carts"},
+})
+class CartStoreTests(OrderWriteTestMixin, TestCase):
+    def add(self, dish, quantity=1):
+        return self.client.post("/orders/cart/add-item/", {"dish_id": str(dish.id), "quantity": quantity}, format="json")
+
+    def test_cart_reads_and_writes_skip_the_database(self):
+        self.add(self.dishes[0], 2)
+        self.add(self.dishes[1])
+        self.assertFalse(Cart.objects.exists())
+        with self.assertNumQueries(0):
+            response = self.client.get("/orders/cart/")
+        self.assertEqual(response.data["item_count"], 3)
+        self.assertEqual(response.data["total_amount"], "8.50")
+        with self.assertNumQueries(0):
+            response = self.client.post("/orders/cart/decrease_item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        self.assertEqual(response.data["item_count"], 2)
+
+    def test_flush_writes_the_cart_and_matches_the_serializer(self):
+        self.add(self.dishes[0], 2)
+        self.add(self.dishes[1])
+        self.add(self.dishes[0])
+        call_command("flush_carts", stdout=StringIO())
+
+        cart = Cart.objects.get(user=self.customer)
+        self.assertEqual((cart.total_amount, cart.item_count), (Decimal("11.00"), 4))
+        cached = self.client.get("/orders/cart/").json()
+        stored = json.loads(JSONRenderer().render(CartSerializer(cart).data))
+        key = lambda item: item["dish"]
+        self.assertEqual(sorted(cached.pop("items"), key=key), sorted(stored.pop("items"), key=key))
+        self.assertEqual(cached, stored)
+
+        # nothing dirty left, and a later change is flushed as an update
+        self.assertEqual(flush_dirty_carts(), 0)
+        self.client.post("/orders/cart/decrease_item/", {"dish_id": str(self.dishes[1].id)}, format="json")
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(list(cart.items.values_list("dish_id", "quantity")), [(self.dishes[0].id, 3)])
+
+    def test_flushed_cart_survives_losing_the_cache(self):
+        self.add(self.dishes[2], 3)
+        flush_dirty_carts()
+        caches["carts"].clear()
+        response = self.client.get("/orders/cart/")
+        self.assertEqual([(i["dish"], i["quantity"]) for i in response.data["items"]], [(str(self.dishes[2].id), 3)])
+
+    def test_a_failed_flush_keeps_the_cart_queued(self):
+        self.add(self.dishes[0], 2)
+        with mock.patch("orders.cart_store._flush", side_effect=RuntimeError):
+            self.assertEqual(flush_dirty_carts(), 0)
+        self.add(self.dishes[1])  # the blob is still dirty, so this queues nothing new
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(Cart.objects.get(user=self.customer).item_count, 3)
+
+    def test_a_cache_miss_does_not_overwrite_a_newer_blob(self):
+        load_from_db = cart_store._load_from_db
+
+        def edited_meanwhile(owner):
+            state = load_from_db(owner)
+            # a locked add_item stores its dirty blob between this read and the write-back
+            with mock.patch("orders.cart_store._load_from_db", load_from_db):
+                cart_store.add_item(owner, self.dishes[2], 4)
+            return state
+
+        with mock.patch("orders.cart_store._load_from_db", edited_meanwhile):
+            response = self.client.get("/orders/cart/")
+        self.assertEqual(response.data["item_count"], 4)
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(Cart.objects.get(user=self.customer).item_count, 4)
+
+    def test_checkout_flushes_and_empties_the_cart(self):
+        self.add(self.dishes[0], 2)
+        response = self.client.post("/orders/cart/checkout/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data["order"]["total_amount"]), Decimal("5.00"))
+        self.assertEqual(self.client.get("/orders/cart/").data["items"], [])
+
+
+class FileCartCacheTests(OrderWriteTestMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "carts": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name},
+            },
+            CART_LOCK_WAIT_SECONDS=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+        super().setUp()
+
+    def test_a_held_lock_is_exclusive_and_a_dead_one_expires(self):
+        with _locked("cart:someone"):
+            with self.assertRaises(CartBusy):
+                with _locked("cart:someone"):
+                    pass
+            with _locked("cart:someone-else"):
+                pass
+            # its holder died CART_LOCK_TIMEOUT ago
+            (lock,) = os.listdir(os.path.join(self.directory, "locks"))
+            os.utime(os.path.join(self.directory, "locks", lock), (0, 0))
+            with self.assertRaises(CartBusy):
+                with _locked("cart:someone"):  # the first try clears the dead lock
+                    pass
+            with _locked("cart:someone"):
+                pass
+
+    def test_dirty_carts_are_marked_per_owner_and_flushed_once(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id), "quantity": 2}, format="json")
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[1].id)}, format="json")
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, "dirty"))), 1)
+
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(os.listdir(os.path.join(self.directory, "dirty")), [])
+        self.assertEqual(Cart.objects.get(user=self.customer).item_count, 3)
+        self.assertEqual(flush_dirty_carts(), 0)
+
+    def test_a_failed_flush_is_retried_on_the_next_run(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        with mock.patch("orders.cart_store._flush", side_effect=RuntimeError):
+            self.assertEqual(flush_dirty_carts(), 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, "dirty"))), 1)
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(Cart.objects.get(user=self.customer).item_count, 1)
+
+    def test_backends_without_atomic_locks_fail_the_system_checks(self):
+        self.assertEqual([e.id for e in run_checks(tags=["caches"])], [])
+        with override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "carts": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+        }):
+            self.assertIn("orders.E001", [e.id for e in run_checks(tags=["caches"])])
+
+
+class CartBatchTests(OrderWriteTestMixin, TestCase):
+    def batch(self, operations):
+        return self.client.post("/orders/cart/batch/", {"operations": operations}, format="json")
+
+    def test_batch_applies_every_operation_in_constant_queries(self):
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id), "quantity": 2}, format="json")
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[1].id)}, format="json")
+        operations = [
+            {"dish_id": str(self.dishes[0].id), "delta": 3},
+            {"dish_id": str(self.dishes[1].id), "set_quantity": 0},
+            *({"dish_id": str(d.id), "delta": 1} for d in self.dishes[2:12]),
+            {"dish_id": str(self.dishes[12].id), "set_quantity": 4},
+            {"dish_id": str(self.dishes[2].id), "delta": -1},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.batch(operations)
+        self.assertEqual(response.status_code, 200)
+        quantities = {i["dish"]: i["quantity"] for i in response.data["items"]}
+        expected = {str(self.dishes[0].id): 5, str(self.dishes[12].id): 4, **{str(d.id): 1 for d in self.dishes[3:12]}}
+        self.assertEqual(quantities, expected)
+        self.assertEqual(response.data["item_count"], sum(expected.values()))
+        cart = Cart.objects.get(user=self.customer)
+        self.assertEqual(cart.item_count, sum(expected.values()))
+
+        # query count doesn't grow with the batch
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(self.batch(operations[:2] * 20).data["items"]), len(expected))
+        with CaptureQueriesContext(connection) as big:
+            self.batch(operations[:2] + [{"dish_id": str(d.id), "set_quantity": 2} for d in self.dishes[3:15]])
+        self.assertEqual(len(small.captured_queries), len(big.captured_queries))
+        self.assertLess(len(ctx.captured_queries), 25)  # includes flushing the cached add-item edits
+
+    def test_batch_is_rejected_as_a_whole(self):
+        response = self.batch([
+            {"dish_id": str(self.dishes[0].id), "delta": 1},
+            {"dish_id": "00000000-0000-0000-0000-000000000000", "delta": 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.batch([{"dish_id": str(self.dishes[0].id), "delta": 1, "set_quantity": 2}]).status_code, 400)
+
+    def test_item_quantity_helpers_use_database_arithmetic(self):
+        cart = Cart.objects.create(user=self.customer)
+        item = CartItem.objects.create(cart=cart, dish=self.dishes[0], quantity=1, price=self.dishes[0].price)
+        stale = CartItem.objects.get(pk=item.pk)
+        item.increase_quantity(2)
+        stale.increase_quantity(1)  # would overwrite to 2 with read-modify-write
+        self.assertEqual(CartItem.objects.get(pk=item.pk).quantity, 4)
+        stale.decrease_quantity(10)
+        self.assertFalse(CartItem.objects.exists())
+        cart.refresh_from_db()
+        self.assertEqual((cart.total_amount, cart.item_count), (0, 0))
+
+
+class GuestCartTests(OrderWriteTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.guest = APIClient()
+
+    def test_guest_cart_merges_into_user_cart_on_login(self):
+        first = self.guest.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id), "quantity": 2}, format="json")
+        token = first["X-Cart-Token"]
+        self.assertEqual(self.guest.cookies["cart_token"].value, token)
+        self.guest.post("/orders/cart/batch/", {"operations": [{"dish_id": str(self.dishes[1].id), "delta": 1}]}, format="json")
+        self.assertEqual(self.guest.get("/orders/cart/").data["item_count"], 3)
+        self.assertEqual(self.guest.post("/orders/cart/checkout/").status_code, 401)
+
+        # the customer already had one of those dishes
+        self.client.post("/orders/cart/add-item/", {"dish_id": str(self.dishes[0].id)}, format="json")
+        response = self.guest.post("/user/login/", {"email": "customer@example.com", "password": "pass"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies["cart_token"].value, "")
+
+        cart = Cart.objects.get(user=self.customer)
+        self.assertEqual(
+            dict(cart.items.values_list("dish_id", "quantity")), {self.dishes[0].id: 3, self.dishes[1].id: 1}
+        )
+        self.assertEqual(cart.item_count, 4)
+        self.assertFalse(Cart.objects.filter(token=token).exists())
+        self.assertEqual(self.client.get("/orders/cart/").data["item_count"], 4)
+
+    def test_purge_removes_only_abandoned_guest_carts(self):
+        old = Cart.objects.create(token="a" * 32)
+        CartItem.objects.create(cart=old, dish=self.dishes[0], price=self.dishes[0].price)
+        fresh = Cart.objects.create(token="b" * 32)
+        owned = Cart.objects.create(user=self.customer)
+        Cart.objects.filter(pk__in=[old.pk, owned.pk]).update(updated_at=timezone.now() - timedelta(days=30))
+
+        call_command("purge_anonymous_carts", "--batch-size", "1", stdout=StringIO())
+        self.assertEqual(set(Cart.objects.values_list("pk", flat=True)), {fresh.pk, owned.pk})
+        self.assertFalse(CartItem.objects.exists())
@@ -1,6 +1,7 @@
 from django.urls import path, include
-from .views import OrderCreateView, MyOrdersView, RestaurantOrdersView, CartViewSet
+from .views import OrderCreateView, SingleOrderCreateView, MyOrdersView, OrderDetailView, RestaurantOrdersView, RestaurantOrderExportView, OrderTransitionView, CartViewSet
 from rest_framework.routers import DefaultRouter
+from .feed import restaurant_order_feed
 
 
 router = DefaultRouter()
@@ -10,6 +11,11 @@ router.register(r"cart", CartViewSet, basename="cart")
 urlpatterns = [
     path("", include(router.urls)),
     path("create/", OrderCreateView.as_view(), name="order-create"),
+    path("create-single/", SingleOrderCreateView.as_view(), name="order-create-single"),
     path("my-orders/", MyOrdersView.as_view(), name="my-orders"),
+    path("<uuid:pk>/", OrderDetailView.as_view(), name="order-detail"),
     path("restaurant-orders/", RestaurantOrdersView.as_view(), name="restaurant-orders"),
+    path("restaurant-orders/export/", RestaurantOrderExportView.as_view(), name="restaurant-orders-export"),
+    path("restaurant-orders/transition/", OrderTransitionView.as_view(), name="restaurant-orders-transition"),
+    path("restaurant-orders/stream/", restaurant_order_feed, name="restaurant-orders-stream"),
 ]
\ No newline at end of file
@@ -1,22 +1,39 @@
+import uuid
 from rest_framework import generics, permissions
 from accounts.permissions import IsCustomer, IsRestaurantOwner
-from .models import Order, Transaction, Cart, CartItem, OrderItem
+from .models import Order, Transaction, Cart, CartItem, OrderItem, ArchivedOrder
 from rest_framework import viewsets, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import action
 from restaurants.models import Dish
 from rest_framework.response import Response
-from .serializers import OrderSerializer, OrderCreateSerializer, CartSerializer, TransactionSerializer, AddToCartSerializer, SingleOrderCreateSerializer
+from rest_framework.exceptions import NotFound
+from api.pagination import KeysetPagination
+from api.mixins import ReplicaReadMixin
+from api.conditional import conditional, make_etag
+from .serializers import OrderSerializer, OrderCreateSerializer, CartSerializer, TransactionSerializer, AddToCartSerializer, CartBatchSerializer, SingleOrderCreateSerializer, BulkOrderTransitionSerializer, ArchivedOrderSerializer, OrderExportQuerySerializer
+from .services import transition_orders
+from .idempotency import idempotent
+from . import cart_store
+from .export import ExportResponse, export_rows, stream_csv, stream_ndjson
 
 class OrderCreateView(generics.CreateAPIView):
     serializer_class = OrderCreateSerializer
     permission_classes = [permissions.IsAuthenticated, IsCustomer]
 
+    @idempotent("orders.create")
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
 class SingleOrderCreateView(generics.CreateAPIView):
     serializer_class = SingleOrderCreateSerializer
     permission_classes = [permissions.IsAuthenticated, IsCustomer]
 
+    @idempotent("orders.create-single")
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
@@ -27,43 +44,154 @@ class SingleOrderCreateView(generics.CreateAPIView):
             "transaction": TransactionSerializer(txn).data
         }, status=status.HTTP_201_CREATED)
 
-class MyOrdersView(generics.ListAPIView):
+class MyOrdersView(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated, IsCustomer]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Order.objects.filter(customer=self.request.user).with_items()
+
+    def list(self, request, *args, **kwargs):
+        # one timeline across live and archived orders (see orders/archive.py)
+        archived = ArchivedOrder.objects.filter(customer=request.user).with_items()
+        page = self.paginator.paginate_querysets([self.get_queryset(), archived], request, self)
+        context = self.get_serializer_context()
+        data = [
+            (ArchivedOrderSerializer if isinstance(order, ArchivedOrder) else OrderSerializer)(order, context=context).data
+            for order in page
+        ]
+        return self.get_paginated_response(data)
+
+def _order_validators(view, request, pk):
+    """ETag/Last-Modified for one order from its version and updated_at, without loading it."""
+    row = (
+        view.get_queryset().filter(pk=pk).values_list("version", "updated_at").first()
+        or view.get_archived_queryset().filter(pk=pk).values_list("version", "archived_at").first()
+    )
+    if row is None:
+        return None
+    version, changed_at = row
+    return make_etag("order", pk, version, changed_at.isoformat(), request.accepted_renderer.format), changed_at.timestamp()
+
+
+class OrderDetailView(generics.RetrieveAPIView):
+    """
+    GET orders/<id>/ — one order, for tracking its status. Customers see their
+    own orders, owners their restaurant's. Supports If-None-Match /
+    If-Modified-Since, so polling an unchanged order is a 304.
+    """
+    serializer_class = OrderSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user).order_by("-created_at")
+        user = self.request.user
+        return Order.objects.filter(Q(customer=user) | Q(restaurant__owner=user))
+
+    def get_archived_queryset(self):
+        user = self.request.user
+        return ArchivedOrder.objects.filter(Q(customer=user) | Q(restaurant__owner=user))
+
+    @conditional(_order_validators)
+    def get(self, request, pk):
+        try:
+            order = get_object_or_404(self.get_queryset().with_items(), pk=pk)
+            serializer = OrderSerializer(order, context=self.get_serializer_context())
+        except Http404:
+            order = get_object_or_404(self.get_archived_queryset().with_items(), pk=pk)
+            serializer = ArchivedOrderSerializer(order, context=self.get_serializer_context())
+        return Response(serializer.data)
+
 
 class RestaurantOrdersView(generics.ListAPIView):
     """
     For restaurant owners to view/filter today's orders or by status, etc.
     Add filtering with query params like ?status=pending
+    Newest first, paginated by ?cursor= (see KeysetPagination).
     """
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated, IsRestaurantOwner]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        qs = Order.objects.filter(restaurant=self.request.user.restaurant).order_by("-created_at")
+        qs = Order.objects.filter(restaurant=self.request.user.restaurant).with_items()
         status = self.request.query_params.get("status")
         if status:
             qs = qs.filter(status=status)
         return qs
 
 
+class RestaurantOrderExportView(generics.GenericAPIView):
+    """
+    GET /orders/restaurant-orders/export/?start=...&end=...&status=delivered&export_format=csv|ndjson
+    Streams one row per order line (live + archived) without building the file in memory.
+    """
+    serializer_class = OrderExportQuerySerializer
+    permission_classes = [permissions.IsAuthenticated, IsRestaurantOwner]
+
+    def get(self, request):
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        q = params.validated_data
+        rows = export_rows(request.user.restaurant.id, q.get("start"), q.get("end"), q.get("status"))
+
+        if q["export_format"] == "ndjson":
+            response = ExportResponse(stream_ndjson(rows), content_type="application/x-ndjson")
+        else:
+            response = ExportResponse(stream_csv(rows), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="orders.{q["export_format"]}"'
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class OrderTransitionView(generics.GenericAPIView):
+    """
+    POST /orders/restaurant-orders/transition/
+    Bulk status changes for the owner's orders (e.g. mark 30 orders "preparing").
+    Returns a per-order outcome: updated / invalid_transition / conflict / not_found.
+    """
+    serializer_class = BulkOrderTransitionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsRestaurantOwner]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = transition_orders(request.user.restaurant.id, serializer.validated_data["changes"])
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
 class CartViewSet(viewsets.ViewSet):
-    permission_classes = [IsAuthenticated]
+    """
+    Carts are served from the cache store (orders/cart_store.py) and written to the db behind the scenes.
+    Guests get a cart too, keyed by the X-Cart-Token header or cart_token cookie handed out on first use;
+    it is merged into their own cart when they log in.
+    """
+    permission_classes = [AllowAny]
 
     def get_queryset(self):
         return Cart.objects.filter(user=self.request.user)
-    
-    def get_cart(self, user):
-        cart, _ = Cart.objects.get_or_create(user=user)
-        return cart
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.owner, self.new_token = cart_store.owner_for(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, "new_token", None):
+            response["X-Cart-Token"] = self.new_token
+            response.set_cookie(
+                settings.CART_TOKEN_COOKIE,
+                self.new_token,
+                max_age=settings.CART_ANONYMOUS_MAX_AGE,
+                httponly=True,
+                secure=True,
+                samesite="Lax",
+            )
+        return response
 
     def list(self, request):
-        """Get current user's cart"""
-        cart = self.get_cart(request.user)
-        return Response(CartSerializer(cart).data)
+        """Get current user's (or guest's) cart"""
+        return Response(cart_store.get_cart(self.owner))
 
     @action(detail=False, methods=["post"], url_path="add-item")
     def add_item(self, request):
@@ -73,74 +201,40 @@ class CartViewSet(viewsets.ViewSet):
         dish = serializer.validated_data["dish"]
         qty = serializer.validated_data["quantity"]
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, dish=dish, defaults={"quantity": qty, "price": dish.price})
-
-        if not created:
-            cart_item.quantity += qty
-            cart_item.save()
+        _, _, quantity, price = cart_store.add_item(self.owner, dish, qty)
 
         return Response(
             {
                 "message": "Item added to cart",
                 "dish": dish.name,
-                "quantity": cart_item.quantity,
-                "subtotal": cart_item.subtotal,
+                "quantity": quantity,
+                "subtotal": price * quantity,
             },
             status=status.HTTP_200_OK,
         )
     @action(detail=False, methods=["post"])
     def decrease_item(self, request):
         """Decrease a dish quantity (remove if 0)"""
-        dish_id = request.data.get("dish_id")
+        try:
+            dish_id = uuid.UUID(str(request.data.get("dish_id")))
+        except ValueError:
+            raise NotFound("This dish is not in your cart.")
         qty = int(request.data.get("quantity", 1))
-
-        cart = self.get_cart(request.user)
-        cart_item = get_object_or_404(CartItem, cart=cart, dish_id=dish_id)
-
-        if cart_item.quantity > qty:
-            cart_item.quantity -= qty
-            cart_item.save()
-        else:
-            cart_item.delete()
-
-        return Response(CartSerializer(cart).data)
+        return Response(cart_store.decrease_item(self.owner, dish_id, qty))
 
     @action(detail=False, methods=["post"])
-    def checkout(self, request):
-        """Checkout: use OrderCreateSerializer logic, then create Transaction"""
-        cart = self.get_cart(request.user)
-        if not cart.items.exists():
-            return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
-
-        restaurant = cart.items.first().dish.restaurant
-
-        # Build payload compatible with OrderCreateSerializer
-        data = {
-            "restaurant_id": restaurant.id,
-            "items": [
-                {"dish_id": item.dish.id, "quantity": item.quantity}
-                for item in cart.items.all()
-            ]
-        }
-
-        serializer = OrderCreateSerializer(data=data, context={"request": request})
+    def batch(self, request):
+        """Apply many {dish_id, delta | set_quantity} changes in one atomic request and return the new cart"""
+        serializer = CartBatchSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
-
-        # clear cart
-        cart.items.all().delete()
-
-        # create transaction
-        txn = Transaction.objects.create(
-            order=order,
-            user=request.user,
-            amount=order.total_amount,
-            reference=f"TXN-{order.id.hex[:8]}",
-        )
+        return Response(cart_store.apply_operations(self.owner, serializer.validated_data["operations"]))
 
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    @idempotent("orders.checkout")
+    def checkout(self, request):
+        """Checkout: flush the cached cart, then turn it into an order + Transaction under a row lock"""
+        order, txn = cart_store.checkout(request.user)
         return Response({
             "order": OrderSerializer(order).data,
             "transaction": TransactionSerializer(txn).data
         }, status=status.HTTP_201_CREATED)
-        
@@ -2,6 +2,7 @@ from rest_framework import generics, mixins
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from api.pagination import DefaultPagination
 
 from .models import Product
 from api.mixins import StaffEditorPermissionMixin;
@@ -115,8 +116,9 @@ def product_alt_view(request, pk=None, *args, **kwargs):
             data = ProductSerializer(obj, many=False).data;
             return Response(data);
         querySet = Product.objects.all()
-        data = ProductSerializer(querySet, many = True).data;
-        return Response(data);
+        paginator = DefaultPagination()
+        page = paginator.paginate_queryset(querySet, request)
+        return paginator.get_paginated_response(ProductSerializer(page, many = True).data);
     
     if method == "POST":
         serializer = ProductSerializer(data = request.data)
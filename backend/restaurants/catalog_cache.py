@@ -0,0 +1,161 @@
+"""
+Versioned response cache for the public catalogue endpoints.
+
+Cached responses are keyed by version counters plus the view name, URL
+kwargs and the normalized query string, so invalidating is just bumping a counter (O(1)) and
+stale entries are never read again; they simply expire.
+
+There are three kinds of counter:
+- one per restaurant, bumped by writes to that restaurant's dishes, menus,
+  categories or the restaurant itself;
+- "shared", bumped by writes to global categories and food types, which
+  every restaurant's listings include;
+- "all", bumped by every catalogue write, for listings that span restaurants.
+
+Versions are millisecond timestamps (never smaller than the previous value),
+so a counter lost to eviction restarts ahead of every entry cached under it,
+and a version doubles as the Last-Modified time of what it covers. Bumps run
+on transaction commit; see restaurants/signals.py for what triggers them.
+They also rebuild the affected full-menu snapshots (restaurants/menu_snapshot.py).
+
+The counters live in the CATALOG_CACHE_ALIAS cache, which has to be shared
+between workers (Redis in production) for invalidation to reach all of them.
+"""
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+from api.conditional import make_etag, respond_conditionally
+from aptech_python.db_router import read_from_primary
+from . import menu_snapshot
+
+ALL = "all"
+SHARED = "shared"
+METRICS = set()  # names registered by @cached_response, for catalog_cache_stats()
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    return f"catalog:v:{scope}"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def get_versions(*scopes):
+    """Current version per scope, starting a counter at "now" if it doesn't exist (yet, or anymore)."""
+    keys = {scope: _version_key(scope) for scope in scopes}
+    found = _cache().get_many(keys.values())
+    versions = {}
+    for scope, key in keys.items():
+        if key not in found:
+            _cache().add(key, _now_ms(), None)
+            found[key] = _cache().get(key) or _now_ms()
+        versions[scope] = found[key]
+    return versions
+
+
+def _bump(scopes):
+    cache = _cache()
+    current = cache.get_many([_version_key(scope) for scope in scopes])
+    now = _now_ms()
+    cache.set_many(
+        {_version_key(scope): max(now, current.get(_version_key(scope), 0) + 1) for scope in scopes}, None
+    )
+
+
+def bump(restaurant_id=None):
+    """
+    Invalidate everything cached for a restaurant (or, with None, for the
+    global categories/food types) once the current transaction commits, and
+    rebuild the full-menu snapshots that show it.
+    """
+    scopes = [ALL, str(restaurant_id) if restaurant_id else SHARED]
+    transaction.on_commit(lambda: _bump(scopes))
+    transaction.on_commit(lambda: menu_snapshot.rebuild_later(restaurant_id))
+
+
+def _normalized_query(request, kwargs):
+    """The URL kwargs plus the query string, with parameter order ignored."""
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    return hashlib.sha1(repr((sorted(kwargs.items()), params)).encode()).hexdigest()
+
+
+def _count(name, outcome):
+    key = f"catalog:metrics:{name}:{outcome}"
+    try:
+        _cache().incr(key)
+    except ValueError:
+        _cache().add(key, 0, None)
+        _cache().incr(key)
+
+
+def cached_response(name, scope=None, unless=None):
+    """
+    Cache a GET handler's 200 responses, and answer conditional GETs for them.
+
+    `scope(view, request, **kwargs)` returns the restaurant id the response is
+    limited to, or None when it can span restaurants. `unless(view, request)`
+    returning True skips all of this, e.g. for responses that depend on the user.
+    The ETag and Last-Modified come from the version counters alone, so a 304
+    costs a cache read and no queries. Responses carry X-Cache: HIT or MISS.
+
+    Misses are read from the primary even in replica-routed views
+    (api.mixins.ReplicaReadMixin): what they return is stored and tagged
+    under the current versions, and a lagging replica could still hold the
+    rows from before the bump.
+    """
+    METRICS.add(name)
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            if unless and unless(self, request):
+                return handler(self, request, *args, **kwargs)
+            with read_from_primary():
+                restaurant_id = scope(self, request, **kwargs) if scope else None
+            scopes = [str(restaurant_id), SHARED] if restaurant_id else [ALL]
+            versions = get_versions(*scopes)
+            key = "catalog:r:{}:{}:{}".format(
+                name, ".".join(f"{s}={versions[s]}" for s in scopes), _normalized_query(request, kwargs)
+            )
+
+            def respond():
+                if not settings.CATALOG_CACHE_ENABLED:
+                    with read_from_primary():  # still tagged with the versions' ETag
+                        return handler(self, request, *args, **kwargs)
+                data = _cache().get(key)
+                if data is not None:
+                    _count(name, "hits")
+                    return Response(data, headers={"X-Cache": "HIT"})
+
+                with read_from_primary():
+                    response = handler(self, request, *args, **kwargs)
+                _count(name, "misses")
+                if response.status_code == 200:
+                    _cache().set(key, response.data, settings.CATALOG_CACHE_TTL)
+                response["X-Cache"] = "MISS"
+                return response
+
+            # the renderer is part of the representation (JSON vs the browsable API)
+            etag = make_etag(key, request.accepted_renderer.format)
+            return respond_conditionally(request, etag, max(versions.values()) / 1000, respond)
+        return wrapper
+    return decorator
+
+
+def catalog_cache_stats():
+    stats = {}
+    for name in sorted(METRICS):
+        counts = _cache().get_many([f"catalog:metrics:{name}:hits", f"catalog:metrics:{name}:misses"])
+        hits = counts.get(f"catalog:metrics:{name}:hits", 0)
+        misses = counts.get(f"catalog:metrics:{name}:misses", 0)
+        stats[name] = {"hits": hits, "misses": misses, "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None}
+    return stats
@@ -0,0 +1,179 @@
+"""
+Bulk dish import: a whole menu in one request (or `manage.py import_dishes`).
+
+Rows come from CSV or JSON and are validated together. Food types,
+categories and menus are looked up by name with one query each, and every
+problem is reported against its row (1-based). Valid rows are upserted by
+(restaurant, name) with one bulk_create(update_conflicts=True) and their
+category/menu links are replaced in bulk. Those bulk writes send no signals,
+so search documents and the catalogue cache are refreshed explicitly, once.
+
+Images are not fetched while importing: dishes with an image_url are marked
+pending and come back from import_dishes() for fetch_images() to store after
+the commit (on the image upload pool for the API, inline for the command).
+"""
+import csv
+import io
+import json
+import logging
+import os
+from django.db import transaction
+from django.db.models import Q
+from api.images import ImageStatus, stash_url, store_image, submit
+from . import catalog_cache
+from .models import Category, Dish, FoodType, Menu
+from .search import refresh_search_documents
+from .serializers import DishImportRowSerializer
+
+logger = logging.getLogger(__name__)
+
+MAX_ROWS = 1000
+LIST_SEPARATOR = "|"  # between category/menu names in a CSV cell
+UPDATED_FIELDS = ["description", "price", "food_type", "is_available", "updated_at"]
+
+
+def parse_rows(content, fmt):
+    """Rows (dicts) from an uploaded CSV or JSON file. Raises ValueError when it can't be read."""
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    if fmt == "json":
+        try:
+            rows = json.loads(content)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON: {exc}")
+        return rows.get("dishes") if isinstance(rows, dict) else rows
+    rows = []
+    for row in csv.DictReader(io.StringIO(content)):
+        parsed = {}
+        for key, value in row.items():
+            if key is None:
+                continue  # more cells than headers; the row serializer can't use them anyway
+            key, value = key.strip(), (value or "").strip()
+            if key in ("categories", "menus"):
+                parsed[key] = [name.strip() for name in value.split(LIST_SEPARATOR) if name.strip()]
+            elif value:
+                parsed[key] = value  # empty cells fall back to the field defaults
+        rows.append(parsed)
+    return rows
+
+
+def import_dishes(restaurant, rows):
+    """
+    Validate and upsert `rows` into `restaurant`'s dishes. Returns the report
+    ({"created", "updated", "dishes", "errors"}) and the (dish id, image url)
+    pairs still to fetch. Invalid rows are reported and skipped; the rest are
+    written in one transaction.
+    """
+    if not isinstance(rows, list):
+        raise ValueError("Send a list of dishes.")
+    if len(rows) > MAX_ROWS:
+        raise ValueError(f"At most {MAX_ROWS} dishes per import.")
+
+    errors, valid, names = {}, [], set()
+    for number, row in enumerate(rows, start=1):
+        serializer = DishImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            errors[number] = serializer.errors
+        elif serializer.validated_data["name"] in names:
+            errors[number] = {"name": ["Appears more than once in this import."]}
+        else:
+            names.add(serializer.validated_data["name"])
+            valid.append((number, serializer.validated_data))
+
+    # every name referenced by any row, resolved with one query per kind
+    food_types = dict(FoodType.objects.filter(name__in={data["food_type"] for _, data in valid}).values_list("name", "id"))
+    categories = {}
+    for name, category_id, own in Category.objects.filter(
+        Q(restaurant=restaurant) | Q(restaurant__isnull=True),
+        name__in={name for _, data in valid for name in data.get("categories", [])},
+    ).values_list("name", "id", "restaurant_id"):
+        if own or name not in categories:  # the restaurant's own category wins over a global one
+            categories[name] = category_id
+    menus = dict(Menu.objects.filter(
+        restaurant=restaurant, name__in={name for _, data in valid for name in data.get("menus", [])}
+    ).values_list("name", "id"))
+
+    dishes = []
+    for number, data in valid:
+        problems = {}
+        if data["food_type"] not in food_types:
+            problems["food_type"] = [f"Unknown food type: {data['food_type']}."]
+        for field, known in (("categories", categories), ("menus", menus)):
+            missing = [name for name in data.get(field, []) if name not in known]
+            if missing:
+                problems[field] = [f"Unknown {field}: {', '.join(missing)}."]
+        if problems:
+            errors[number] = problems
+        else:
+            dishes.append((number, data))
+
+    report = {"created": 0, "updated": 0, "dishes": [], "errors": [
+        {"row": number, "errors": problems} for number, problems in sorted(errors.items())
+    ]}
+    if not dishes:
+        return report, []
+
+    names = [data["name"] for _, data in dishes]
+    with transaction.atomic():
+        existing = set(Dish.objects.filter(restaurant=restaurant, name__in=names).values_list("name", flat=True))
+        Dish.objects.bulk_create(
+            [
+                Dish(
+                    restaurant=restaurant, name=data["name"], description=data["description"], price=data["price"],
+                    food_type_id=food_types[data["food_type"]], is_available=data["is_available"],
+                )
+                for _, data in dishes
+            ],
+            update_conflicts=True, unique_fields=["restaurant", "name"], update_fields=UPDATED_FIELDS,
+        )
+        # the upsert can't report the ids of rows that already existed, so read them all back
+        ids = dict(Dish.objects.filter(restaurant=restaurant, name__in=names).values_list("name", "id"))
+
+        for field, known, target in (("categories", categories, "category_id"), ("menus", menus, "menu_id")):
+            through = getattr(Dish, field).through
+            replaced = [ids[data["name"]] for _, data in dishes if field in data]  # rows without the column keep their links
+            through.objects.filter(dish_id__in=replaced).delete()
+            through.objects.bulk_create([
+                through(**{"dish_id": ids[data["name"]], target: known[name]})
+                for _, data in dishes if field in data for name in dict.fromkeys(data[field])
+            ])
+
+        images = [(ids[data["name"]], data["image_url"]) for _, data in dishes if data.get("image_url")]
+        Dish.objects.filter(id__in=[pk for pk, _ in images]).update(image_status=ImageStatus.PENDING)
+        refresh_search_documents(Dish.objects.filter(id__in=ids.values()))
+        catalog_cache.bump(restaurant.id)
+
+    report["created"] = len(names) - len(existing)
+    report["updated"] = len(existing)
+    report["dishes"] = [{"row": number, "id": ids[data["name"]], "name": data["name"]} for number, data in dishes]
+    return report, images
+
+
+def fetch_images(restaurant_id, images):
+    """
+    Store each (dish id, image url), with its size variants, in the image
+    storage and point the dish at it. Failures are logged and skipped.
+    """
+    fetched = 0
+    for dish_id, url in images:
+        try:
+            source = stash_url(url)
+            try:
+                stored, variants = store_image(source, "aptech_python_onlineFood_delivery/dishes")
+            finally:
+                os.remove(source)
+        except Exception:
+            logger.exception("Could not fetch image %s for dish %s", url, dish_id)
+            Dish.objects.filter(pk=dish_id).update(image_status=ImageStatus.FAILED)
+            continue
+        fetched += Dish.objects.filter(pk=dish_id).update(
+            dish_image=stored, image_variants=variants, image_status=ImageStatus.READY
+        )
+    catalog_cache.bump(restaurant_id)  # update() sends no post_save
+    return fetched
+
+
+def fetch_images_later(restaurant_id, images):
+    """fetch_images() on the image upload pool (api/images.py), once the import has committed."""
+    if images:
+        submit(fetch_images, restaurant_id, images)
@@ -0,0 +1,73 @@
+import random
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from restaurants.filters import DishFilter
+from restaurants.models import Dish, FoodType, Restaurant
+
+WORDS = [
+    "jollof", "rice", "fried", "plantain", "suya", "beef", "chicken", "pepper", "soup", "egusi",
+    "okra", "yam", "pounded", "moi", "akara", "puff", "chin", "spicy", "grilled", "fish",
+    "ofada", "stew", "beans", "goat", "meat", "asun", "catfish", "banga", "efo", "riro",
+]
+QUERIES = ["jollof", "jollof rice", "peper soup", "grilled fish", "egusi", "suya beef", "plantan", "goat meat", "chick", "ofada stew"]
+
+
+class Command(BaseCommand):
+    help = "Seed a large synthetic catalogue (if needed) and time ?search= queries; reports p50/p95"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dishes", type=int, default=1_000_000, help="catalogue size to seed up to")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--target-ms", type=float, default=50.0)
+
+    def handle(self, *args, **options):
+        self.seed(options["dishes"])
+        rng = random.Random(0)
+        timings = []
+        for _ in range(options["queries"]):
+            query = rng.choice(QUERIES)
+            started = time.perf_counter()
+            # same path as GET /restaurants/dishes/?search=...: filter, then read one page
+            qs = DishFilter({"search": query}, queryset=Dish.objects.filter(is_available=True)).qs
+            list(qs.values("id", "name", "price")[: options["page_size"]])
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p50, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+        line = f"{Dish.objects.count()} dishes, {len(timings)} queries: p50 {p50:.1f} ms, p95 {p95:.1f} ms"
+        if p95 <= options["target_ms"]:
+            self.stdout.write(self.style.SUCCESS(line))
+        else:
+            self.stdout.write(self.style.WARNING(f"{line} (target {options['target_ms']:.0f} ms)"))
+
+    def seed(self, target):
+        missing = target - Dish.objects.count()
+        if missing <= 0:
+            return
+        food_type, _ = FoodType.objects.get_or_create(name="Non-Vegetarian")
+        restaurants = [
+            Restaurant.objects.create(name=f"Bench Kitchen {i}", description="benchmark data")
+            for i in range(max(1, missing // 10_000))
+        ]
+        rng = random.Random(1)
+        batch = []
+        for i in range(missing):
+            restaurant = restaurants[i % len(restaurants)]
+            # three words repeat within a restaurant, and (restaurant, name) is unique
+            name = f"{' '.join(rng.sample(WORDS, 3)).title()} {i}"
+            description = " ".join(rng.sample(WORDS, 8))
+            batch.append(Dish(
+                restaurant=restaurant,
+                food_type=food_type,
+                name=name,
+                description=description,
+                price=Decimal(rng.randint(500, 9000)) / 100,
+                # bulk_create skips save(), so fill the search document here
+                search_document=f"{description} {food_type.name} {restaurant.name}",
+            ))
+            if len(batch) == 5000:
+                Dish.objects.bulk_create(batch)
+                batch = []
+        Dish.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {missing} dishes.")
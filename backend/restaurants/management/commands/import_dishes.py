@@ -0,0 +1,35 @@
+import json
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.dish_import import fetch_images, import_dishes, parse_rows
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = "Create or update a restaurant's dishes from a CSV or JSON file (see restaurants/dish_import.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--restaurant", required=True, help="restaurant id")
+        parser.add_argument("--format", choices=["csv", "json"], help="default: from the file extension")
+        parser.add_argument("--skip-images", action="store_true", help="don't fetch image_url images")
+
+    def handle(self, *args, **options):
+        try:
+            restaurant = Restaurant.objects.get(pk=options["restaurant"])
+        except (Restaurant.DoesNotExist, ValidationError):
+            raise CommandError(f"No restaurant {options['restaurant']}")
+        fmt = options["format"] or ("json" if options["path"].lower().endswith(".json") else "csv")
+        try:
+            with open(options["path"], "rb") as handle:
+                report, images = import_dishes(restaurant, parse_rows(handle.read(), fmt))
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} dishes created, {report['updated']} updated, {len(report['errors'])} rows rejected."
+        ))
+        if images and not options["skip_images"]:
+            self.stdout.write(f"Fetched {fetch_images(restaurant.id, images)} of {len(images)} images.")
@@ -0,0 +1,168 @@
+"""
+Full-menu snapshots for restaurant pages.
+
+A restaurant's whole public menu (menus -> available dishes -> categories and
+food type) is stored as pre-serialized JSON, once per image size (the
+original images plus each of settings.IMAGE_VARIANTS). GET
+/restaurants/<id>/full-menu/ answers with one indexed lookup of that text and
+no serialization at all.
+
+A restaurant's first read builds its snapshots, after committing an empty
+placeholder row so that writes committing during that first build already
+schedule a rebuild (readers skip the placeholder). From then on every catalogue
+write that bumps its cache versions (catalog_cache.bump()) rebuilds them in
+the background once the write has committed; writes to food types and global
+categories rebuild every stored snapshot. The previous snapshot is served
+until the new one lands. A rebuild only replaces snapshots built before it
+started, so a slow one can't overwrite a newer one.
+
+MENU_SNAPSHOT_WORKERS = 0 rebuilds inline on commit instead.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.images import with_image_size
+from .models import Dish, Menu, MenuSnapshot, Restaurant
+from .serializers import MenuSnapshotDishSerializer, MenuSnapshotMenuSerializer, MenuSnapshotRestaurantSerializer
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_BUILT_AT = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)  # older than any real build
+
+_pool = None
+_queued = set()  # restaurants with a rebuild waiting on the pool; more bumps before it starts add nothing
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.MENU_SNAPSHOT_WORKERS, thread_name_prefix="menu-snapshot")
+        return _pool
+
+
+def _sized(tree, size):
+    """The menu tree with every image URL picked for `size` ("" for the originals)."""
+    return {
+        "restaurant": with_image_size(dict(tree["restaurant"]), "restaurant_image", size),
+        "menus": [
+            {
+                **with_image_size(dict(menu), "menu_image", size),
+                "dishes": [with_image_size(dict(dish), "dish_image", size) for dish in menu["dishes"]],
+            }
+            for menu in tree["menus"]
+        ],
+        "other_dishes": [with_image_size(dict(dish), "dish_image", size) for dish in tree["other_dishes"]],
+        "built_at": tree["built_at"],
+    }
+
+
+def build(restaurant_id):
+    """
+    Serialize the restaurant's menu and store a snapshot per image size.
+    Returns how many were written: 0 for an unknown restaurant, or when newer
+    snapshots were stored in the meantime.
+    """
+    started = timezone.now()
+    restaurant = Restaurant.objects.filter(pk=restaurant_id).first()
+    if restaurant is None:
+        return 0
+    # before reading anything: from here on, rebuild_later() sees this restaurant
+    MenuSnapshot.objects.get_or_create(
+        restaurant=restaurant, image_size="", defaults={"data": "", "built_at": PLACEHOLDER_BUILT_AT}
+    )
+    dishes = list(
+        Dish.objects.filter(restaurant=restaurant, is_available=True)
+        .select_related("food_type").prefetch_related("categories", "menus").order_by("name")
+    )
+    by_menu, other_dishes = {}, []
+    for dish, data in zip(dishes, MenuSnapshotDishSerializer(dishes, many=True).data):
+        menu_ids = [menu.pk for menu in dish.menus.all()]
+        for menu_id in menu_ids:
+            by_menu.setdefault(menu_id, []).append(data)
+        if not menu_ids:
+            other_dishes.append(data)
+    menus = list(Menu.objects.filter(restaurant=restaurant).order_by("name"))
+    tree = {
+        "restaurant": MenuSnapshotRestaurantSerializer(restaurant).data,
+        "menus": [
+            {**data, "dishes": by_menu.get(menu.pk, [])}
+            for menu, data in zip(menus, MenuSnapshotMenuSerializer(menus, many=True).data)
+        ],
+        "other_dishes": other_dishes,
+        "built_at": started,
+    }
+
+    written = 0
+    for size in ["", *settings.IMAGE_VARIANTS]:
+        data = JSONRenderer().render(_sized(tree, size)).decode()
+        stored = MenuSnapshot.objects.filter(restaurant=restaurant, image_size=size, built_at__lt=started)
+        if stored.update(data=data, built_at=started):
+            written += 1
+        else:
+            _, created = MenuSnapshot.objects.get_or_create(
+                restaurant=restaurant, image_size=size, defaults={"data": data, "built_at": started}
+            )
+            written += created
+    return written
+
+
+def get_snapshot(restaurant_id, size=""):
+    """
+    (JSON text, built_at) of the restaurant's menu with `size` images (the
+    originals for anything not in IMAGE_VARIANTS), building it now if there
+    is none yet. None for an unknown restaurant.
+    """
+    size = size if size in settings.IMAGE_VARIANTS else ""
+    snapshot = (
+        MenuSnapshot.objects.filter(restaurant_id=restaurant_id, image_size=size).exclude(data="")
+        .values_list("data", "built_at")
+    )
+    found = snapshot.first()
+    if found is None:
+        build(restaurant_id)  # a newer build may have stored it instead; either way it is there now
+        found = snapshot.first()
+    return found
+
+
+def rebuild_later(restaurant_id=None):
+    """
+    Rebuild the restaurant's snapshots (every restaurant's, for None) in the
+    background, if it has any. Runs after the write has committed.
+    """
+    snapshots = MenuSnapshot.objects.filter(image_size="")
+    if restaurant_id:
+        snapshots = snapshots.filter(restaurant_id=restaurant_id)
+    for pk in snapshots.values_list("restaurant_id", flat=True):
+        if not settings.MENU_SNAPSHOT_WORKERS:
+            _rebuild(pk)
+            continue
+        with _lock:
+            if pk in _queued:
+                continue
+            _queued.add(pk)
+        _get_pool().submit(_in_worker, pk)
+
+
+def _in_worker(restaurant_id):
+    with _lock:
+        _queued.discard(restaurant_id)  # from here on, a new bump needs a new rebuild
+    close_old_connections()
+    try:
+        _rebuild(restaurant_id)
+    finally:
+        close_old_connections()
+
+
+def _rebuild(restaurant_id):
+    try:
+        build(restaurant_id)
+    except Exception:
+        # the previous snapshot stays up; the next write retries
+        logger.exception("Could not rebuild the menu snapshot of restaurant %s", restaurant_id)
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 10:42
+
+import django.contrib.postgres.operations
+from django.db import migrations, models
+
+
+def backfill_search_documents(apps, schema_editor):
+    Dish = apps.get_model("restaurants", "Dish")
+    Through = Dish.categories.through
+    db = schema_editor.connection.alias
+    ids = list(Dish.objects.using(db).values_list("id", flat=True))
+    for start in range(0, len(ids), 2000):
+        chunk = ids[start:start + 2000]
+        categories = {}
+        for dish_id, name in Through.objects.using(db).filter(dish_id__in=chunk).values_list("dish_id", "category__name"):
+            categories.setdefault(dish_id, []).append(name)
+        rows = list(Dish.objects.using(db).filter(id__in=chunk).select_related("restaurant", "food_type"))
+        for dish in rows:
+            parts = [dish.description, *categories.get(dish.id, []), dish.food_type.name, dish.restaurant.name]
+            dish.search_document = " ".join(part for part in parts if part)
+        Dish.objects.using(db).bulk_update(rows, ["search_document"])
+
+
+POSTGRES_SEARCH_SQL = [
+    """
+    ALTER TABLE restaurants_dish ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(search_document, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX dish_search_vector_idx ON restaurants_dish USING GIN (search_vector)",
+    "CREATE INDEX dish_name_trgm_idx ON restaurants_dish USING GIN (name gin_trgm_ops)",
+]
+
+
+def add_postgres_search_index(apps, schema_editor):
+    # SQLite gets its FTS5 index from restaurants.search.ensure_sqlite_index() after migrate
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_SEARCH_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_postgres_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS dish_name_trgm_idx")
+        schema_editor.execute("ALTER TABLE restaurants_dish DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_alter_dish_dish_image_alter_menu_menu_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        django.contrib.postgres.operations.TrigramExtension(),  # no-op on other databases
+        migrations.RunPython(add_postgres_search_index, drop_postgres_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 11:14
+
+from django.db import migrations
+
+
+def rename_duplicate_dishes(apps, schema_editor):
+    """Keep the oldest dish of each (restaurant, name) as is; suffix the others with their id so they stay unique."""
+    Dish = apps.get_model("restaurants", "Dish")
+    db = schema_editor.connection.alias
+    dishes = Dish.objects.using(db).order_by("restaurant_id", "name", "created_at", "id")
+    previous, renamed = None, []
+    # renamed once the scan is done: the names are what it is ordered by
+    for pk, restaurant_id, name in dishes.values_list("id", "restaurant_id", "name").iterator(chunk_size=2000):
+        if (restaurant_id, name) == previous:
+            suffix = f" ({str(pk)[:8]})"
+            renamed.append(Dish(id=pk, name=name[:255 - len(suffix)] + suffix))
+        previous = (restaurant_id, name)
+    Dish.objects.using(db).bulk_update(renamed, ["name"], batch_size=2000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_dishes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='dish',
+            unique_together={('restaurant', 'name')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0006_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='image_variants',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='image_variants',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='image_variants',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 11:38
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0007_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('image_size', models.CharField(blank=True, max_length=10)),
+                ('data', models.TextField()),
+                ('built_at', models.DateTimeField()),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_snapshots', to='restaurants.restaurant')),
+            ],
+            options={
+                'unique_together': {('restaurant', 'image_size')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0008_menu_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='image_upload',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='image_upload',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='image_upload',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
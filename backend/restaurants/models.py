@@ -1,24 +1,45 @@
 from django.db import models
 from django.conf import settings
 import uuid
+from api.images import ImageStatus
+from .search import build_search_document
 
 User = settings.AUTH_USER_MODEL
 
 
+class LoadedNameMixin:
+    """Remembers the name as loaded, so signals can tell whether a save renamed the row (restaurants/signals.py)."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get("name")
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or "name" in fields:
+            self._loaded_name = self.__dict__.get("name")
+
+
 # Create your models here.
-class Restaurant(models.Model):
+class Restaurant(LoadedNameMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     owner = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name="restaurant")
     name = models.CharField(max_length=255, null=False, blank=False, default="Unnamed Restaurant")
     description = models.TextField(blank=True)
     restaurant_image = models.URLField(max_length=500, blank=True)
+    image_variants = models.CharField(max_length=500, blank=True)  # URL template of the size variants, api/images.py
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY)  # api/images.py
+    image_upload = models.UUIDField(null=True, blank=True, editable=False)  # the upload whose result may land, api/images.py
+    updated_at = models.DateTimeField(auto_now=True)
     # menu_card_image = models.ImageField(upload_to="restaurants/menu_cards/", blank=True, null=True)
     # # Add any branding fields you like
 
     def __str__(self):
         return self.name
 
-class FoodType(models.Model):
+class FoodType(LoadedNameMixin, models.Model):
     """
     Admin-defined types (Veg/Non-Veg etc.)
     """
@@ -36,7 +57,7 @@ class FoodType(models.Model):
     def __str__(self):
         return self.name
 
-class Category(models.Model):
+class Category(LoadedNameMixin, models.Model):
     """
     Categories like drink, soup, dessert, vegan, non-vegan, etc.
     Global + restaurant-specific categories.
@@ -55,6 +76,7 @@ class Category(models.Model):
         related_name="categories"
     )  
     # If null → global category (available for all restaurants)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("name", "restaurant")
@@ -71,16 +93,32 @@ class Dish(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     dish_image = models.URLField(max_length=500, blank=True)
+    image_variants = models.CharField(max_length=500, blank=True)  # URL template of the size variants, api/images.py
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY)  # api/images.py
+    image_upload = models.UUIDField(null=True, blank=True, editable=False)  # the upload whose result may land, api/images.py
     food_type = models.ForeignKey(FoodType, on_delete=models.PROTECT)
 
     categories = models.ManyToManyField(Category, related_name="dishes", blank=True)
     menus = models.ManyToManyField("Menu", related_name="dishes", blank=True)
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    updated_at = models.DateTimeField(auto_now=True)
+    # description, categories, food type and restaurant name, for search (restaurants/search.py)
+    search_document = models.TextField(blank=True, default="", editable=False)
+
+    class Meta:
+        # the key bulk imports upsert on (restaurants/dish_import.py)
+        unique_together = ("restaurant", "name")
 
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
+
+    def save(self, *args, **kwargs):
+        self.search_document = build_search_document(self)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "search_document", "updated_at"}
+        super().save(*args, **kwargs)
     
 
 
@@ -96,11 +134,33 @@ class Menu(models.Model):
     )
     name = models.CharField(max_length=255, default="Main Menu")
     menu_image = models.URLField(max_length=500, blank=True)
+    image_variants = models.CharField(max_length=500, blank=True)  # URL template of the size variants, api/images.py
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY)  # api/images.py
+    image_upload = models.UUIDField(null=True, blank=True, editable=False)  # the upload whose result may land, api/images.py
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("restaurant", "name")
 
     def __str__(self):
-        return f"{self.name} - {self.restaurant.name}"
\ No newline at end of file
+        return f"{self.name} - {self.restaurant.name}"
+
+
+class MenuSnapshot(models.Model):
+    """
+    A restaurant's whole public menu as pre-serialized JSON, one per image
+    size; see restaurants/menu_snapshot.py.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="menu_snapshots")
+    image_size = models.CharField(max_length=10, blank=True)  # "" for the original images
+    data = models.TextField()
+    built_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("restaurant", "image_size")
+
+    def __str__(self):
+        return f"{self.restaurant_id} menu ({self.image_size or 'original'})"
@@ -0,0 +1,243 @@
+"""
+Dish search behind DishFilter's `search` filter.
+
+Every dish keeps a denormalized `search_document` (description, categories,
+food type, restaurant name) next to its name; see build_search_document().
+Each database indexes that text its own way:
+
+- Postgres: a generated, weighted `search_vector` tsvector column with a GIN
+  index, plus a pg_trgm GIN index on the name so typos still match
+  (migration 0003). The generated column keeps the index fresh by itself.
+- SQLite: FTS5 tables fed by triggers (ensure_sqlite_index(), run after every
+  migrate). A trigram table is the typo fallback when nothing matches exactly.
+- Anything else: a plain icontains over name and document.
+
+search_dishes() filters a Dish queryset down to matches, annotates
+`search_rank` (higher is better) and orders by it. Only the first
+DISH_SEARCH_CANDIDATES index hits within the filtered queryset are ranked,
+name matches first, which keeps very broad queries fast on a large catalogue.
+"""
+import itertools
+import re
+import uuid
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import BooleanField, FloatField, IntegerField, Q
+from django.db.models.expressions import RawSQL
+
+WORDS = re.compile(r"\w+", re.UNICODE)
+
+FTS_TABLE = "restaurants_dish_fts"
+TRIGRAM_TABLE = "restaurants_dish_trigram"
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, document, dish_id UNINDEXED, tokenize='porter unicode61 remove_diacritics 2')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TRIGRAM_TABLE} USING fts5(name, dish_id UNINDEXED, tokenize='trigram')",
+]
+# rows are keyed by the dish table's rowid so triggers can find them without a scan
+SQLITE_TRIGGERS = {
+    "restaurants_dish_search_ai": f"""
+        CREATE TRIGGER restaurants_dish_search_ai AFTER INSERT ON restaurants_dish BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, document, dish_id) VALUES (new.rowid, new.name, new.search_document, new.id);
+            INSERT INTO {TRIGRAM_TABLE}(rowid, name, dish_id) VALUES (new.rowid, new.name, new.id);
+        END""",
+    "restaurants_dish_search_au": f"""
+        CREATE TRIGGER restaurants_dish_search_au AFTER UPDATE OF name, search_document ON restaurants_dish BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+            DELETE FROM {TRIGRAM_TABLE} WHERE rowid = old.rowid;
+            INSERT INTO {FTS_TABLE}(rowid, name, document, dish_id) VALUES (new.rowid, new.name, new.search_document, new.id);
+            INSERT INTO {TRIGRAM_TABLE}(rowid, name, dish_id) VALUES (new.rowid, new.name, new.id);
+        END""",
+    "restaurants_dish_search_ad": f"""
+        CREATE TRIGGER restaurants_dish_search_ad AFTER DELETE ON restaurants_dish BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+            DELETE FROM {TRIGRAM_TABLE} WHERE rowid = old.rowid;
+        END""",
+}
+
+
+def build_search_document(dish, category_names=None):
+    """Everything but the name that a dish should be findable by."""
+    if category_names is None:
+        category_names = list(dish.categories.values_list("name", flat=True)) if dish.pk and not dish._state.adding else []
+    parts = [dish.description, *category_names]
+    if dish.food_type_id:
+        parts.append(dish.food_type.name)
+    if dish.restaurant_id:
+        parts.append(dish.restaurant.name)
+    return " ".join(part for part in parts if part)
+
+
+def refresh_search_documents(dishes):
+    """Rebuild search_document for a Dish queryset: a few reads and one bulk UPDATE per batch."""
+    from .models import Dish
+
+    batch_size = 2000
+    ids = list(dishes.values_list("id", flat=True))
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        categories = {}
+        for dish_id, name in Dish.categories.through.objects.filter(dish_id__in=chunk).values_list("dish_id", "category__name"):
+            categories.setdefault(dish_id, []).append(name)
+        rows = list(Dish.objects.filter(id__in=chunk).select_related("restaurant", "food_type").only(
+            "id", "description", "restaurant__name", "food_type__name"
+        ))
+        for dish in rows:
+            dish.search_document = build_search_document(dish, categories.get(dish.id, []))
+        Dish.objects.bulk_update(rows, ["search_document"])
+
+
+def ensure_sqlite_index(connection):
+    """Create the FTS5 tables and triggers if missing, rebuilding the index when the triggers were lost."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'restaurants_dish'")
+        if cursor.fetchone() is None:
+            return  # restaurants not migrated yet
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'restaurants_dish_search_%'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing == set(SQLITE_TRIGGERS):
+            return
+        # first run, or a migration rebuilt restaurants_dish (which drops triggers and renumbers rowids)
+        for statement in SQLITE_SCHEMA:
+            cursor.execute(statement)
+        for name, statement in SQLITE_TRIGGERS.items():
+            if name not in existing:
+                cursor.execute(statement)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"DELETE FROM {TRIGRAM_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, document, dish_id) SELECT rowid, name, search_document, id FROM restaurants_dish"
+        )
+        cursor.execute(f"INSERT INTO {TRIGRAM_TABLE}(rowid, name, dish_id) SELECT rowid, name, id FROM restaurants_dish")
+
+
+def _postgres_search(queryset, words):
+    tsquery = "to_tsquery('english', %s)"
+    prefixes = " & ".join(f"{word}:*" for word in words)  # every word, as a prefix
+    query = " ".join(words)
+    # rank a bounded set of hits from the view's (already filtered) queryset, so a one-letter
+    # query over a big catalogue stays cheap; name matches first, so they make the cut-off
+    matching = queryset.alias(search_match=RawSQL(
+        f"(restaurants_dish.search_vector @@ {tsquery} OR restaurants_dish.name %% %s)", [prefixes, query],
+        output_field=BooleanField(),
+    )).filter(search_match=True)
+    name_match = RawSQL("restaurants_dish.name ILIKE ALL(%s)", [[f"%{word}%" for word in words]], output_field=BooleanField())
+    candidates = list(
+        matching.order_by(name_match.desc(), "id").values_list("id", flat=True)[: settings.DISH_SEARCH_CANDIDATES]
+    )
+    return queryset.filter(id__in=candidates).annotate(
+        search_rank=RawSQL(
+            f"GREATEST(ts_rank_cd(restaurants_dish.search_vector, {tsquery}), similarity(restaurants_dish.name, %s))",
+            [prefixes, query],
+            output_field=FloatField(),
+        )
+    ).order_by("-search_rank", "id")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _scorer(words):
+    """Roughly what bm25 would say: name hits count ten times a document hit, shorter names win ties."""
+    patterns = [re.compile(rf"\b{re.escape(word)}") for word in words]
+
+    def score(name, document):
+        name, document = name.lower(), document.lower()
+        total = sum(10 if p.search(name) else 1 if p.search(document) else 0 for p in patterns)
+        return total + 1 / (1 + name.count(" "))
+    return score
+
+
+def _similarity(query_trigrams, name):
+    """Share of trigrams in common, like pg_trgm's similarity()."""
+    name_trigrams = _trigrams(name.lower())
+    return len(query_trigrams & name_trigrams) / (len(query_trigrams | name_trigrams) or 1)
+
+
+def _sqlite_scope(queryset, table):
+    """
+    (sql, params) of an EXISTS clause keeping the rows of FTS `table` whose
+    dish is in `queryset`, so the view's filters apply before the cut-off.
+    """
+    in_table = RawSQL(f"restaurants_dish.rowid = {table}.rowid", [], output_field=BooleanField())
+    sql, params = queryset.order_by().alias(in_table=in_table).filter(in_table=True).values("pk").query.sql_with_params()
+    return f"EXISTS ({sql})", params
+
+
+def _sqlite_candidates(cursor, table, match, columns, limit, scope):
+    # no ORDER BY: FTS5 walks its doclists in rowid order, checks each hit's dish against the
+    # view's filters by rowid, and stops at the limit
+    scope_sql, scope_params = scope
+    cursor.execute(
+        f"SELECT dish_id, {columns} FROM {table} WHERE {table} MATCH %s AND {scope_sql} LIMIT %s",
+        [match, *scope_params, limit],
+    )
+    return cursor.fetchall()
+
+
+def _sqlite_search(queryset, words):
+    limit = settings.DISH_SEARCH_CANDIDATES
+    exact = " ".join(f'"{word}"' for word in words)
+    # the last word may still be being typed; prefix queries can't stop early, so they only top up
+    typed = " ".join([*(f'"{word}"' for word in words[:-1]), f'"{words[-1]}"*'])
+    try:
+        scope = _sqlite_scope(queryset, FTS_TABLE)
+    except EmptyResultSet:
+        return queryset  # already filtered down to nothing
+    with connections[queryset.db].cursor() as cursor:
+        # name matches first, so they make the candidate cut-off on broad queries
+        matches = [f"name : ({exact})", f"name : ({typed})", exact, typed]
+        if len(words) > 1 and not _sqlite_candidates(cursor, FTS_TABLE, exact.rsplit(" ", 1)[0], "name", 1, scope):
+            matches = matches[::2]  # the finished words match nothing, so skip the slow prefix queries
+        rows, seen = [], set()
+        for match in matches:
+            for row in _sqlite_candidates(cursor, FTS_TABLE, match, "name, document", limit, scope):
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    rows.append(row)
+            if len(rows) >= limit:
+                break
+        score = _scorer(words)
+        hits = [(dish_id, score(name, document)) for dish_id, name, document in rows]
+        if not hits:
+            # typo fallback: names sharing at least two trigrams with a query word, most similar first
+            clauses = []
+            for word in words:
+                grams = sorted(_trigrams(word))
+                clauses += [f'"{grams[0]}"'] if len(grams) == 1 else [
+                    f'("{a}" AND "{b}")' for a, b in itertools.combinations(grams, 2)
+                ]
+            if clauses:
+                query_trigrams = set().union(*(_trigrams(word) for word in words))
+                rows = _sqlite_candidates(
+                    cursor, TRIGRAM_TABLE, " OR ".join(clauses), "name", limit, _sqlite_scope(queryset, TRIGRAM_TABLE)
+                )
+                hits = [(dish_id, _similarity(query_trigrams, name)) for dish_id, name in rows]
+    if not hits:
+        return queryset.none()
+    hits.sort(key=lambda hit: -hit[1])
+    ids = [dish_id for dish_id, _ in hits[: settings.DISH_SEARCH_MAX_RESULTS]]
+    # ids are stored as 32-char hex on SQLite; position in the ranked list gives the order
+    return queryset.filter(id__in=[uuid.UUID(dish_id) for dish_id in ids]).annotate(
+        search_rank=RawSQL("-instr(%s, restaurants_dish.id)", [",".join(ids)], output_field=IntegerField())
+    ).order_by("-search_rank", "id")
+
+
+def search_dishes(queryset, query):
+    words = [word.lower() for word in WORDS.findall(query)]
+    if not words:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        return _postgres_search(queryset, words)
+    if vendor == "sqlite":
+        return _sqlite_search(queryset, words)
+    matches = Q()
+    for word in words:
+        matches &= Q(name__icontains=word) | Q(search_document__icontains=word)
+    return queryset.filter(matches)
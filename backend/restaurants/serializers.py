@@ -1,6 +1,6 @@
 from rest_framework import serializers
+from api.images import ImageVariantsMixin, upload_later
 from .models import Restaurant, FoodType, Dish, Menu, Category
-import cloudinary.uploader
 
 
 class FoodTypeSerializer(serializers.ModelSerializer):
@@ -15,25 +15,21 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ["id", "name", "restaurant"]
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_field = "restaurant_image"
     restaurant_image_upload = serializers.ImageField(write_only=True, required=False)
     class Meta:
         model = Restaurant
-        fields = ["id", "name", "description", 'restaurant_image', 'restaurant_image_upload', 'owner']
-        read_only_fields=['id', 'name', 'owner', 'description', 'restaurant_image']
+        fields = ["id", "name", "description", 'restaurant_image', 'restaurant_image_upload', 'image_status', 'image_variants', 'owner']
+        read_only_fields=['id', 'name', 'owner', 'description', 'restaurant_image', 'image_status', 'image_variants']
         
     def create(self, validated_data):
         restaurant_image_upload = validated_data.pop("restaurant_image_upload", None)
         owner = validated_data.pop("owner")
-        restaurant = Restaurant.objects.create(user=owner, **validated_data)
+        restaurant = Restaurant.objects.create(owner=owner, **validated_data)
         
         if restaurant_image_upload:
-            upload = cloudinary.uploader.upload(
-                restaurant_image_upload,
-                folder="aptech_python_onlineFood_delivery/restaurant_image"
-            )
-            restaurant.restaurant_image = upload.get('secure_url')
-            restaurant.save()
+            upload_later(restaurant, "restaurant_image", restaurant_image_upload, "aptech_python_onlineFood_delivery/restaurant_image")
         return restaurant;
     
     def update(self, instance, validated_data):
@@ -42,18 +38,15 @@ class RestaurantSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
-        if restaurant_image_upload:
-            upload = cloudinary.uploader.upload(
-                restaurant_image_upload,
-                folder="aptech_python_onlineFood_delivery/restaurant_image"
-            )
-            instance.restaurant_image = upload.get("secure_url")
         instance.save()
+        if restaurant_image_upload:
+            upload_later(instance, "restaurant_image", restaurant_image_upload, "aptech_python_onlineFood_delivery/restaurant_image")
         return instance
         
 
 
-class DishSerializer(serializers.ModelSerializer):
+class DishSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_field = "dish_image"
     categories = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), many=True, required=False)
     menus = serializers.PrimaryKeyRelatedField(queryset=Menu.objects.all(), many=True, required=False)
     restaurant = RestaurantSerializer(read_only=True)
@@ -66,16 +59,29 @@ class DishSerializer(serializers.ModelSerializer):
         fields = [
             "id", "name", "description", "price", "dish_image",
             "food_type", "categories", "menus",
-            "restaurant", "is_available", "created_at", "dish_image_upload"
+            "restaurant", "is_available", "created_at", "dish_image_upload", "image_status", "image_variants"
         ]
-        read_only_fields = ["id", "restaurant", "created_at"]
+        read_only_fields = ["id", "restaurant", "created_at", "image_status", "image_variants"]
 
     def validate_food_type(self, value):
         # Enforce only allowed names; shield against accidental rogue entries.
         if value.name not in {"Vegetarian", "Non-Vegetarian"}:
             raise serializers.ValidationError("FoodType must be 'Vegetarian' or 'Non-Vegetarian'.")
         return value
-    
+
+    def validate_name(self, value):
+        # (restaurant, name) is unique: bulk imports upsert on it
+        if self.instance:
+            restaurant = self.instance.restaurant
+        else:
+            restaurant = getattr(getattr(self.context.get("request"), "user", None), "restaurant", None)
+        duplicates = Dish.objects.filter(restaurant=restaurant, name=value)
+        if self.instance:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if restaurant and duplicates.exists():
+            raise serializers.ValidationError("Your restaurant already has a dish with this name.")
+        return value
+
 
     def _validate_related_belongs_to_restaurant(self, restaurant, categories, menus):
         # Categories: either global (restaurant=None) or same restaurant
@@ -99,14 +105,6 @@ class DishSerializer(serializers.ModelSerializer):
         validated_data["restaurant"] = restaurant
         
         dish = Dish.objects.create(**validated_data)
-        
-        if dish_image_upload:
-            upload = cloudinary.uploader.upload(
-                dish_image_upload,
-                folder="aptech_python_onlineFood_delivery/dishes"
-            )
-            dish.dish_image = upload.get('secure_url')
-            dish.save()
 
         self._validate_related_belongs_to_restaurant(restaurant, categories, menus)
 
@@ -114,6 +112,8 @@ class DishSerializer(serializers.ModelSerializer):
             dish.categories.set(categories)
         if menus:
             dish.menus.set(menus)
+        if dish_image_upload:
+            upload_later(dish, "dish_image", dish_image_upload, "aptech_python_onlineFood_delivery/dishes")
         return dish
 
 
@@ -125,48 +125,38 @@ class DishSerializer(serializers.ModelSerializer):
         
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-            
-        if dish_image_upload:
-            upload = cloudinary.uploader.upload(
-                dish_image_upload,
-                folder = "aptech_python_onlineFood_delivery/dishes"
-            )
-            instance.dish_image = upload.get("secure_url")
-            
-            instance.save()
-            return instance
+
         if categories is not None or menus is not None:
             self._validate_related_belongs_to_restaurant(instance.restaurant, categories or [], menus or [])
 
+        instance.save()
         if categories is not None:
             instance.categories.set(categories)
         if menus is not None:
             instance.menus.set(menus)
+        if dish_image_upload:
+            upload_later(instance, "dish_image", dish_image_upload, "aptech_python_onlineFood_delivery/dishes")
         return instance
     
 
 
-class MenuSerializer(serializers.ModelSerializer):
+class MenuSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_field = "menu_image"
     menu_image_upload = serializers.ImageField(write_only=True, required=False)
     class Meta:
         model = Menu
-        fields = ["id", "name", "description", "menu_image", "restaurant", "created_at", "menu_image_upload"]
-        read_only_fields = ["created_at", "restaurant", "menu_image"]
+        fields = ["id", "name", "description", "menu_image", "restaurant", "created_at", "menu_image_upload", "image_status", "image_variants"]
+        read_only_fields = ["created_at", "restaurant", "menu_image", "image_status", "image_variants"]
         
     def create(self, validated_data):
         menu_image_upload = validated_data.pop('menu_image_upload', None)
         # user = validated_data.pop('user')
         user = self.context["request"].user
         validated_data["restaurant"] = user.restaurant
-        menu = Menu.objects.create(user=user, **validated_data)
+        menu = Menu.objects.create(**validated_data)
         
         if menu_image_upload:
-            upload = cloudinary.uploader.upload(
-                menu_image_upload,
-                folder="aptech_python_onlineFood_delivery/menus"
-            )
-            menu.menu_image = upload.get('secure_url')
-            menu.save()
+            upload_later(menu, "menu_image", menu_image_upload, "aptech_python_onlineFood_delivery/menus")
         return menu;
         # return super().create(validated_data)
     def update(self, instance, validated_data):
@@ -175,16 +165,83 @@ class MenuSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
-        if menu_image_upload:
-            upload = cloudinary.uploader.upload(
-                menu_image_upload,
-                folder='aptech_python_onlineFood_delivery/menus'
-            )
-            instance.menu_image = upload.get('secure_url')
-        
         instance.save()
+        if menu_image_upload:
+            upload_later(instance, "menu_image", menu_image_upload, "aptech_python_onlineFood_delivery/menus")
         return instance
 
     def validate(self, attrs):
         # nothing special here—restaurant is set to owner’s restaurant on create
-        return attrs
\ No newline at end of file
+        return attrs
+
+class DishImportRowSerializer(serializers.Serializer):
+    """
+    One row of a bulk import (restaurants/dish_import.py). Food type,
+    categories and menus are given by name; the import resolves them for all
+    rows at once.
+    """
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, default="")
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    food_type = serializers.ChoiceField(choices=["Vegetarian", "Non-Vegetarian"])
+    categories = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    menus = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    is_available = serializers.BooleanField(required=False, default=True)
+    image_url = serializers.URLField(required=False, allow_blank=True)
+
+
+class DishBulkPatchSerializer(serializers.Serializer):
+    """
+    Which dishes (ids, and/or every dish in a category or menu) and what to change:
+    {"ids": [...], "is_available": false}
+    {"category": "<id>", "menu": "<id>", "price": "7.50"}
+    """
+    MAX_IDS = 500
+
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False)
+    category = serializers.UUIDField(required=False)
+    menu = serializers.UUIDField(required=False)
+    is_available = serializers.BooleanField(required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+    def validate_ids(self, ids):
+        if len(ids) > self.MAX_IDS:
+            raise serializers.ValidationError(f"At most {self.MAX_IDS} dishes per request.")
+        return ids
+
+    def validate(self, data):
+        if not {"ids", "category", "menu"} & data.keys():
+            raise serializers.ValidationError("Send ids, category or menu to pick the dishes.")
+        if not {"is_available", "price"} & data.keys():
+            raise serializers.ValidationError("Send is_available and/or price.")
+        return data
+
+
+# the restaurant page's full menu (restaurants/menu_snapshot.py); image_variants
+# stays in, the snapshot picks one URL per image size itself
+
+class MenuSnapshotCategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ["id", "name"]
+
+
+class MenuSnapshotDishSerializer(serializers.ModelSerializer):
+    food_type = FoodTypeSerializer(read_only=True)
+    categories = MenuSnapshotCategorySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Dish
+        fields = ["id", "name", "description", "price", "dish_image", "image_variants", "food_type", "categories"]
+
+
+class MenuSnapshotMenuSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Menu
+        fields = ["id", "name", "description", "menu_image", "image_variants"]
+
+
+class MenuSnapshotRestaurantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Restaurant
+        fields = ["id", "name", "description", "restaurant_image", "image_variants"]
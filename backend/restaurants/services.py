@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.functions import Now
+from . import catalog_cache
+from .models import Dish
+
+
+def patch_dishes(restaurant_id, changes, ids=None, category=None, menu=None):
+    """
+    Apply `changes` (is_available and/or price) to many of a restaurant's
+    dishes with one UPDATE. Dishes are picked by id and/or by category and
+    menu. Returns the ids that were updated. queryset.update() sends no
+    post_save, so the restaurant's cached catalogue is bumped here, once.
+    """
+    dishes = Dish.objects.filter(restaurant_id=restaurant_id)
+    if ids is not None:
+        dishes = dishes.filter(id__in=ids)
+    if category is not None:
+        dishes = dishes.filter(categories=category)
+    if menu is not None:
+        dishes = dishes.filter(menus=menu)
+
+    with transaction.atomic():
+        # locked, so the ids returned are exactly the rows the UPDATE changes (and the
+        # subquery keeps category/menu joins from repeating a dish)
+        locked = Dish.objects.filter(id__in=dishes.values("id")).select_for_update()
+        updated = list(locked.values_list("id", flat=True))
+        if updated:
+            Dish.objects.filter(id__in=updated).update(**changes, updated_at=Now())
+            catalog_cache.bump(restaurant_id)
+    return updated
@@ -0,0 +1,80 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from . import catalog_cache
+from .models import Category, Dish, FoodType, Menu, Restaurant
+from .search import ensure_sqlite_index, refresh_search_documents
+
+
+# Dish.save() rebuilds its own search document; these cover the text it borrows from related rows
+
+@receiver(m2m_changed, sender=Dish.categories.through)
+def dish_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            refresh_search_documents(Dish.objects.filter(pk=instance.pk))
+        return
+    # category.dishes.add/remove/clear(): pk_set holds dish ids, except for clear
+    if action == "pre_clear":
+        instance._cleared_dish_ids = list(instance.dishes.values_list("pk", flat=True))
+    elif action == "post_clear":
+        refresh_search_documents(Dish.objects.filter(pk__in=instance.__dict__.pop("_cleared_dish_ids", [])))
+    elif action in ("post_add", "post_remove"):
+        refresh_search_documents(Dish.objects.filter(pk__in=pk_set))
+
+
+def _renamed(instance, created, update_fields):
+    """Whether a save changed the name the dishes' search documents copy (not, e.g., an image-only save)."""
+    if created or (update_fields is not None and "name" not in update_fields):
+        return False
+    loaded, instance._loaded_name = getattr(instance, "_loaded_name", None), instance.name
+    return loaded is None or loaded != instance.name
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, update_fields, **kwargs):
+    if _renamed(instance, created, update_fields):
+        refresh_search_documents(instance.dishes.all())
+
+
+@receiver(post_save, sender=FoodType)
+def food_type_saved(sender, instance, created, update_fields, **kwargs):
+    if _renamed(instance, created, update_fields):
+        refresh_search_documents(Dish.objects.filter(food_type=instance))
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, created, update_fields, **kwargs):
+    if _renamed(instance, created, update_fields):
+        refresh_search_documents(instance.dishes.all())
+
+
+@receiver(post_migrate)
+def install_sqlite_search(sender, using, **kwargs):
+    if sender.name == "restaurants":
+        ensure_sqlite_index(connections[using])
+
+
+# any catalogue write invalidates the cached responses it shows up in (restaurants/catalog_cache.py)
+
+def _restaurant_id(instance):
+    if isinstance(instance, Restaurant):
+        return instance.pk
+    return getattr(instance, "restaurant_id", None)  # None: food types and global categories
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+@receiver([post_save, post_delete], sender=FoodType)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Dish)
+@receiver([post_save, post_delete], sender=Menu)
+def catalog_row_changed(sender, instance, **kwargs):
+    catalog_cache.bump(_restaurant_id(instance))
+
+
+@receiver(m2m_changed, sender=Dish.categories.through)
+@receiver(m2m_changed, sender=Dish.menus.through)
+def catalog_links_changed(sender, instance, action, **kwargs):
+    # instance is the dish, or the category/menu when changed from that side
+    if action in ("post_add", "post_remove", "post_clear"):
+        catalog_cache.bump(_restaurant_id(instance))
@@ -1,3 +1,428 @@
-from django.test import TestCase
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from . import catalog_cache, menu_snapshot
+from .dish_import import fetch_images
+from .menu_snapshot import build
+from .models import Category, Dish, FoodType, Menu, MenuSnapshot, Restaurant
 
 # Create your tests here.
+
+
+class DishSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.restaurant = Restaurant.objects.create(name="Mama Put")
+        food_type = FoodType.objects.create(name="Vegetarian")
+
+        def dish(name, description=""):
+            return Dish.objects.create(
+                restaurant=self.restaurant, name=name, description=description, price=Decimal("5.00"), food_type=food_type
+            )
+
+        self.jollof = dish("Jollof Rice", "smoky party rice")
+        self.fried = dish("Fried Rice", "with jollof-style pepper base")
+        self.soup = dish("Pepper Soup", "goat meat, very spicy")
+
+    def search(self, query):
+        return [d["name"] for d in self.client.get("/restaurants/dishes/", {"search": query}).data["results"]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("jollof"), ["Jollof Rice", "Fried Rice"])
+        self.assertEqual(self.search("rice party"), ["Jollof Rice"])
+        self.assertEqual(self.search("goa"), ["Pepper Soup"])  # prefix while typing
+
+    def test_typos_still_match(self):
+        self.assertEqual(self.search("peper soop")[0], "Pepper Soup")
+
+    def test_index_follows_saves_categories_and_restaurant_renames(self):
+        self.soup.name = "Catfish Pepper Soup"
+        self.soup.save()
+        self.assertEqual(self.search("catfish"), ["Catfish Pepper Soup"])
+
+        Category.objects.create(name="Breakfast").dishes.add(self.fried)
+        self.assertEqual(self.search("breakfast"), ["Fried Rice"])
+
+        self.restaurant.name = "Iya Basira"
+        self.restaurant.save()
+        self.assertEqual(len(self.search("basira")), 3)
+
+        self.jollof.delete()
+        self.assertEqual(self.search("smoky"), [])
+
+    def test_only_renames_rewrite_the_dishes_search_documents(self):
+        restaurant = Restaurant.objects.get(pk=self.restaurant.pk)
+        food_type = FoodType.objects.get(pk=self.soup.food_type_id)
+        with mock.patch("restaurants.signals.refresh_search_documents") as refresh:
+            restaurant.restaurant_image = "https://img/logo.jpg"
+            restaurant.save(update_fields=["restaurant_image"])
+            restaurant.description = "new"
+            restaurant.save()
+            food_type.save()
+            refresh.assert_not_called()
+            restaurant.name = "Iya Basira"
+            restaurant.save(update_fields=["name"])
+            food_type.name = "Non-Vegetarian"
+            food_type.save()
+            self.assertEqual(refresh.call_count, 2)
+            restaurant.save()  # renamed already
+            self.assertEqual(refresh.call_count, 2)
+
+    @override_settings(DISH_SEARCH_CANDIDATES=5)
+    def test_filters_apply_before_the_candidate_cut_off(self):
+        # the first five index hits are all someone else's
+        for i in range(10):
+            Dish.objects.create(restaurant=self.restaurant, name=f"Rice {i}", price=Decimal("5.00"), food_type=self.soup.food_type)
+        other = Restaurant.objects.create(name="Chicken Republic")
+        Dish.objects.create(restaurant=other, name="Rice special", price=Decimal("5.00"), food_type=self.soup.food_type)
+        for query in ("rice", "ricee"):  # index hits, then the typo fallback
+            response = self.client.get("/restaurants/dishes/", {"search": query, "restaurant": str(other.pk)})
+            self.assertEqual([d["name"] for d in response.data["results"]], ["Rice special"])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.owner = get_user_model().objects.create_user(email="owner@example.com", password="pass12345")
+        self.restaurant = Restaurant.objects.create(name="Mama Put", owner=self.owner)
+        self.other = Restaurant.objects.create(name="Chicken Republic")
+        self.food_type = FoodType.objects.create(name="Local")
+        self.dish = Dish.objects.create(
+            restaurant=self.restaurant, name="Jollof Rice", price=Decimal("5.00"), food_type=self.food_type
+        )
+        self.menu = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeat_reads_hit_and_query_order_does_not_matter(self):
+        first = self.get("/restaurants/dishes/", {"ordering": "name", "price_min": "1"})
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            second = self.get("/restaurants/dishes/", {"price_min": "1", "ordering": "name"})
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+
+    def test_misses_are_read_from_the_primary_in_replica_routed_views(self):
+        # an alias with no connection behind it: any read routed to the "replica" fails
+        with mock.patch("aptech_python.db_router.choose_replica", return_value="lagging-replica"):
+            self.assertEqual(self.get("/restaurants/dishes/")["X-Cache"], "MISS")
+            self.assertEqual(self.get(f"/restaurants/dishes/{self.dish.pk}/")["X-Cache"], "MISS")
+            self.assertEqual(self.get(f"/restaurants/{self.restaurant.pk}/restaurant_details/")["X-Cache"], "MISS")
+
+    def test_writes_invalidate_on_commit(self):
+        url = f"/restaurants/dishes/{self.dish.pk}/"
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.name = "Smoky Jollof"
+            self.dish.save()
+        response = self.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["name"], "Smoky Jollof")
+
+        by_restaurant = f"/restaurants/menus/by-restaurant/{self.restaurant.pk}/"
+        self.get(by_restaurant)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu.name = "Dinner"
+            self.menu.save()
+        self.assertEqual(self.get(by_restaurant).data["results"][0]["name"], "Dinner")
+
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.menus.add(self.menu)
+        self.assertEqual(self.get(url)["X-Cache"], "MISS")
+
+    def test_other_restaurants_stay_cached(self):
+        params = {"restaurant": str(self.other.pk)}
+        self.get("/restaurants/dishes/", params)
+        with self.captureOnCommitCallbacks(execute=True):
+            Dish.objects.create(
+                restaurant=self.restaurant, name="Fried Rice", price=Decimal("4.00"), food_type=self.food_type
+            )
+        self.assertEqual(self.get("/restaurants/dishes/", params)["X-Cache"], "HIT")
+        self.assertEqual(self.get("/restaurants/dishes/")["X-Cache"], "MISS")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodType.objects.create(name="Vegan")  # shows up in every restaurant's listings
+        self.assertEqual(self.get("/restaurants/dishes/", params)["X-Cache"], "MISS")
+
+    def test_detail_responses_are_cached_per_object(self):
+        other = Dish.objects.create(restaurant=self.other, name="Fried Rice", price=Decimal("4.00"), food_type=self.food_type)
+        self.get(f"/restaurants/dishes/{self.dish.pk}/")
+        self.assertEqual(self.get(f"/restaurants/dishes/{other.pk}/").data["name"], "Fried Rice")
+
+    def test_conditional_gets_skip_the_queryset(self):
+        for url, queries in [
+            ("/restaurants/dishes/", 0),
+            (f"/restaurants/dishes/{self.dish.pk}/", 1),  # finding the dish's restaurant
+            (f"/restaurants/menus/by-restaurant/{self.restaurant.pk}/", 0),
+            (f"/restaurants/{self.restaurant.pk}/restaurant_details/", 0),
+        ]:
+            first = self.get(url)
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response["ETag"], first["ETag"])
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304)
+
+        first = self.get("/restaurants/dishes/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.menus.add(self.menu)
+        self.assertEqual(self.client.get("/restaurants/dishes/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_owner_views_bypass_the_cache(self):
+        self.client.force_authenticate(self.owner)
+        response = self.get("/restaurants/dishes/", {"mine": "true"})
+        self.assertNotIn("X-Cache", response)
+
+
+class DishImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.owner = get_user_model().objects.create_user(email="owner@example.com", password="pass12345")
+        self.restaurant = Restaurant.objects.create(name="Mama Put", owner=self.owner)
+        self.client.force_authenticate(self.owner)
+        self.veg = FoodType.objects.create(name="Vegetarian")
+        FoodType.objects.create(name="Non-Vegetarian")
+        self.soup = Category.objects.create(name="Soup")
+        Category.objects.create(name="Rice", restaurant=Restaurant.objects.create(name="Elsewhere"))
+        self.lunch = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+        self.existing = Dish.objects.create(
+            restaurant=self.restaurant, name="Pepper Soup", price=Decimal("4.00"), food_type=self.veg, dish_image="https://img/old.jpg"
+        )
+        self.existing.menus.add(self.lunch)
+
+    def post(self, rows):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/restaurants/dishes/import/", rows, format="json")
+
+    def test_upserts_valid_rows_and_reports_the_rest(self):
+        response = self.post([
+            {"name": "Pepper Soup", "price": "6.50", "food_type": "Vegetarian", "categories": ["Soup"], "menus": []},
+            {"name": "Jollof Rice", "price": "5", "food_type": "Non-Vegetarian", "menus": ["Lunch"], "description": "smoky"},
+            {"name": "Fried Rice", "price": "-1", "food_type": "Vegetarian"},
+            {"name": "Ofada", "price": "3", "food_type": "Vegetarian", "categories": ["Rice"]},  # another restaurant's
+            {"name": "Jollof Rice", "price": "5", "food_type": "Vegetarian"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual([error["row"] for error in response.data["errors"]], [3, 4, 5])
+        self.assertIn("price", response.data["errors"][0]["errors"])
+        self.assertIn("categories", response.data["errors"][1]["errors"])
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price, Decimal("6.50"))
+        self.assertEqual(self.existing.dish_image, "https://img/old.jpg")
+        self.assertEqual(list(self.existing.categories.all()), [self.soup])
+        self.assertFalse(self.existing.menus.exists())
+        jollof = Dish.objects.get(restaurant=self.restaurant, name="Jollof Rice")
+        self.assertEqual(list(jollof.menus.all()), [self.lunch])
+        self.assertIn("Mama Put", jollof.search_document)
+        self.assertEqual(response.data["dishes"][1], {"row": 2, "id": jollof.id, "name": "Jollof Rice"})
+        self.assertEqual(self.client.get("/restaurants/dishes/", {"search": "smoky"}).data["results"][0]["name"], "Jollof Rice")
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries(count, start):
+            rows = [
+                {"name": f"Dish {i}", "price": "2.00", "food_type": "Vegetarian", "categories": ["Soup"], "menus": ["Lunch"]}
+                for i in range(start, start + count)
+            ]
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.post(rows).data["created"], count)
+            return len(captured)
+        # a few more INSERT batches at most, where the database caps parameters per query (SQLite)
+        self.assertLessEqual(queries(300, 100), queries(3, 0) + 5)
+
+    def test_csv_upload_and_deferred_images(self):
+        csv = (
+            "name,price,food_type,categories,menus,is_available,image_url\n"
+            "Moi Moi,2.50,Vegetarian,Soup,Lunch,false,https://example.com/moimoi.jpg\n"
+            "Akara,1.00,Vegetarian,,,,\n"
+        )
+        upload = SimpleUploadedFile("menu.csv", csv.encode(), content_type="text/csv")
+        with mock.patch("restaurants.views.fetch_images_later") as later:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/restaurants/dishes/import/", {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.data)
+        moi_moi = Dish.objects.get(name="Moi Moi")
+        self.assertFalse(moi_moi.is_available)
+        self.assertEqual(moi_moi.dish_image, "")  # not fetched during the request
+        self.assertTrue(Dish.objects.get(name="Akara").is_available)
+
+        restaurant_id, images = later.call_args.args
+        self.assertEqual(images, [(moi_moi.id, "https://example.com/moimoi.jpg")])
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as source:
+            Image.new("RGB", (800, 600), "green").save(source, "JPEG")  # stands in for the download; removed after
+        with mock.patch("restaurants.dish_import.stash_url", return_value=source.name), \
+                mock.patch("cloudinary.uploader.upload", return_value={"secure_url": "https://cdn/moimoi.jpg"}) as upload, \
+                override_settings(IMAGE_VARIANT_PROCESSES=0):
+            self.assertEqual(fetch_images(restaurant_id, images), 1)
+        moi_moi.refresh_from_db()
+        self.assertEqual(moi_moi.dish_image, "https://cdn/moimoi.jpg")
+        self.assertEqual(upload.call_count, 4)  # the image and its thumb, card and full variants
+        self.assertTrue(moi_moi.image_variants.endswith("_{size}.webp"))
+
+    def test_rejects_imports_that_have_nothing_valid(self):
+        self.assertEqual(self.post([{"name": "No price"}]).status_code, 400)
+        self.assertEqual(self.post({"dishes": "nope"}).status_code, 400)
+        self.client.force_authenticate(get_user_model().objects.create_user(email="c@example.com", password="pass12345"))
+        self.assertEqual(self.post([]).status_code, 403)
+
+
+class DishBulkPatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.owner = get_user_model().objects.create_user(email="owner@example.com", password="pass12345")
+        self.restaurant = Restaurant.objects.create(name="Mama Put", owner=self.owner)
+        self.client.force_authenticate(self.owner)
+        food_type = FoodType.objects.create(name="Vegetarian")
+        self.soup = Category.objects.create(name="Soup", restaurant=self.restaurant)
+        self.lunch = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+        self.dishes = [
+            Dish.objects.create(restaurant=self.restaurant, name=f"Dish {i}", price=Decimal("5.00"), food_type=food_type)
+            for i in range(4)
+        ]
+        for dish in self.dishes[:2]:
+            dish.categories.add(self.soup, Category.objects.create(name=f"Other {dish.name}"))
+        self.dishes[1].menus.add(self.lunch)
+        self.elsewhere = Dish.objects.create(
+            restaurant=Restaurant.objects.create(name="Elsewhere"), name="Theirs", price=Decimal("5.00"), food_type=food_type
+        )
+
+    def patch(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch("/restaurants/dishes/bulk/", body, format="json")
+
+    def test_ids_are_scoped_to_the_owners_restaurant(self):
+        ids = [str(self.dishes[0].pk), str(self.dishes[3].pk), str(self.elsewhere.pk)]
+        with mock.patch.object(catalog_cache, "_bump", wraps=catalog_cache._bump) as bumped:
+            response = self.patch({"ids": ids, "is_available": False})
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual(response.data["updated"], [self.dishes[0].pk, self.dishes[3].pk])
+        self.assertEqual(response.data["not_found"], [self.elsewhere.pk])
+        self.assertEqual(bumped.call_count, 1)
+        self.assertEqual(
+            set(Dish.objects.filter(is_available=False).values_list("pk", flat=True)), {self.dishes[0].pk, self.dishes[3].pk}
+        )
+
+    def test_category_and_menu_filters_use_one_update(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.patch({"category": str(self.soup.pk), "price": "7.50"})
+        self.assertCountEqual(response.data["updated"], [self.dishes[0].pk, self.dishes[1].pk])
+        self.assertEqual(sum(query["sql"].startswith("UPDATE") for query in captured), 1)
+        self.assertEqual(
+            sorted(Dish.objects.filter(restaurant=self.restaurant).values_list("price", flat=True)),
+            [Decimal("5.00"), Decimal("5.00"), Decimal("7.50"), Decimal("7.50")],
+        )
+        response = self.patch({"category": str(self.soup.pk), "menu": str(self.lunch.pk), "is_available": False})
+        self.assertEqual(response.data["updated"], [self.dishes[1].pk])
+
+    def test_needs_a_selection_and_a_change(self):
+        self.assertEqual(self.patch({"is_available": False}).status_code, 400)
+        self.assertEqual(self.patch({"ids": [str(self.dishes[0].pk)]}).status_code, 400)
+
+
+class MenuSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        settings = override_settings(MENU_SNAPSHOT_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.restaurant = Restaurant.objects.create(name="Mama Put", image_variants="/media/r_{size}.webp")
+        self.food_type = FoodType.objects.create(name="Vegetarian")
+        self.soup = Category.objects.create(name="Soup")
+        self.lunch = Menu.objects.create(restaurant=self.restaurant, name="Lunch")
+
+        def dish(name, **kwargs):
+            return Dish.objects.create(
+                restaurant=self.restaurant, name=name, price=Decimal("5.00"), food_type=self.food_type, **kwargs
+            )
+        self.egusi = dish("Egusi", dish_image="/media/e.png", image_variants="/media/e_{size}.webp")
+        self.egusi.categories.add(self.soup)
+        self.egusi.menus.add(self.lunch)
+        self.puff = dish("Puff Puff")
+        dish("Sold out", is_available=False)
+        self.url = f"/restaurants/{self.restaurant.pk}/full-menu/"
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_read_builds_the_snapshot_then_reads_are_one_query(self):
+        menu = self.get()
+        self.assertEqual(menu["restaurant"]["name"], "Mama Put")
+        [lunch] = menu["menus"]
+        self.assertEqual([dish["name"] for dish in lunch["dishes"]], ["Egusi"])
+        self.assertEqual(lunch["dishes"][0]["food_type"], {"id": str(self.food_type.pk), "name": "Vegetarian"})
+        self.assertEqual(lunch["dishes"][0]["categories"], [{"id": str(self.soup.pk), "name": "Soup"}])
+        self.assertEqual(lunch["dishes"][0]["dish_image"], "/media/e.png")
+        self.assertNotIn("image_variants", lunch["dishes"][0])
+        self.assertEqual([dish["name"] for dish in menu["other_dishes"]], ["Puff Puff"])  # in no menu; "Sold out" isn't shown
+        with self.assertNumQueries(1):
+            self.get()
+
+    def test_image_sizes(self):
+        menu = self.get(image_size="thumb")
+        self.assertEqual(menu["menus"][0]["dishes"][0]["dish_image"], "/media/e_thumb.webp")
+        self.assertEqual(menu["restaurant"]["restaurant_image"], "/media/r_thumb.webp")
+        self.assertEqual(self.get(image_size="huge")["menus"][0]["dishes"][0]["dish_image"], "/media/e.png")
+
+    def test_catalogue_writes_rebuild_it_after_commit(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.puff.menus.add(self.lunch)
+        self.assertEqual([dish["name"] for dish in self.get()["menus"][0]["dishes"]], ["Egusi", "Puff Puff"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food_type.name = "Veg"
+            self.food_type.save()  # shared by every restaurant
+        self.assertEqual(self.get()["menus"][0]["dishes"][0]["food_type"]["name"], "Veg")
+
+    def test_a_write_committed_during_the_first_build_is_not_lost(self):
+        serializer = menu_snapshot.MenuSnapshotRestaurantSerializer
+        writes = []
+
+        def write_then_serialize(*args, **kwargs):
+            # the dishes have been read; a write commits before the snapshot is stored
+            if not writes:
+                writes.append(True)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.puff.menus.add(self.lunch)
+            return serializer(*args, **kwargs)
+
+        with mock.patch.object(menu_snapshot, "MenuSnapshotRestaurantSerializer", side_effect=write_then_serialize):
+            menu = self.get()
+        self.assertEqual([dish["name"] for dish in menu["menus"][0]["dishes"]], ["Egusi", "Puff Puff"])
+        self.assertEqual(menu["other_dishes"], [])
+
+    def test_restaurants_nobody_reads_get_no_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.puff.menus.add(self.lunch)
+        self.assertFalse(MenuSnapshot.objects.exists())
+
+    def test_an_older_rebuild_does_not_replace_a_newer_snapshot(self):
+        built_at = self.get()["built_at"]
+        with mock.patch("restaurants.menu_snapshot.timezone.now", return_value=MenuSnapshot.objects.first().built_at):
+            self.assertEqual(build(self.restaurant.pk), 0)
+        self.assertEqual(self.get()["built_at"], built_at)
+
+    def test_conditional_gets_and_unknown_restaurants(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(f"/restaurants/{self.food_type.pk}/full-menu/").status_code, 404)
+
@@ -47,6 +47,8 @@ urlpatterns = [
     path('menus/by-restaurant/<uuid:restaurant_id>/', by_restaurant, name='menus-by-restaurant'),
     path('all-restaurants/', views.RestaurantMixin.as_view()),
     path('<uuid:pk>/restaurant_details/', views.RestaurantMixin.as_view()),
+    path('<uuid:pk>/full-menu/', views.FullMenuView.as_view(), name='restaurant-full-menu'),
     path('food_type/', views.FoodTypeView.as_view()),
+    path('cache-stats/', views.CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
     path('<uuid:pk>/food_type/', views.FoodTypeView.as_view()),
 ]
\ No newline at end of file
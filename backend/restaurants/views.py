@@ -1,15 +1,23 @@
+import uuid
 from rest_framework import viewsets, mixins, generics, permissions, status
 from rest_framework.exceptions import PermissionDenied
 from accounts.permissions import IsRestaurantOwner
 from .permissions import IsSuperUser, IsOwnerOrReadOnly, IsOwnerOfRestaurant
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
 from .filters import DishFilter
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from django.http import Http404, HttpResponse
+from api.conditional import make_etag, respond_conditionally
+from api.mixins import CompiledListMixin, ReplicaReadMixin
 from .models import Dish, Restaurant, FoodType, Category, Menu
+from .catalog_cache import cached_response, catalog_cache_stats
+from .menu_snapshot import get_snapshot
+from .dish_import import fetch_images_later, import_dishes, parse_rows
 from django.shortcuts import get_object_or_404
-from .serializers import DishSerializer, RestaurantSerializer, FoodTypeSerializer, CategorySerializer, MenuSerializer
+from .serializers import DishSerializer, RestaurantSerializer, FoodTypeSerializer, CategorySerializer, MenuSerializer, DishBulkPatchSerializer
+from .services import patch_dishes
 
 
 class RestaurantView(generics.ListAPIView, generics.RetrieveUpdateDestroyAPIView):
@@ -19,10 +27,35 @@ class RestaurantView(generics.ListAPIView, generics.RetrieveUpdateDestroyAPIView
     # lookup_field = "id"
     
 
+def _restaurant_param(view, request, **kwargs):
+    """?restaurant=<uuid> narrows a dish listing to one restaurant's cache versions."""
+    try:
+        return uuid.UUID(request.query_params.get("restaurant", ""))
+    except ValueError:
+        return None
+
+
+def _dish_restaurant(view, request, pk=None):
+    # one indexed lookup, so a dish's ETag only changes with its own restaurant
+    try:
+        return Dish.objects.filter(pk=uuid.UUID(str(pk))).values_list("restaurant_id", flat=True).first()
+    except ValueError:
+        return None
+
+
+def _owner_view(view, request):
+    # ?mine=true shows an owner their unavailable dishes too, so it can't come from the shared cache
+    return "mine" in request.query_params
+
+
 class FoodTypeViewSet(viewsets.ModelViewSet):
     queryset = FoodType.objects.all().order_by("id")
     serializer_class = FoodTypeSerializer
 
+    @cached_response("foodtypes.list")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
             return [AllowAny()]
@@ -32,6 +65,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.select_related("restaurant").all()
     serializer_class = CategorySerializer
 
+    @cached_response("categories.list")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
             return [AllowAny()]
@@ -53,8 +90,9 @@ class CategoryViewSet(viewsets.ModelViewSet):
             serializer.save(restaurant=user.restaurant)
 
 
-class MenuViewSet(viewsets.ModelViewSet):
+class MenuViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = MenuSerializer
+    replica_actions = {"public_menus", "by_restaurant"}
 
     def get_queryset(self):
         qs = Menu.objects.select_related("restaurant")
@@ -70,22 +108,24 @@ class MenuViewSet(viewsets.ModelViewSet):
     
     # --- Extra endpoint: view all menus (public listing) ---
     @action(detail=False, methods=["get"], url_path="public")
+    @cached_response("menus.public")
     def public_menus(self, request):
         """Return all menus (public endpoint for customers)."""
         qs = Menu.objects.select_related("restaurant").all()
-        serializer = self.get_serializer(qs, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(qs)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
     
     # --- Extra endpoint: view menus by restaurant ---
     @action(detail=False, methods=["get"], url_path="by-restaurant/(?P<restaurant_id>[^/.]+)")
+    @cached_response("menus.by_restaurant", scope=lambda view, request, restaurant_id: restaurant_id)
     def by_restaurant(self, request, restaurant_id=None):
         """Return menus belonging to a specific restaurant."""
         qs = Menu.objects.filter(restaurant_id=restaurant_id).select_related("restaurant")
-        serializer = self.get_serializer(qs, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(qs)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
-class DishViewSet(viewsets.ModelViewSet):
+class DishViewSet(ReplicaReadMixin, CompiledListMixin, viewsets.ModelViewSet):
     """
     - Public: list & retrieve => only is_available=True
     - Owners: create/update/delete only on their restaurant's dishes
@@ -94,6 +134,7 @@ class DishViewSet(viewsets.ModelViewSet):
     serializer_class = DishSerializer
     filterset_class = DishFilter
     ordering_fields = ["price", "created_at", "name"]
+    replica_actions = {"list", "retrieve"}
 
     def get_queryset(self):
         # Public listing / retrieve: available dishes
@@ -115,6 +156,14 @@ class DishViewSet(viewsets.ModelViewSet):
             return [permissions.AllowAny()]
         return [permissions.IsAuthenticated(), IsOwnerOrReadOnly()]
 
+    @cached_response("dishes.list", scope=_restaurant_param, unless=_owner_view)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response("dishes.retrieve", scope=_dish_restaurant, unless=_owner_view)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         user = self.request.user
         if not hasattr(user, "restaurant"):
@@ -140,15 +189,49 @@ class DishViewSet(viewsets.ModelViewSet):
         """GET /dishes/mine/  — returns all dishes (including unavailable) for the requesting owner."""
         user = request.user
         if not hasattr(user, "restaurant"):
-            return Response([], status=status.HTTP_200_OK)
+            return Response({"next": None, "results": []}, status=status.HTTP_200_OK)
 
-        qs = Dish.objects.filter(restaurant=user.restaurant).select_related("food_type").prefetch_related("categories", "menus")
-        page = self.paginate_queryset(qs)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(qs, many=True)
-        return Response(serializer.data)
+        return self.compiled_page(Dish.objects.filter(restaurant=user.restaurant))
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[JSONParser, MultiPartParser],
+            permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
+    def import_dishes(self, request):
+        """
+        POST /dishes/import/  — create or update many dishes at once (restaurants/dish_import.py).
+        Body: a JSON list of dishes (or {"dishes": [...]}), or a CSV/JSON upload in `file`.
+        Returns per-row results and errors; images given as image_url are fetched afterwards.
+        """
+        upload = request.FILES.get("file")
+        try:
+            if upload:
+                rows = parse_rows(upload.read(), "json" if upload.name.lower().endswith(".json") else "csv")
+            else:
+                rows = request.data.get("dishes") if isinstance(request.data, dict) else request.data
+            report, images = import_dishes(request.user.restaurant, rows)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        fetch_images_later(request.user.restaurant.id, images)
+        failed = report["errors"] and not report["dishes"]
+        return Response(report, status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_200_OK)
+
+    @action(detail=False, methods=["patch"], url_path="bulk", serializer_class=DishBulkPatchSerializer,
+            permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
+    def bulk_patch(self, request):
+        """
+        PATCH /dishes/bulk/  — availability and/or price for many dishes in one UPDATE.
+        Body: {"ids": [...], "is_available": false} or {"category": "<id>", "price": "7.50"} (see DishBulkPatchSerializer)
+        Returns the ids updated, and the requested ids that aren't yours or don't match.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        changes = {field: data[field] for field in ("is_available", "price") if field in data}
+        updated = patch_dishes(
+            request.user.restaurant.id, changes, ids=data.get("ids"), category=data.get("category"), menu=data.get("menu")
+        )
+        found = set(updated)
+        not_found = [pk for pk in data.get("ids", []) if pk not in found]
+        return Response({"updated": updated, "not_found": not_found}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["post"], url_path="add-to-menu", permission_classes=[permissions.IsAuthenticated, IsOwnerOrReadOnly])
     def add_to_menu(self, request, pk=None):
@@ -194,7 +277,7 @@ class DishViewSet(viewsets.ModelViewSet):
             return Response({"detail": "is_available is required (true/false)."}, status=status.HTTP_400_BAD_REQUEST)
 
         dish.is_available = bool(is_available)
-        dish.save()
+        dish.save(update_fields=["is_available"])
 
         return Response({
             "id": dish.id,
@@ -203,18 +286,41 @@ class DishViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_200_OK)
 
 
-class RestaurantPagination(PageNumberPagination):
-    page_size = 5  # number of restaurants per page
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+class FullMenuView(generics.GenericAPIView):
+    """
+    GET /restaurants/<id>/full-menu/[?image_size=thumb]: the restaurant page in
+    one response (menus -> dishes -> categories/food type), served as stored
+    in its snapshot (restaurants/menu_snapshot.py).
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        size = request.query_params.get("image_size", "")
+        found = get_snapshot(pk, size)
+        if found is None:
+            raise Http404
+        data, built_at = found
+        return respond_conditionally(
+            request, make_etag("full-menu", str(pk), size, built_at.isoformat()), built_at.timestamp(),
+            lambda: HttpResponse(data, content_type="application/json"),
+        )
+
+
+class CatalogCacheStatsView(generics.GenericAPIView):
+    """Hit/miss counts for the cached catalogue endpoints (restaurants/catalog_cache.py)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(catalog_cache_stats())
+
 
-class RestaurantMixin(mixins.ListModelMixin, mixins.RetrieveModelMixin, generics.GenericAPIView):
+class RestaurantMixin(ReplicaReadMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, generics.GenericAPIView):
     queryset = Restaurant.objects.all().order_by("id")
     serializer_class = RestaurantSerializer;
     lookup_field = 'pk';
-    pagination_class = RestaurantPagination
     
     
+    @cached_response("restaurants", scope=lambda view, request, pk=None: pk)
     def get(self, request, *args, **kwargs):
         pk = kwargs.get('pk');
         if pk is not None: